@@ -0,0 +1,60 @@
+"""
+Benchmark of dags/batch_extract.py: the tables of the specs (table_specs.json)
+extracted from a folder of workbooks (copies of the synthetic
+vendas-combustiveis-m3.xlsx) for an increasing number of processes.
+
+Usage:
+    python benchmarks/bench_batch_extract.py --scale 1 --files 8 --workers 1 2 4
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+from batch_extract import extract_batch
+from synthetic import generate_inputs
+
+PIVOT_FILE = 'vendas-combustiveis-m3.xlsx'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help='size multiplier of the synthetic datasets')
+    parser.add_argument('--files', type=int, default=8, help='number of workbooks')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()], help='number of processes')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    try:
+        source = os.path.join(work, 'source') + '/'
+        generate_inputs(source, args.scale)
+        folder = os.path.join(work, 'workbooks')
+        os.makedirs(folder)
+        for number in range(args.files):
+            shutil.copyfile(source + PIVOT_FILE, os.path.join(folder, f'release_{number:03d}.xlsx'))
+        megabytes = os.path.getsize(source + PIVOT_FILE) * args.files / 2 ** 20
+
+        print(f'cores={os.cpu_count()} scale={args.scale} files={args.files} size={megabytes:.1f}MB')
+        for workers in sorted(set(args.workers)):
+            output = os.path.join(work, f'consolidated_{workers}.csv')
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                metrics = extract_batch(folder, output, workers=workers)
+            elapsed = time.perf_counter() - start
+            files = metrics[metrics['level'] == 'file']
+            rows = files['rows'].sum()
+            failed = (metrics['status'] != 'ok').sum()
+            print(f'workers={workers} {elapsed:.2f}s {args.files / elapsed:.2f} files/s {megabytes / elapsed:.2f} MB/s '
+                  f'{rows / elapsed:,.0f} rows/s rows={rows} not_ok={failed}')
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
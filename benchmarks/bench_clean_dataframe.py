@@ -0,0 +1,84 @@
+"""
+Benchmark of dags/functions.py::clean_dataframe against the previous row-wise implementation.
+
+Usage:
+    python benchmarks/bench_clean_dataframe.py --scale 10
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+from functions import clean_dataframe, formated_year_month
+from synthetic import generate_datasets, RAW_FOLDER
+
+
+def clean_dataframe_rowwise(path, start_period):
+    """
+    Previous implementation of clean_dataframe (row-wise apply/applymap), kept as reference.
+    """
+    df = pd.read_csv(path, index_col=None, delimiter=';')
+    df.columns = ['year', 'month', 'region', 'uf', 'product', 'volume']
+    df = df.sort_values(by=['year', 'month', 'uf', 'product'])
+    df = df.where(df['year'] >= int(start_period))
+    df = df.dropna(how='all')
+    df = df.fillna(np.nan).replace([np.nan], [None])
+    df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    df['year_month'] = df.apply(lambda x: formated_year_month(int(x['year']), x['month']), axis=1)
+    df['unit'] = 'm3'
+    df['volume'] = df['volume'].str.replace(',', '.').apply(lambda x: float(x))
+    df['created_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %X')
+    df = df.drop(columns=['year', 'month', 'region'])
+    df = df[['year_month', 'uf', 'product', 'unit', 'volume', 'created_at']]
+    df = df.sort_values(by=['year_month', 'uf', 'product'])
+    df.to_csv(path, sep=';', index=False)
+    return df
+
+
+def without_created_at(path):
+    # created_at is the processing time, the other fields must be byte-identical
+    with open(path, 'rb') as fp:
+        return [line.rsplit(b';', 1)[0] for line in fp]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    try:
+        rows = generate_datasets(os.path.join(work, 'source'), args.scale)
+        for file_name, start_period in (('dataset_derivative', 2000), ('dataset_diesel', 2013)):
+            source = os.path.join(work, 'source', RAW_FOLDER, file_name + '.csv')
+            timings = {}
+            for name in ('rowwise', 'vectorized'):
+                folder = os.path.join(work, name) + '/'
+                os.makedirs(folder + RAW_FOLDER, exist_ok=True)
+                # The row-wise reference cleans the dataset in place, clean_dataframe reads it from the raw folder
+                shutil.copy(source, folder + (file_name if name == 'rowwise' else f'{RAW_FOLDER}/{file_name}') + '.csv')
+                start = time.perf_counter()
+                if name == 'rowwise':
+                    clean_dataframe_rowwise(folder + file_name + '.csv', start_period)
+                else:
+                    clean_dataframe(file_name, start_period, path=folder)
+                timings[name] = time.perf_counter() - start
+
+            identical = without_created_at(os.path.join(work, 'rowwise', file_name + '.csv')) == \
+                without_created_at(os.path.join(work, 'vectorized', file_name + '.csv'))
+            print(f"{file_name}: rows={rows[file_name]} rowwise={timings['rowwise']:.2f}s "
+                  f"vectorized={timings['vectorized']:.2f}s speedup={timings['rowwise'] / timings['vectorized']:.1f}x "
+                  f"identical={identical}")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark of dags/functions.py::clean_datasets_parallel against the sequential
+clean_dataframe of both datasets, for an increasing number of processes.
+
+Usage:
+    python benchmarks/bench_clean_parallel.py --scale 10 --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+from functions import clean_dataframe, clean_datasets_parallel
+from synthetic import generate_datasets
+
+DATASETS = [('dataset_derivative', 2000), ('dataset_diesel', 2013)]
+
+
+def without_created_at(path):
+    # created_at is the processing time, the other fields must be byte-identical
+    with open(path, 'rb') as fp:
+        return [line.rsplit(b';', 1)[0] for line in fp]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()], help='number of processes')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    try:
+        source = os.path.join(work, 'source')
+        generate_datasets(source, args.scale)
+
+        def prepare(name):
+            folder = os.path.join(work, name) + '/'
+            shutil.rmtree(folder, ignore_errors=True)
+            shutil.copytree(source, folder)
+            return folder
+
+        folder = prepare('sequential')
+        start = time.perf_counter()
+        for file_name, start_period in DATASETS:
+            clean_dataframe(file_name, start_period, path=folder)
+        sequential = time.perf_counter() - start
+        expected = {file_name: without_created_at(folder + file_name + '.csv') for file_name, _ in DATASETS}
+
+        print(f'cores={os.cpu_count()} scale={args.scale} sequential={sequential:.2f}s')
+        for workers in sorted(set(args.workers)):
+            folder = prepare(f'parallel_{workers}')
+            start = time.perf_counter()
+            clean_datasets_parallel(DATASETS, path=folder, workers=workers)
+            elapsed = time.perf_counter() - start
+            identical = all(without_created_at(folder + file_name + '.csv') == expected[file_name] for file_name, _ in DATASETS)
+            print(f'workers={workers} parallel={elapsed:.2f}s speedup={sequential / elapsed:.2f}x identical={identical}')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
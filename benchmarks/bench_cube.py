@@ -0,0 +1,91 @@
+"""
+Benchmark of the range aggregates (products x ufs x months) of the cleaned
+datasets: filter and sum of the arrow file (read_handoff) against the lookups
+of the volume cube (load_cube). The results of both are compared.
+
+Usage:
+    python benchmarks/bench_cube.py --scale 10 --queries 500
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+DATASETS = ['derivative', 'diesel']
+
+
+def random_queries(cube, count, seed=0):
+    # Products, ufs (None for all) and range of months of each query
+    rng = np.random.default_rng(seed)
+    first = pd.Timestamp(cube.metadata['first_month'])
+    queries = []
+    for _ in range(count):
+        products = list(rng.choice(cube.products, rng.integers(1, len(cube.products) + 1), replace=False)) if rng.random() < 0.8 else None
+        ufs = list(rng.choice(cube.ufs, rng.integers(1, len(cube.ufs) + 1), replace=False)) if rng.random() < 0.8 else None
+        start, end = sorted(rng.integers(0, cube.months, 2))
+        queries.append((products, ufs, first + pd.DateOffset(months=int(start)), first + pd.DateOffset(months=int(end))))
+    return queries
+
+
+def query_frame(df, products, ufs, start, end):
+    mask = (df['year_month'] >= start) & (df['year_month'] <= end)
+    if products is not None:
+        mask &= df['product'].isin(products)
+    if ufs is not None:
+        mask &= df['uf'].isin(ufs)
+    return df.loc[mask, 'volume'].sum(), int(mask.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    parser.add_argument('--queries', type=int, default=500, help='random queries of each dataset')
+    args = parser.parse_args()
+
+    from functions import clean_dataframe
+    from columnar import read_handoff
+    from cube import write_cube, load_cube, cube_files
+    from synthetic import generate_datasets
+
+    work = tempfile.mkdtemp() + '/'
+    try:
+        generate_datasets(work, args.scale)
+        clean_dataframe('dataset_derivative', 2000, path=work)
+        clean_dataframe('dataset_diesel', 2013, path=work)
+        for dataset in DATASETS:
+            start = time.perf_counter()
+            write_cube(work, dataset)
+            build = time.perf_counter() - start
+            size = os.path.getsize(cube_files(work, dataset)[0]) / 2 ** 20
+
+            df = read_handoff(work, dataset, ['year_month', 'uf', 'product', 'volume'])
+            cube = load_cube(work, dataset)
+            queries = random_queries(cube, args.queries)
+
+            start = time.perf_counter()
+            expected = [query_frame(df, *query) for query in queries]
+            seconds_frame = time.perf_counter() - start
+            start = time.perf_counter()
+            results = [cube.query(*query) for query in queries]
+            seconds_cube = time.perf_counter() - start
+
+            errors = sum(
+                rows != rows_frame or not np.isclose(volume, volume_frame, rtol=1e-9, atol=1e-3)
+                for (volume, rows), (volume_frame, rows_frame) in zip(results, expected)
+            )
+            print(f'{dataset}: rows={len(df)} cube={size:.1f}MB build={build:.2f}s')
+            print(f'  pandas: {seconds_frame / len(queries) * 1000:.3f}ms/query')
+            print(f'  cube:   {seconds_cube / len(queries) * 1000:.3f}ms/query ({seconds_frame / seconds_cube:.0f}x) mismatches={errors}')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of the dynamic task mapping of the raizen_test DAG: the local tasks
+run on synthetic inputs once as the chain of whole-dataset stages
+(clean_file, check_results, generation_file) and once as the mapped tasks of
+each dataset (clean_dataset, check_dataset, generation_sheet) with the final
+assemble_file. The tasks run one after the other and the critical path of
+each graph is computed from their times, the duration of the DAG with a free
+slot of the executor for each mapped task.
+
+Usage:
+    python benchmarks/bench_dag_fanout.py --scale 10
+"""
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+# Datasets of the mapped tasks
+DATASETS = ['derivative', 'diesel']
+
+
+
+def run_task(task):
+    # Wall time of a task, from its METRICS line
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        task()
+    for line in output.getvalue().splitlines():
+        if line.startswith('METRICS '):
+            return json.loads(line[len('METRICS '):])['wall_s']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    args = parser.parse_args()
+
+    os.environ['RAIZEN_STAGE_CACHE'] = '0'
+    os.environ.setdefault('RAIZEN_CLEAN_MODE', 'memory')
+    from synthetic import generate_inputs
+    from functions import (_extract_pivot_cache, _clean_file, _check_results, _generation_file,
+                           _clean_dataset, _check_dataset, _generation_sheet, _assemble_file)
+
+    work = tempfile.mkdtemp()
+    inputs = os.path.join(work, 'inputs') + '/'
+    path = os.path.join(work, 'dados') + '/'
+    try:
+        generate_inputs(inputs, args.scale)
+        shutil.copytree(inputs, path)
+        extract = run_task(lambda: _extract_pivot_cache(path=path))
+
+        chain = {
+            'clean_file': run_task(lambda: _clean_file(path)),
+            'check_results': run_task(lambda: _check_results(path)),
+            'generation_file': run_task(lambda: _generation_file(path)),
+        }
+        mapped = {}
+        for task, function in (('clean_dataset', _clean_dataset), ('check_dataset', _check_dataset), ('generation_sheet', _generation_sheet)):
+            for dataset in DATASETS:
+                mapped[task, dataset] = run_task(lambda: function(dataset, path))
+        assemble = run_task(lambda: _assemble_file(path))
+
+        print(f'{"extract_pivot_cache":<32} {extract:7.2f}s')
+        for task, seconds in chain.items():
+            print(f'{task:<32} {seconds:7.2f}s')
+        for (task, dataset), seconds in mapped.items():
+            print(f'{task + "[" + dataset + "]":<32} {seconds:7.2f}s')
+        print(f'{"assemble_file":<32} {assemble:7.2f}s')
+
+        # The pivot cache is extracted while the datasets are downloaded and cleaned
+        chain_path = max(chain['clean_file'], extract) + chain['check_results'] + chain['generation_file']
+        mapped_path = max(
+            max(max(mapped['clean_dataset', dataset], extract) + mapped['check_dataset', dataset],
+                mapped['clean_dataset', dataset] + mapped['generation_sheet', dataset])
+            for dataset in DATASETS
+        ) + assemble
+        print(f'critical path: chain {chain_path:.2f}s, mapped {mapped_path:.2f}s ({mapped_path / chain_path:.0%})')
+        print(f'work: chain {sum(chain.values()):.2f}s, mapped {sum(mapped.values()) + assemble:.2f}s')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark of the parse of the DAG: time and memory of the imports of the DAG
+file, measured each in a new process like the parses of the scheduler.
+
+    tasks       import of tasks.py, the callables imported by raizen_test.py
+    functions   import of functions.py, the cost paid by each parse before the
+                callables were split from the DAG (reference, not guarded)
+    dagbag      DagBag of the dags folder (with .airflowignore), after the
+                imports of airflow, only when airflow is installed
+
+A parse that imports a heavy library (HEAVY_MODULES) or is slower or larger
+than its baseline (baselines.json, key dag_parse) beyond the tolerance is
+flagged and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_dag_parse.py
+    python benchmarks/bench_dag_parse.py --repeat 5 --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+DAGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags')
+
+# Baselines, the parse measures are stored under the key dag_parse
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Modules that must not be imported to parse the DAG
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'pyarrow', 'psycopg2', 'functions']
+
+# Measures and whether they are guarded
+MEASURES = {'tasks': True, 'functions': False, 'dagbag': True}
+
+# Differences below these values are noise, never flagged
+MIN_SECONDS = 0.05
+MIN_RSS_MB = 8
+
+
+def rss():
+    # VmRSS of this process in MB
+    with open('/proc/self/status') as fp:
+        for line in fp:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def measure(name):
+    """
+    Run a measure in this process (a new one for each run).
+
+    Returns
+    -------
+    result : dict
+        seconds, rss_mb (increase of the RSS), heavy (heavy modules imported)
+        and, for dagbag, the number of dags and of import errors. None when
+        airflow is not installed (dagbag).
+    """
+    sys.path.insert(0, DAGS)
+    result = {}
+    if name == 'dagbag':
+        try:
+            from airflow.models import DagBag
+            from airflow.operators.python import PythonOperator  # noqa: F401
+            from airflow.operators.dummy_operator import DummyOperator  # noqa: F401
+        except ImportError:
+            return None
+    before = set(sys.modules)
+    memory = rss()
+    start = time.perf_counter()
+    if name == 'dagbag':
+        dagbag = DagBag(dag_folder=DAGS, include_examples=False)
+        result.update(dags=len(dagbag.dags), import_errors=len(dagbag.import_errors))
+    else:
+        __import__(name)
+    result['seconds'] = time.perf_counter() - start
+    result['rss_mb'] = rss() - memory
+    loaded = {module.split('.')[0] for module in set(sys.modules) - before}
+    result['heavy'] = sorted(loaded & set(HEAVY_MODULES))
+    return result
+
+
+def run(name, repeat):
+    # Fastest of repeat runs, each in a new process
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--measure', name],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    if results[0] is None:
+        return None
+    return min(results, key=lambda result: result['seconds'])
+
+
+def compare(result, baseline, tolerance):
+    # Flags of the measures above the baseline and of the heavy imports
+    flags = [f"imports {', '.join(result['heavy'])}"] if result['heavy'] else []
+    if result.get('import_errors'):
+        flags.append(f"{result['import_errors']} import errors")
+    if baseline:
+        if result['seconds'] > baseline['seconds'] * (1 + tolerance) and result['seconds'] - baseline['seconds'] > MIN_SECONDS:
+            flags.append(f"time +{result['seconds'] / baseline['seconds'] - 1:.0%}")
+        if result['rss_mb'] - baseline['rss_mb'] > max(baseline['rss_mb'] * tolerance, MIN_RSS_MB):
+            flags.append(f"rss +{result['rss_mb'] - baseline['rss_mb']:.0f}MB")
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each measure, the fastest is kept')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='relative increase over the baseline flagged as regression')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the baselines')
+    parser.add_argument('--measure', choices=list(MEASURES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+        return
+
+    try:
+        with open(BASELINE_FILE, encoding='utf-8') as fp:
+            baselines = json.load(fp)
+    except FileNotFoundError:
+        baselines = {}
+    regressions = 0
+    for name, guarded in MEASURES.items():
+        result = run(name, args.repeat)
+        if result is None:
+            print(f'  {name:<10} skipped (airflow is not installed)')
+            continue
+        baseline = baselines.get('dag_parse', {}).get(name)
+        flags = compare(result, baseline, args.tolerance) if guarded else []
+        regressions += bool(flags)
+        reference = f" baseline={baseline['seconds']:.3f}s/{baseline['rss_mb']:.0f}MB" if baseline else ''
+        dags = f" dags={result['dags']}" if 'dags' in result else ''
+        heavy = f" heavy={','.join(result['heavy'])}" if result['heavy'] else ''
+        print(f"  {name:<10} {result['seconds']:8.3f}s {result['rss_mb']:7.1f}MB{dags}{heavy}{reference}"
+              + (f"  REGRESSION ({', '.join(flags)})" if flags else ''))
+        if args.update_baseline and guarded:
+            baselines.setdefault('dag_parse', {})[name] = {'seconds': round(result['seconds'], 4), 'rss_mb': round(result['rss_mb'], 3)}
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as fp:
+            json.dump(baselines, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        print(f'Baselines stored - {BASELINE_FILE}')
+    sys.exit(1 if regressions and not args.update_baseline else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of dags/functions.py::_generation_file against the previous openpyxl writer
+(regular worksheets filled from dataframe_to_rows plus a concatenated dataframe).
+Each writer runs in its own process so the peak RSS is measured separately.
+
+Usage:
+    python benchmarks/bench_generation_file.py --scale 10
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+# The stage is measured, not the stage cache
+os.environ['RAIZEN_STAGE_CACHE'] = '0'
+
+
+def generation_file_workbook(path):
+    """
+    Previous implementation of _generation_file, kept as reference.
+    """
+    import pandas as pd
+    from openpyxl import Workbook
+    from openpyxl.utils.dataframe import dataframe_to_rows
+
+    df_deravative = pd.read_csv(path + 'dataset_derivative.csv', delimiter=';')
+    df_diesel = pd.read_csv(path + 'dataset_diesel.csv', delimiter=';')
+    df_final = pd.concat([df_deravative, df_diesel], ignore_index=True, sort=False)
+    wb = Workbook()
+    for index, (title, df) in enumerate((('DERIVATIVES', df_deravative), ('DIESEL', df_diesel), ('DERIVATIVES_DISEL_FINAL', df_final))):
+        ws = wb.create_sheet(title, index)
+        for row in dataframe_to_rows(df, index=False):
+            ws.append(row)
+    wb.remove(wb['Sheet'])
+    wb.save(path + 'data_extracted.xlsx')
+
+
+def run_variant(variant, path):
+    start = time.perf_counter()
+    if variant == 'workbook':
+        generation_file_workbook(path)
+    else:
+        from functions import _generation_file
+        _generation_file(path=path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'variant': variant, 'seconds': elapsed, 'peak_rss_mb': peak, 'size_mb': os.path.getsize(path + 'data_extracted.xlsx') / 2 ** 20}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    parser.add_argument('--variant', choices=['workbook', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.path)
+        return
+
+    from functions import clean_dataframe
+    from synthetic import generate_datasets
+
+    work = tempfile.mkdtemp() + '/'
+    try:
+        generate_datasets(work, args.scale)
+        clean_dataframe('dataset_derivative', 2000, path=work)
+        clean_dataframe('dataset_diesel', 2013, path=work)
+        for variant in ('workbook', 'streaming'):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--variant', variant, '--path', work],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{variant}: {result['seconds']:.2f}s peak_rss={result['peak_rss_mb']:.0f}MB size={result['size_mb']:.1f}MB")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark of the readers of the cleaned datasets used by _generation_file and
+_check_results: the csv files (previous transport), the parquet dataset
+(read_columnar) and the arrow files mapped in memory (read_handoff).
+Each reader runs in its own process so the peak RSS is measured separately.
+
+Usage:
+    python benchmarks/bench_handoff.py --scale 10
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+DATASETS = ['derivative', 'diesel']
+
+# Columns read by _check_results
+COLUMNS_CHECK = ['year_month', 'uf', 'product', 'volume']
+
+
+def read(reader, path, dataset, columns=None):
+    if reader == 'csv':
+        import pandas as pd
+        return pd.read_csv(path + f'dataset_{dataset}.csv', delimiter=';', usecols=columns, parse_dates=['year_month'])
+    if reader == 'parquet':
+        from columnar import read_columnar
+        return read_columnar(path, dataset, columns)
+    from columnar import read_handoff
+    return read_handoff(path, dataset, columns)
+
+
+def peak_rss():
+    # VmHWM of this process in MB (ru_maxrss is kept across exec, it would include the parent)
+    with open('/proc/self/status') as fp:
+        for line in fp:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def run_reader(reader, path):
+    start = time.perf_counter()
+    rows = 0
+    # Reads of _generation_file and _check_results
+    for dataset in DATASETS:
+        rows += len(read(reader, path, dataset))
+        rows += len(read(reader, path, dataset, COLUMNS_CHECK))
+    elapsed = time.perf_counter() - start
+    peak = peak_rss()
+    print(json.dumps({'reader': reader, 'seconds': elapsed, 'peak_rss_mb': peak, 'rows': rows}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    parser.add_argument('--reader', choices=['csv', 'parquet', 'arrow'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.reader:
+        run_reader(args.reader, args.path)
+        return
+
+    from functions import clean_dataframe
+    from columnar import handoff_file
+    from synthetic import generate_datasets
+
+    work = tempfile.mkdtemp() + '/'
+    try:
+        generate_datasets(work, args.scale)
+        clean_dataframe('dataset_derivative', 2000, path=work)
+        clean_dataframe('dataset_diesel', 2013, path=work)
+        for dataset in DATASETS:
+            size_csv = os.path.getsize(work + f'dataset_{dataset}.csv') / 2 ** 20
+            size_arrow = os.path.getsize(handoff_file(work, dataset)) / 2 ** 20
+            print(f'{dataset}: csv={size_csv:.1f}MB arrow={size_arrow:.1f}MB')
+        for reader in ('csv', 'parquet', 'arrow'):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--reader', reader, '--path', work],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{reader}: {result['seconds']:.2f}s peak_rss={result['peak_rss_mb']:.0f}MB rows={result['rows']}")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark of the checkpoints of pywin32/functions.py::generator_dataframe
+(pywin32/checkpoint.py): a traversal of a FakePivotSource that fails after a
+share of the UFs, the run that resumes from the checkpoints and, as reference,
+the traversal without checkpoints. Each call to the table waits --latency ms,
+like a call to Excel.
+
+Usage:
+    python benchmarks/bench_pivot_checkpoint.py --scale 1 --fail-at 0.9 --latency 5
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pywin32'))
+
+from functions import generator_dataframe, load_vars
+from pivot_source import FakePivotSource
+from checkpoint import CheckpointStore
+from synthetic import generate_dataset, PRODUCTS_DERIVATIVE
+from bench_pivot_source import records
+
+
+class FlakyPivotSource(FakePivotSource):
+    """
+    FakePivotSource with the latency of Excel that fails once, after a number of calls to the table.
+    """
+
+    def __init__(self, df, latency, fail_after=None, **kwargs):
+        super().__init__(df, **kwargs)
+        self.latency = latency
+        self.fail_after = fail_after
+
+    def table(self):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            self.fail_after = None
+            raise OSError('The remote procedure call failed')
+        time.sleep(self.latency)
+        return super().table()
+
+
+def timed(source, columns_df, filters, checkpoint=None):
+    start = time.perf_counter()
+    try:
+        df = generator_dataframe(source, columns_df, filters[0], filters[1], checkpoint)
+    except OSError:
+        df = None
+    return time.perf_counter() - start, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1, help='size multiplier of the products')
+    parser.add_argument('--fail-at', type=float, default=0.9, help='share of the tables read before the failure')
+    parser.add_argument('--latency', type=float, default=5, help='milliseconds of each call to the table')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    try:
+        generate_dataset(os.path.join(work, 'dataset_derivative.csv'), PRODUCTS_DERIVATIVE, 2000, 2020, args.scale)
+        df = records(os.path.join(work, 'dataset_derivative.csv'))
+        filters, _, _, columns_df = load_vars('pvt1')
+        latency = args.latency / 1000
+
+        reference = FlakyPivotSource(df, latency)
+        full, expected = timed(reference, columns_df, filters)
+        tables = reference.calls
+
+        source = FlakyPivotSource(df, latency, fail_after=int(tables * args.fail_at))
+        checkpoint = CheckpointStore(os.path.join(work, 'checkpoints'), 'pvt1')
+        failed, result = timed(source, columns_df, filters, checkpoint)
+        assert result is None
+        calls = source.calls
+        resumed, result = timed(source, columns_df, filters, CheckpointStore(os.path.join(work, 'checkpoints'), 'pvt1'))
+
+        print(f'tables={tables} failure after {calls} tables ({args.fail_at:.0%}) latency={args.latency:g}ms')
+        print(f'without checkpoints: full run {full:.2f}s, a failure costs the full run again')
+        print(f'with checkpoints:    failed run {failed:.2f}s (overhead {failed / calls * tables / full - 1:+.1%}), '
+              f'resumed run {resumed:.2f}s ({source.calls - calls} tables) identical={result.equals(expected)}')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark of pywin32/functions.py::generator_dataframe against the previous
+implementation (pd.concat of each block at the top and one str() per cell),
+both traversing a FakePivotSource, so it runs without Excel.
+
+Usage:
+    python benchmarks/bench_pivot_source.py --scale 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import shutil
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pywin32'))
+
+from functions import generator_dataframe, clean_dataframe, load_vars
+from pivot_source import FakePivotSource
+from synthetic import generate_dataset, PRODUCTS_DERIVATIVE, MONTH_NAME
+
+
+class LegacyPivotTable:
+    """
+    Minimal COM-like view of a FakePivotSource for the previous implementation.
+    """
+
+    class Cell:
+        def __init__(self, value, column):
+            self.value = value
+            self.Column = column
+
+        def __str__(self):
+            return str(self.value)
+
+    class Items:
+        def __init__(self, captions):
+            self.captions = captions
+            self.Count = len(captions)
+
+        def __call__(self, index):
+            return type('Item', (), {'Caption': self.captions[index - 1]})
+
+    class Field:
+        def __init__(self, source, name):
+            self.source = source
+            self.name = name
+
+        def PivotItems(self, index=None):
+            items = LegacyPivotTable.Items(self.source.items(self.name))
+            return items if index is None else items(index)
+
+        @property
+        def CurrentPage(self):
+            return self.source.pages[self.name]
+
+        @CurrentPage.setter
+        def CurrentPage(self, caption):
+            self.source.set_page(self.name, caption)
+
+    def __init__(self, source):
+        self.source = source
+
+    def PivotFields(self, name):
+        return LegacyPivotTable.Field(self.source, name)
+
+    @property
+    def TableRange1(self):
+        # Cells in row order, the first column of the table is column B
+        return [LegacyPivotTable.Cell(value, column) for row in self.source.table() for column, value in enumerate(row, 2)]
+
+
+def convert_list_to_df(table_data, item_columns):
+    """
+    Previous implementation, kept as reference.
+    """
+    column_df = len(item_columns) - 1
+    row_df = int(len(table_data) / column_df)
+    return pd.DataFrame(np.reshape(table_data, (row_df, column_df)))
+
+
+def generator_dataframe_concat(pvtTable, columns_df, column_pivot, filter_1, filter_2):
+    """
+    Previous implementation of generator_dataframe, kept as reference.
+    """
+    item_columns = column_pivot
+    df_merged = pd.DataFrame()
+    for item in range(1, pvtTable.PivotFields(filter_1).PivotItems().Count + 1):
+        uf = pvtTable.PivotFields(filter_1).PivotItems(item)
+        pvtTable.PivotFields(filter_1).CurrentPage = uf.Caption
+        for item2 in range(1, pvtTable.PivotFields(filter_2).PivotItems().Count + 1):
+            table_data = ['UF', 'PRODUTO']
+            prod = pvtTable.PivotFields(filter_2).PivotItems(item2)
+            pvtTable.PivotFields(filter_2).CurrentPage = prod.Caption
+            for i in pvtTable.TableRange1:
+                if str(i) != 'None' and int(i.Column) == 2:
+                    table_data.append(uf.Caption)
+                    table_data.append(prod.Caption)
+                table_data.append(str(i))
+            df = convert_list_to_df(table_data, item_columns)
+            df.columns = columns_df
+            df = df.drop(index=0)
+            df = df.drop(index=1)
+            df = df.drop(index=14)
+            df_merged = pd.concat([df, df_merged], ignore_index=True, sort=False)
+    return df_merged
+
+
+def records(path):
+    # Pivot records (year_month, uf, product, unit, volume) from a synthetic dataset
+    df = pd.read_csv(path, delimiter=';', header=0, names=['year', 'month', 'region', 'uf', 'product', 'volume'], decimal=',')
+    df = df[(df['year'] >= 2000) & (df['year'] <= 2020)]
+    month = df['month'].map({name: i for i, name in enumerate(MONTH_NAME, 1)})
+    return pd.DataFrame({
+        'year_month': pd.to_datetime(pd.DataFrame({'year': df['year'], 'month': month, 'day': 1})),
+        'uf': df['uf'],
+        'product': df['product'],
+        'unit': 'm3',
+        'volume': df['volume'],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=4, help='size multiplier of the products')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    try:
+        generate_dataset(os.path.join(work, 'dataset_derivative.csv'), PRODUCTS_DERIVATIVE, 2000, 2020, args.scale)
+        source = FakePivotSource(records(os.path.join(work, 'dataset_derivative.csv')))
+    finally:
+        shutil.rmtree(work)
+
+    filters, _, column_pivot, columns_df = load_vars('pvt1')
+    results = {}
+    timings = {}
+    for name in ('concat', 'blocks'):
+        for field in filters:
+            source.clear(field)
+        start = time.perf_counter()
+        if name == 'concat':
+            df = generator_dataframe_concat(LegacyPivotTable(source), columns_df, column_pivot, filters[0], filters[1])
+        else:
+            df = generator_dataframe(source, columns_df, filters[0], filters[1])
+        timings[name] = time.perf_counter() - start
+        df = df.melt(id_vars=['uf', 'produto', 'mes'], var_name='ano', value_name='volume')
+        results[name] = clean_dataframe(df).drop(columns='created_at').reset_index(drop=True)
+
+    combinations = len(source.items(filters[0])) * len(source.items(filters[1]))
+    print(f"generator_dataframe: combinations={combinations} rows={len(results['blocks'])} "
+          f"concat={timings['concat']:.2f}s blocks={timings['blocks']:.2f}s "
+          f"speedup={timings['concat'] / timings['blocks']:.1f}x")
+    # Both implementations must extract the same rows, the benchmark fails otherwise
+    pd.testing.assert_frame_equal(results['blocks'], results['concat'])
+    print('identical=True')
+
+
+if __name__ == '__main__':
+    main()
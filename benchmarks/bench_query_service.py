@@ -0,0 +1,154 @@
+"""
+Load test of the query service (dags/query_service.py): the server runs in its
+own process over the cubes of synthetic datasets, concurrent clients with
+persistent connections send random queries and the requests per second and
+the latencies are reported, first with queries that miss the LRU cache and
+then with a small set of repeated queries.
+
+Usage:
+    python benchmarks/bench_query_service.py --scale 10 --clients 8 --requests 2000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode
+
+import numpy as np
+
+DAGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags')
+sys.path.insert(0, DAGS)
+
+
+def random_paths(metadata, count, seed=0):
+    # Random /query urls over the labels of the datasets
+    rng = np.random.default_rng(seed)
+    paths = []
+    for _ in range(count):
+        dataset = str(rng.choice(list(metadata)))
+        axes = metadata[dataset]
+        params = [('dataset', dataset)]
+        if rng.random() < 0.7:
+            params += [('product', product) for product in rng.choice(axes['products'], rng.integers(1, 4), replace=False)]
+        if rng.random() < 0.7:
+            params += [('uf', uf) for uf in rng.choice(axes['ufs'], rng.integers(1, 6), replace=False)]
+        first = int(axes['first_month'][:4]) * 12 + int(axes['first_month'][5:]) - 1
+        start, end = sorted(first + rng.integers(0, axes['months'], 2))
+        params += [('start', f'{start // 12:04d}-{start % 12 + 1:02d}'), ('end', f'{end // 12:04d}-{end % 12 + 1:02d}')]
+        group_by = [key for key in ('product', 'uf', 'year') if rng.random() < 0.3]
+        if group_by:
+            params.append(('group_by', ','.join(group_by)))
+        paths.append('/query?' + urlencode(params))
+    return paths
+
+
+def load(port, paths, clients, requests):
+    """
+    Send the requests from concurrent clients, each with a persistent connection.
+
+    Returns
+    -------
+    seconds : float
+        Duration of the test.
+    latencies : ndarray
+        Latency of each request (s).
+    errors : int
+        Responses that are not 200.
+    """
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+
+    def client(index):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        for i in range(index, requests, clients):
+            start = time.perf_counter()
+            connection.request('GET', paths[i % len(paths)])
+            response = connection.getresponse()
+            response.read()
+            latencies[index].append(time.perf_counter() - start)
+            errors[index] += response.status != 200
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, np.concatenate(latencies), sum(errors)
+
+
+def wait_server(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Query service exited')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Query service did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='requests of each test')
+    parser.add_argument('--hot', type=int, default=50, help='distinct queries of the cached test')
+    args = parser.parse_args()
+
+    from functions import clean_dataframe
+    from cube import write_cube
+    from synthetic import generate_datasets
+
+    work = tempfile.mkdtemp() + '/'
+    process = None
+    try:
+        generate_datasets(work, args.scale)
+        clean_dataframe('dataset_derivative', 2000, path=work)
+        clean_dataframe('dataset_diesel', 2013, path=work)
+        for dataset in ('derivative', 'diesel'):
+            write_cube(work, dataset)
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(DAGS, 'query_service.py'), '--path', work, 'serve', '--port', str(port)],
+            stdout=subprocess.DEVNULL,
+        )
+        wait_server(port, process)
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('GET', '/metadata')
+        metadata = json.loads(connection.getresponse().read())
+
+        tests = [
+            ('uncached', random_paths(metadata, args.requests, seed=1)),
+            ('cached', random_paths(metadata, args.hot, seed=2)),
+        ]
+        for name, paths in tests:
+            seconds, latencies, errors = load(port, paths, args.clients, args.requests)
+            print(f'{name}: {args.requests / seconds:.0f} requests/s clients={args.clients} '
+                  f'p50={np.percentile(latencies, 50) * 1000:.2f}ms p99={np.percentile(latencies, 99) * 1000:.2f}ms errors={errors}')
+        connection.request('GET', '/health')
+        print(f"cache: {json.loads(connection.getresponse().read())['cache']}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Memory benchmark of the schema of the cleaned datasets (dags/schema.py): the
+cleaning of the datasets (read_dataset and transform_dataframe), the read of
+the arrow files of the next tasks (read_handoff) and the cleaning of the
+pywin32 extraction, each against the previous object-dtype implementation
+(strings for the labels and for created_at, one value per row). Each case
+runs in its own process, the peak of the traced allocations (tracemalloc),
+the peak RSS and the memory of the resulting dataframe are reported.
+
+Usage:
+    python benchmarks/bench_schema_memory.py --scale 10
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import contextlib
+import tracemalloc
+import multiprocessing
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Datasets cleaned and their first year
+DATASETS = {'dataset_derivative': 2000, 'dataset_diesel': 2013}
+
+
+def legacy_clean(path, start_period):
+    # Previous cleaning: labels, unit and created_at as object columns
+    import numpy as np
+    import pandas as pd
+    from functions import HEADER_DATASET, MONTH_NAME
+
+    df = pd.read_csv(path, index_col=None, delimiter=';', header=0, names=HEADER_DATASET, decimal=',', float_precision='round_trip')
+    df = df[df['year'] >= int(start_period)]
+    for column in df.columns[df.dtypes == object]:
+        codes, uniques = pd.factorize(df[column])
+        uniques = np.array([x.strip() if isinstance(x, str) else x for x in uniques] + [np.nan], dtype=object)
+        df[column] = uniques.take(codes)
+    month = pd.Categorical(df['month'], categories=MONTH_NAME).codes + 1
+    df = pd.DataFrame({
+        'year_month': pd.to_datetime(pd.DataFrame({'year': df['year'].astype(int), 'month': month, 'day': 1})),
+        'uf': df['uf'],
+        'product': df['product'],
+        'unit': 'm3',
+        'volume': df['volume'].astype(float),
+        'created_at': pd.Timestamp.now().strftime('%Y-%m-%d %X'),
+    })
+    return df.sort_values(by=['year_month', 'uf', 'product'])
+
+
+def schema_clean(path, start_period):
+    from functions import read_dataset, transform_dataframe
+    from schema import processing_time
+
+    return transform_dataframe(read_dataset(path), start_period, processing_time())
+
+
+def legacy_handoff(path, dataset):
+    # Previous read: created_at converted once per row
+    import pyarrow as pa
+    from columnar import handoff_file
+
+    with pa.memory_map(handoff_file(path, dataset)) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(date_as_object=False, split_blocks=True)
+
+
+def schema_handoff(path, dataset):
+    from columnar import read_handoff
+
+    return read_handoff(path, dataset)
+
+
+def legacy_pywin32(df):
+    # Previous pywin32 cleaning: a python call per row
+    import pandas as pd
+    from functions import clean_space_parentheses, formated_year_month
+
+    df = df.replace(['None'], 0.0).fillna({'volume': 0.0})
+    df['unit'] = df['produto'].apply(lambda x: x[len(x)-3:-1])
+    df['volume'] = df['volume'].astype(float)
+    df['product'] = df['produto'].apply(lambda x: clean_space_parentheses(x))
+    df['year_month'] = df.apply(lambda x: formated_year_month(x['ano'], x['mes']), axis=1)
+    df['created_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %X')
+    return df[['year_month', 'uf', 'product', 'unit', 'volume', 'created_at']]
+
+
+def schema_pywin32(df):
+    from functions import clean_dataframe
+
+    return clean_dataframe(df)
+
+
+def measure(case, implementation, work, queue):
+    """
+    Run a case in this process and send (seconds, traced peak MB, peak RSS MB, dataframe MB).
+    """
+    folder = 'pywin32' if case == 'pywin32' else 'dags'
+    sys.path.insert(0, os.path.join(ROOT, folder))
+    sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+    function = globals()[f'{implementation}_{case}']
+    if case == 'pywin32':
+        import bench_suite
+        inputs = [(frame,) for frame in bench_suite.pywin32_frames(work)]
+    elif case == 'clean':
+        inputs = [(work + file_name + '.csv', start_period) for file_name, start_period in DATASETS.items()]
+    else:
+        inputs = [(work, file_name.replace('dataset_', '')) for file_name in DATASETS]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    frames = [function(*arguments) for arguments in inputs]
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    size = sum(int(df.memory_usage(index=False, deep=True).sum()) for df in frames)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put((seconds, peak / 2 ** 20, rss / 2 ** 20, size / 2 ** 20))
+
+
+def run(case, implementation, work):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(case, implementation, work, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, 'dags'))
+    os.environ['RAIZEN_STAGE_CACHE'] = '0'
+    os.environ['RAIZEN_CLEAN_MODE'] = 'memory'
+    from synthetic import generate_datasets, RAW_FOLDER
+
+    work = tempfile.mkdtemp() + '/'
+    raw = work + RAW_FOLDER + '/'
+    try:
+        # Downloaded datasets for the cleaning, cleaned datasets and arrow files for the other cases
+        generate_datasets(work, args.scale)
+        from functions import _clean_file
+        with contextlib.redirect_stdout(io.StringIO()):
+            _clean_file(work)
+
+        print(f'{"case":<10} {"dtypes":<8} {"seconds":>8} {"traced MB":>10} {"RSS MB":>8} {"frames MB":>10}')
+        for case in ('clean', 'handoff', 'pywin32'):
+            for implementation in ('legacy', 'schema'):
+                seconds, peak, rss, size = run(case, implementation, raw if case == 'clean' else work)
+                print(f'{case:<10} {implementation:<8} {seconds:8.2f} {peak:10.1f} {rss:8.1f} {size:10.1f}')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
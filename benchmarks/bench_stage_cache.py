@@ -0,0 +1,80 @@
+"""
+Benchmark of the stage cache (dags/stage_cache.py): the local stages of the DAG
+(extract_pivot_cache, clean_file, check_results, generation_file) run on
+synthetic inputs three times, with an empty cache, again with the same
+downloaded files (copied again, like an unchanged download) and after a
+revision of the diesel dataset. The time and the cache result of each stage
+are read from the metrics of the stages.
+
+Usage:
+    python benchmarks/bench_stage_cache.py --scale 10
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dags'))
+
+# Dataset revised by the source in the last run
+REVISED = os.path.join('raw', 'dataset_diesel.csv')
+
+
+def run_stages(path):
+    # Wall time and cache result of each stage, from its METRICS line
+    from functions import _extract_pivot_cache, _clean_file, _check_results, _generation_file
+
+    results = []
+    for stage in (lambda: _extract_pivot_cache(path=path), lambda: _clean_file(path), lambda: _check_results(path), lambda: _generation_file(path)):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            stage()
+        for line in output.getvalue().splitlines():
+            if line.startswith('METRICS '):
+                metrics = json.loads(line[len('METRICS '):])
+                results.append((metrics['stage'], metrics['wall_s'], metrics.get('cache')))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='size multiplier of the synthetic datasets')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    # Cache of the benchmark only, the stages clean the whole dataset on each miss
+    os.environ['RAIZEN_STAGE_CACHE_FOLDER'] = os.path.join(work, 'stage_cache')
+    os.environ['RAIZEN_STAGE_CACHE'] = '1'
+    os.environ.setdefault('RAIZEN_CLEAN_MODE', 'memory')
+    from synthetic import generate_inputs
+
+    inputs = os.path.join(work, 'inputs') + '/'
+    path = os.path.join(work, 'dados') + '/'
+    try:
+        generate_inputs(inputs, args.scale)
+        runs = [('cold', None), ('unchanged', None), ('diesel revised', REVISED)]
+        for name, revised in runs:
+            # Downloads of the DAG (the raw datasets and the pivot file)
+            shutil.copytree(inputs, path, dirs_exist_ok=True)
+            if revised:
+                # Last row of the dataset removed, a revision of the source
+                with open(path + revised, 'rb') as fp:
+                    lines = fp.read().rstrip(b'\r\n').split(b'\n')
+                with open(path + revised, 'wb') as fp:
+                    fp.write(b'\n'.join(lines[:-1]) + b'\n')
+            start = time.perf_counter()
+            results = run_stages(path)
+            print(f'{name}: {time.perf_counter() - start:.2f}s')
+            for stage, seconds, cache in results:
+                print(f'  {stage:<22} {seconds:7.2f}s  {cache}')
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Benchmark suite of the pipeline stages on synthetic ANP inputs (datasets and
+pivot file generated offline by synthetic.generate_inputs).
+
+Each stage runs in its own process: the inputs are prepared, the peak RSS is
+reset and the stage is timed, so the time and the peak RSS are those of the
+stage only. The results are compared with the baselines stored in
+baselines.json, a stage slower or larger than its baseline beyond the
+tolerance is flagged and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_suite.py --scales 1 10 100
+    python benchmarks/bench_suite.py --scales 1 10 --stages clean_dataframe check_results
+    python benchmarks/bench_suite.py --scales 1 10 100 --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Baselines of each scale and stage
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Stages and the folder of their module (dags or pywin32), in order of execution
+STAGES = {
+    'clean_dataframe': 'dags',
+    'extract_pivot_cache': 'dags',
+    'check_results': 'dags',
+    'generation_file': 'dags',
+    'pywin32_clean_dataframe': 'pywin32',
+    'pywin32_get_total_dataframe': 'pywin32',
+}
+
+# Differences below these values are noise, never flagged
+MIN_SECONDS = 0.05
+MIN_RSS_MB = 16
+
+
+def peak_rss():
+    # VmHWM of this process in MB
+    with open('/proc/self/status') as fp:
+        for line in fp:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def reset_peak_rss():
+    # Linux resets VmHWM to the current RSS, the peak of the setup is not measured
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except OSError:
+        pass
+
+
+def pywin32_frames(path, totals=False):
+    """
+    Dataframes extracted by generator_dataframe from pivot tables (FakePivotSource)
+    of the cleaned datasets, melted like raizen_win32.main.
+    """
+    import pandas as pd
+    from functions import generator_dataframe, load_vars
+    from pivot_source import FakePivotSource
+
+    frames = []
+    for name, dataset in (('pvt1', 'dataset_derivative.csv'), ('pvt2', 'dataset_diesel.csv')):
+        filters, _, _, columns_df = load_vars(name)
+        df = pd.read_csv(path + dataset, delimiter=';', parse_dates=['year_month'])
+        source = FakePivotSource(df, years=[int(year) for year in columns_df[3:]], fields=filters)
+        df = generator_dataframe(source, columns_df, filters[0], filters[1])
+        df = df.melt(id_vars=['uf', 'produto', 'mes'], var_name='ano', value_name='volume')
+        if totals:
+            # Total do Ano rows, the input of get_total_dataframe
+            total = df.groupby(['uf', 'produto', 'ano'], sort=False)['volume'].sum(min_count=1).reset_index()
+            df = pd.concat([df, total.assign(mes='Total do Ano')], ignore_index=True)
+        frames.append(df)
+    return frames
+
+
+def setup_stage(stage, work):
+    """
+    Prepare the inputs of a stage.
+
+    Parameters
+    ----------
+    stage : String
+        Name of the stage.
+    work : String
+        Folder of the scale, with the inputs and the cleaned folders.
+
+    Returns
+    -------
+    run : function
+        Stage, called without arguments.
+    """
+    clean = os.path.join(work, 'clean') + '/'
+    if stage == 'clean_dataframe':
+        from functions import clean_dataframe
+        folder = os.path.join(work, 'stage_clean') + '/'
+        shutil.rmtree(folder, ignore_errors=True)
+        # Downloaded datasets only
+        shutil.copytree(os.path.join(work, 'inputs', 'raw'), os.path.join(folder, 'raw'))
+        return lambda: (clean_dataframe('dataset_derivative', 2000, path=folder), clean_dataframe('dataset_diesel', 2013, path=folder))
+    if stage == 'extract_pivot_cache':
+        from functions import _extract_pivot_cache
+        return lambda: _extract_pivot_cache(path=clean)
+    if stage == 'check_results':
+        from functions import _check_results
+        return lambda: _check_results(clean)
+    if stage == 'generation_file':
+        from functions import _generation_file
+        return lambda: _generation_file(clean)
+    if stage == 'pywin32_clean_dataframe':
+        from functions import clean_dataframe
+        frames = pywin32_frames(clean)
+        return lambda: [clean_dataframe(df) for df in frames]
+    from functions import get_total_dataframe
+    frames = pywin32_frames(clean, totals=True)
+    return lambda: [get_total_dataframe(df) for df in frames]
+
+
+def run_stage(stage, work, repeat):
+    sys.path.insert(0, os.path.join(ROOT, STAGES[stage]))
+    seconds = []
+    peaks = []
+    for _ in range(repeat):
+        run = setup_stage(stage, work)
+        reset_peak_rss()
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+        peaks.append(peak_rss())
+    print(json.dumps({'stage': stage, 'seconds': min(seconds), 'peak_rss_mb': max(peaks)}))
+
+
+def prepare(work, scale):
+    """
+    Generate the inputs of a scale and the cleaned folder read by the stages
+    after clean_dataframe.
+    """
+    sys.path.insert(0, os.path.join(ROOT, 'dags'))
+    from synthetic import generate_inputs
+    from functions import clean_dataframe, _extract_pivot_cache, _check_results
+
+    inputs = os.path.join(work, 'inputs') + '/'
+    clean = os.path.join(work, 'clean') + '/'
+    rows = generate_inputs(inputs, scale)
+    shutil.copytree(inputs, clean)
+    clean_dataframe('dataset_derivative', 2000, path=clean)
+    clean_dataframe('dataset_diesel', 2013, path=clean)
+    _extract_pivot_cache(path=clean)
+    _check_results(clean)
+    return rows
+
+
+def compare(result, baseline, tolerance):
+    # Flags of the measures above the baseline
+    flags = []
+    if baseline:
+        if result['seconds'] > baseline['seconds'] * (1 + tolerance) and result['seconds'] - baseline['seconds'] > MIN_SECONDS:
+            flags.append(f"time +{result['seconds'] / baseline['seconds'] - 1:.0%}")
+        if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance) and result['peak_rss_mb'] - baseline['peak_rss_mb'] > MIN_RSS_MB:
+            flags.append(f"rss +{result['peak_rss_mb'] / baseline['peak_rss_mb'] - 1:.0%}")
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help='size multipliers of the synthetic inputs')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help='stages measured')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each stage, the fastest is kept')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative increase over the baseline flagged as regression')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the baselines')
+    parser.add_argument('--stage', choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--work', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args.stage, args.work, args.repeat)
+        return
+    if args.prepare:
+        print(json.dumps(prepare(args.work, args.prepare)))
+        return
+
+    try:
+        with open(BASELINE_FILE, encoding='utf-8') as fp:
+            baselines = json.load(fp)
+    except FileNotFoundError:
+        baselines = {}
+    # Stages run with the same mode as the in-memory functions they call (no incremental skips nor stage cache)
+    env = dict(os.environ, RAIZEN_CLEAN_MODE='memory', RAIZEN_EXPORT_CSV='1', RAIZEN_STAGE_CACHE='0')
+    regressions = 0
+    for scale in args.scales:
+        work = tempfile.mkdtemp(prefix=f'bench_{scale}x_')
+        try:
+            # Inputs generated in a process of their own, not counted in the stages
+            rows = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--prepare', str(scale), '--work', work],
+                check=True, capture_output=True, text=True, env=env,
+            ).stdout.strip().splitlines()[-1]
+            print(f'scale={scale}x rows={rows}')
+            for stage in args.stages:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--stage', stage, '--work', work, '--repeat', str(args.repeat)],
+                    check=True, capture_output=True, text=True, env=env,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                del result['stage']
+                flags = compare(result, baselines.get(str(scale), {}).get(stage), args.tolerance)
+                regressions += bool(flags)
+                baseline = baselines.get(str(scale), {}).get(stage)
+                reference = f" baseline={baseline['seconds']:.2f}s/{baseline['peak_rss_mb']:.0f}MB" if baseline else ''
+                print(f"  {stage:<28} {result['seconds']:8.2f}s {result['peak_rss_mb']:7.0f}MB{reference}"
+                      + (f"  REGRESSION ({', '.join(flags)})" if flags else ''))
+                if args.update_baseline:
+                    baselines.setdefault(str(scale), {})[stage] = {key: round(value, 3) for key, value in result.items()}
+        finally:
+            shutil.rmtree(work)
+
+    if args.update_baseline:
+        baselines['machine'] = {'python': platform.python_version(), 'system': platform.platform(), 'cores': os.cpu_count()}
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as fp:
+            json.dump(baselines, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        print(f'Baselines stored - {BASELINE_FILE}')
+    sys.exit(1 if regressions and not args.update_baseline else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+import os
+import random
+import zipfile
+from xml.sax.saxutils import quoteattr
+
+import pandas as pd
+from openpyxl import Workbook
+
+# Federative units and regions used by the ANP datasets
+UF_REGION = {
+    'ACRE': 'REGIÃO NORTE', 'ALAGOAS': 'REGIÃO NORDESTE', 'AMAPÁ': 'REGIÃO NORTE', 'AMAZONAS': 'REGIÃO NORTE',
+    'BAHIA': 'REGIÃO NORDESTE', 'CEARÁ': 'REGIÃO NORDESTE', 'DISTRITO FEDERAL': 'REGIÃO CENTRO-OESTE',
+    'ESPÍRITO SANTO': 'REGIÃO SUDESTE', 'GOIÁS': 'REGIÃO CENTRO-OESTE', 'MARANHÃO': 'REGIÃO NORDESTE',
+    'MATO GROSSO': 'REGIÃO CENTRO-OESTE', 'MATO GROSSO DO SUL': 'REGIÃO CENTRO-OESTE', 'MINAS GERAIS': 'REGIÃO SUDESTE',
+    'PARANÁ': 'REGIÃO SUL', 'PARAÍBA': 'REGIÃO NORDESTE', 'PARÁ': 'REGIÃO NORTE', 'PERNAMBUCO': 'REGIÃO NORDESTE',
+    'PIAUÍ': 'REGIÃO NORDESTE', 'RIO DE JANEIRO': 'REGIÃO SUDESTE', 'RIO GRANDE DO NORTE': 'REGIÃO NORDESTE',
+    'RIO GRANDE DO SUL': 'REGIÃO SUL', 'RONDÔNIA': 'REGIÃO NORTE', 'RORAIMA': 'REGIÃO NORTE',
+    'SANTA CATARINA': 'REGIÃO SUL', 'SERGIPE': 'REGIÃO NORDESTE', 'SÃO PAULO': 'REGIÃO SUDESTE',
+    'TOCANTINS': 'REGIÃO NORTE',
+}
+
+# Products of each dataset
+PRODUCTS_DERIVATIVE = ['ETANOL HIDRATADO', 'GASOLINA C', 'GASOLINA DE AVIAÇÃO', 'GLP', 'ÓLEO COMBUSTÍVEL', 'ÓLEO DIESEL', 'QUEROSENE DE AVIAÇÃO', 'QUEROSENE ILUMINANTE']
+PRODUCTS_DIESEL = ['ÓLEO DIESEL (OUTROS)', 'ÓLEO DIESEL MARÍTIMO', 'ÓLEO DIESEL S-10', 'ÓLEO DIESEL S-1800', 'ÓLEO DIESEL S-500']
+
+# Month abbreviations used by the datasets
+MONTH_NAME = ['JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN', 'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+
+# Folder of the downloaded datasets in the dados folder (functions.RAW_FOLDER)
+RAW_FOLDER = 'raw'
+
+HEADER = 'ANO;MÊS;GRANDE REGIÃO;UNIDADE DA FEDERAÇÃO;PRODUTO;VENDAS\n'
+
+# Month names of the rows of the pivot tables
+PIVOT_MONTHS = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+
+# Tables of Plan1 (header row, title, dataset, first year) and their pivot caches, in order
+PIVOT_TABLES = [
+    (53, 'Vendas, pelas distribuidoras, dos derivados combustíveis de petróleo por Unidade da Federação e produto - {0}-{1} (m3)', 'dataset_derivative.csv', 2000),
+    (189, 'Vendas, pelas distribuidoras, de óleo diesel por tipo e Unidade da Federação - {0}-{1} (m3)', 'dataset_diesel.csv', 2013),
+]
+
+# Fields of the pivot caches (wide layout, one field per month)
+CACHE_FIELDS = ['COMBUSTÍVEL', 'ANO', 'REGIÃO', 'ESTADO', 'UNIDADE'] + [month.capitalize() for month in MONTH_NAME] + ['TOTAL']
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.{0}+xml'
+
+
+def scaled_products(products, scale):
+    """
+    Multiply the products of a dataset, keeping the original names for scale 1.
+
+    Parameters
+    ----------
+    products : list
+        Product names.
+    scale : int
+        Size multiplier.
+
+    Returns
+    -------
+    products : list
+        Product names.
+    """
+    return [product if i == 0 else f'{product} {i}' for i in range(scale) for product in products]
+
+
+def generate_dataset(path, products, start_year, end_year, scale=1, seed=0, shuffle=True):
+    """
+    Generate a csv shaped like the ANP datasets (semicolon, decimal comma and month abbreviations).
+
+    Parameters
+    ----------
+    path : String
+        Path of the csv file.
+    products : list
+        Product names.
+    start_year : int
+        First year of the dataset.
+    end_year : int
+        Last year of the dataset.
+    scale : int
+        Size multiplier (number of copies of each product).
+    seed : int
+        Seed of the random volumes.
+    shuffle : bool
+        Writes the rows out of order.
+
+    Returns
+    -------
+    rows : int
+        Number of rows generated.
+    """
+    rnd = random.Random(seed)
+    rows = [
+        f'{year};{month};{region};{uf};{product};' + f'{rnd.uniform(0, 500000):.3f}'.replace('.', ',') + '\n'
+        for year in range(start_year, end_year + 1)
+        for month in MONTH_NAME
+        for uf, region in UF_REGION.items()
+        for product in scaled_products(products, scale)
+    ]
+    if shuffle:
+        rnd.shuffle(rows)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as fp:
+        fp.write(HEADER)
+        fp.writelines(rows)
+    return len(rows)
+
+
+def generate_datasets(path, scale=1, seed=0):
+    """
+    Generate dataset_derivative.csv (1990-2022) and dataset_diesel.csv (2013-2022)
+    in the raw folder, where the pipeline downloads them.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets (the dados folder).
+    scale : int
+        Size multiplier.
+    seed : int
+        Seed of the random volumes.
+
+    Returns
+    -------
+    rows : dict
+        Number of rows of each dataset.
+    """
+    return {
+        'dataset_derivative': generate_dataset(os.path.join(path, RAW_FOLDER, 'dataset_derivative.csv'), PRODUCTS_DERIVATIVE, 1990, 2022, scale, seed),
+        'dataset_diesel': generate_dataset(os.path.join(path, RAW_FOLDER, 'dataset_diesel.csv'), PRODUCTS_DIESEL, 2013, 2022, scale, seed + 1),
+    }
+
+
+def read_synthetic(path, start_year):
+    """
+    Read a synthetic dataset with numeric months and volumes.
+
+    Parameters
+    ----------
+    path : String
+        Path of the csv file.
+    start_year : int
+        First year kept.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the columns year, month, region, uf, product and volume.
+    """
+    df = pd.read_csv(path, delimiter=';', header=0, names=['year', 'month', 'region', 'uf', 'product', 'volume'], decimal=',', float_precision='round_trip')
+    df = df[df['year'] >= start_year]
+    df['month'] = pd.Categorical(df['month'], categories=MONTH_NAME).codes + 1
+    return df
+
+
+def _items(values):
+    # Shared items of a cache field and the code of each value
+    items = sorted(values.unique(), key=str)
+    return items, values.map({item: i for i, item in enumerate(items)}).to_numpy()
+
+
+def _item(value):
+    return f'<n v="{value}"/>' if isinstance(value, (int, float)) else f'<s v={quoteattr(str(value))}/>'
+
+
+def _write_cache(zf, number, df):
+    """
+    Write the definition and records parts of a pivot cache (wide layout).
+    """
+    wide = df.pivot_table(index=['product', 'year', 'region', 'uf'], columns='month', values='volume', aggfunc='sum').reset_index()
+    wide['product'] = wide['product'] + ' (m3)'
+    dimensions = [_items(wide[column]) for column in ['product', 'year', 'region', 'uf']]
+    dimensions[1] = ([int(year) for year in dimensions[1][0]], dimensions[1][1])
+    months = wide[list(range(1, 13))].to_numpy()
+    totals = months.sum(axis=1)
+
+    fields = []
+    for name, (items, _) in zip(CACHE_FIELDS, dimensions + [(['m3'], None)]):
+        shared = ''.join(_item(item) for item in items)
+        fields.append(f'<cacheField name={quoteattr(name)} numFmtId="0"><sharedItems count="{len(items)}">{shared}</sharedItems></cacheField>')
+    for name in CACHE_FIELDS[5:]:
+        fields.append(f'<cacheField name={quoteattr(name)} numFmtId="0"><sharedItems containsNumber="1"/></cacheField>')
+    definition = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<pivotCacheDefinition xmlns="{NS_MAIN}" xmlns:r="{NS_REL}" r:id="rId1" recordCount="{len(wide)}">'
+        f'<cacheSource type="worksheet"><worksheetSource ref="A1:R{len(wide) + 1}" sheet="Dados{number}"/></cacheSource>'
+        f'<cacheFields count="{len(fields)}">{"".join(fields)}</cacheFields></pivotCacheDefinition>'
+    )
+    zf.writestr(f'xl/pivotCache/pivotCacheDefinition{number}.xml', definition)
+    zf.writestr(
+        f'xl/pivotCache/_rels/pivotCacheDefinition{number}.xml.rels',
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{NS_REL}/pivotCacheRecords" Target="pivotCacheRecords{number}.xml"/>'
+        '</Relationships>',
+    )
+    codes = [column for _, column in dimensions]
+    with zf.open(f'xl/pivotCache/pivotCacheRecords{number}.xml', 'w') as fp:
+        fp.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><pivotCacheRecords xmlns="{NS_MAIN}" count="{len(wide)}">'.encode('utf-8'))
+        for i in range(len(wide)):
+            record = ''.join(f'<x v="{column[i]}"/>' for column in codes) + '<x v="0"/>'
+            record += ''.join(f'<n v="{value!r}"/>' if value == value else '<m/>' for value in months[i].tolist())
+            fp.write(f'<r>{record}<n v="{totals[i]!r}"/></r>'.encode('utf-8'))
+        fp.write(b'</pivotCacheRecords>')
+
+
+def generate_pivot(path, file_name='vendas-combustiveis-m3.xlsx'):
+    """
+    Generate the pivot file of the synthetic datasets, shaped like the ANP file:
+    sheet Plan1 with the tables of sales by month x year (derivatives from row 53,
+    diesel from row 189) and one pivot cache per table with the records by
+    product, year and UF (one field per month).
+
+    The caches are not attached to pivot table parts, Excel shows only the
+    values of Plan1, but the readers of the pipeline read the caches.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets (generated by generate_datasets, read from the raw folder).
+    file_name : String
+        Name of the pivot file.
+
+    Returns
+    -------
+    records : list
+        Number of records of each pivot cache.
+    """
+    file_pivot = os.path.join(path, file_name)
+    frames = [read_synthetic(os.path.join(path, RAW_FOLDER, dataset), start_year) for _, _, dataset, start_year in PIVOT_TABLES]
+
+    # Plan1, the values of the tables
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Plan1'
+    for (header_row, title, _, _), df in zip(PIVOT_TABLES, frames):
+        years = sorted(df['year'].unique())
+        totals = df.groupby(['month', 'year'])['volume'].sum()
+        ws.cell(header_row - 3, 2, title.format(years[0], years[-1]))
+        ws.cell(header_row - 1, 3, 'ANO')
+        ws.cell(header_row, 2, 'Mês')
+        for column, year in enumerate(years, 3):
+            ws.cell(header_row, column, int(year))
+        for row, month in enumerate(PIVOT_MONTHS, header_row + 1):
+            ws.cell(row, 2, month)
+            for column, year in enumerate(years, 3):
+                ws.cell(row, column, float(totals.get((row - header_row, year), 0.0)))
+        ws.cell(header_row + 13, 2, 'Total do Ano')
+        for column, year in enumerate(years, 3):
+            ws.cell(header_row + 13, column, float(totals.xs(year, level='year').sum()))
+    tmp = file_pivot + '.tmp'
+    wb.save(tmp)
+
+    # Pivot caches, added to the package of the workbook
+    with zipfile.ZipFile(tmp) as source, zipfile.ZipFile(file_pivot, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == '[Content_Types].xml':
+                overrides = ''.join(
+                    f'<Override PartName="/xl/pivotCache/pivotCache{part}{number}.xml" ContentType="{CONTENT_TYPE.format("pivotCache" + part)}" />'
+                    for number in range(1, len(frames) + 1) for part in ('Definition', 'Records')
+                )
+                data = data.replace(b'</Types>', overrides.encode('utf-8') + b'</Types>')
+            zf.writestr(item, data)
+        for number, df in enumerate(frames, 1):
+            _write_cache(zf, number, df)
+    os.remove(tmp)
+    return [len(df.groupby(['product', 'year', 'uf'])) for df in frames]
+
+
+def generate_inputs(path, scale=1, seed=0):
+    """
+    Generate the inputs of the pipeline: both datasets and the pivot file.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    scale : int
+        Size multiplier.
+    seed : int
+        Seed of the random volumes.
+
+    Returns
+    -------
+    rows : dict
+        Number of rows of each dataset and of each pivot cache.
+    """
+    rows = generate_datasets(path, scale, seed)
+    for name, records in zip(['pivot_derivative', 'pivot_diesel'], generate_pivot(path)):
+        rows[name] = records
+    return rows
@@ -0,0 +1,395 @@
+"""
+Batch extraction of the tables of many ANP pivot workbooks (other products,
+years and archived releases of vendas-combustiveis-m3) into one consolidated
+dataset. The tables are described by specs (table_specs.json) and the
+workbooks of a folder are read by a process pool.
+
+Spec of a table:
+    name        name of the table in the consolidated dataset
+    kind        pivot_cache (records of a pivot cache, xlsx or xls) or
+                sheet_table (table month x year of a sheet, xlsx)
+    anchor      pivot_cache: cache (position of the cache) and/or fields
+                (names the cache must have, the first cache with them);
+                sheet_table: sheet and title (keyword of the title)
+    dimensions  pivot_cache: names of the fields uf, product, year, month and
+                unit (FIELD_ALIASES by default); sheet_table: values of uf,
+                product and unit, the same for all the rows
+    measures    pivot_cache: names of the field volume, the volume is read from
+                the month fields (Jan...Dez) when the cache has no month field;
+                sheet_table: years (first and last year kept)
+
+Usage:
+    python dags/batch_extract.py --folder /data/anp --output /data/anp/consolidated.csv
+    python dags/batch_extract.py --folder /data/anp --specs dags/table_specs.json --workers 4 --report /data/anp/report.csv
+"""
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from pivot_cache import FIELD_ALIASES, list_pivot_caches, read_cache_definition, read_pivot_cache
+from pivot_cache_xls import CompoundFile, list_pivot_cache_streams, read_cache_stream, read_pivot_cache_xls
+from pivot_locator import locate_pivot_tables, find_table, normalize
+from reconciliation import table_frame
+from schema import COLUMNS, processing_time, month_start, conform, sort, to_csv
+
+# Specs of the tables of vendas-combustiveis-m3 (the tables read by the DAG)
+SPECS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'table_specs.json')
+
+# Processes of the batch, all the cores by default
+BATCH_WORKERS = int(os.environ.get('RAIZEN_BATCH_WORKERS', '0')) or os.cpu_count()
+
+# Workbooks read in the folder
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xls')
+
+# Keys of the anchor, dimensions and measures of each kind of table
+KINDS = {
+    'pivot_cache': {'anchor': ('cache', 'fields'), 'dimensions': ('uf', 'product', 'year', 'month', 'unit'), 'measures': ('volume',)},
+    'sheet_table': {'anchor': ('sheet', 'title'), 'dimensions': ('uf', 'product', 'unit'), 'measures': ('years',)},
+}
+
+# Columns of the consolidated dataset
+BATCH_COLUMNS = ['source', 'table'] + COLUMNS
+
+# Folder of the anchors of the sheet tables (pivot_locator), one file per workbook, in the folder of the output
+ANCHORS_FOLDER = 'pivot_tables'
+
+
+def load_specs(file_name=None):
+    """
+    Load and validate the table specs.
+
+    Parameters
+    ----------
+    file_name : String
+        Specs file (json), SPECS_FILE by default.
+
+    Returns
+    -------
+    specs : list
+        Spec of each table.
+    """
+    with open(file_name or SPECS_FILE, encoding='utf-8') as fp:
+        specs = json.load(fp)['tables']
+    names = set()
+    for spec in specs:
+        name, kind = spec.get('name'), spec.get('kind')
+        if not name or name in names:
+            raise ValueError(f'Table spec without name or with a repeated name: {name}')
+        if kind not in KINDS:
+            raise ValueError(f'Table spec {name}: kind must be one of {list(KINDS)}')
+        for section, keys in KINDS[kind].items():
+            unknown = sorted(set(spec.get(section, {})) - set(keys))
+            if unknown:
+                raise ValueError(f'Table spec {name}: unknown {section} {unknown}')
+        anchor = spec.get('anchor', {})
+        if kind == 'pivot_cache' and not anchor:
+            raise ValueError(f'Table spec {name}: the anchor needs cache or fields')
+        if kind == 'sheet_table' and 'title' not in anchor:
+            raise ValueError(f'Table spec {name}: the anchor needs title')
+        names.add(name)
+    return specs
+
+
+def cache_fields(file_name):
+    """
+    Field names of each pivot cache of a workbook.
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the xlsx or xls file.
+
+    Returns
+    -------
+    fields : list
+        Names of the fields of each cache, in the order of the caches.
+    """
+    if file_name.lower().endswith('.xls'):
+        with CompoundFile(file_name) as cf:
+            return [read_cache_stream(cf.iter_stream(cf.find(stream)))[0] for stream in list_pivot_cache_streams(file_name)]
+    fields = []
+    with zipfile.ZipFile(file_name) as zf:
+        for definition, _ in list_pivot_caches(file_name):
+            with zf.open(definition) as fp:
+                fields.append(read_cache_definition(fp)[0])
+    return fields
+
+
+def find_cache(file_name, anchor):
+    """
+    Position of the pivot cache of an anchor.
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the xlsx or xls file.
+    anchor : dict
+        cache (position) and/or fields (names the cache must have).
+
+    Returns
+    -------
+    cache_number : int
+        Position of the cache (1 for the first cache), None when no cache matches.
+    """
+    if 'fields' not in anchor:
+        return anchor['cache']
+    required = {normalize(name) for name in anchor['fields']}
+    for number, names in enumerate(cache_fields(file_name), 1):
+        if anchor.get('cache', number) == number and required <= {normalize(name) for name in names}:
+            return number
+    return None
+
+
+def _constant(value, rows):
+    # Categorical column with the same value (or missing) in all the rows
+    if value is None:
+        return pd.Categorical.from_codes(np.full(rows, -1, dtype=np.int8), categories=pd.Index([], dtype=object))
+    return pd.Categorical.from_codes(np.zeros(rows, dtype=np.int8), categories=[value])
+
+
+def extract_table(file_name, spec, located=None, anchors_folder=None):
+    """
+    Extract a table of a workbook.
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the xlsx or xls file.
+    spec : dict
+        Spec of the table (see load_specs).
+    located : dict
+        Tables already found in each sheet of the workbook (locate_pivot_tables), filled by this call.
+    anchors_folder : String
+        Folder of the anchors of the sheet tables, the folder of the workbook by default.
+
+    Returns
+    -------
+    df : ndarray
+        Columns year_month, uf, product, unit and volume, None when the workbook does not have the table.
+    """
+    anchor = spec.get('anchor', {})
+    dimensions = spec.get('dimensions', {})
+    measures = spec.get('measures', {})
+    if spec['kind'] == 'pivot_cache':
+        number = find_cache(file_name, anchor)
+        caches = list_pivot_cache_streams(file_name) if file_name.lower().endswith('.xls') else list_pivot_caches(file_name)
+        if number is None or not 1 <= number <= len(caches):
+            return None
+        aliases = {**FIELD_ALIASES, **{key: tuple(names) for key, names in {**dimensions, **measures}.items()}}
+        reader = read_pivot_cache_xls if file_name.lower().endswith('.xls') else read_pivot_cache
+        return reader(file_name, number, aliases)
+
+    # Tables month x year of a sheet, found once per sheet
+    if file_name.lower().endswith('.xls'):
+        return None
+    sheet_name = anchor.get('sheet', 'Plan1')
+    located = {} if located is None else located
+    try:
+        if sheet_name not in located:
+            cache_file = os.path.join(anchors_folder, os.path.basename(file_name) + '.json') if anchors_folder else None
+            located[sheet_name] = locate_pivot_tables(file_name, sheet_name, cache_file)
+        frame = find_table(located[sheet_name], anchor['title'])
+    except KeyError:
+        # Workbook without the sheet or without the table
+        return None
+    months, _ = table_frame(frame)
+    months = months[months['volume'].notna()]
+    if 'years' in measures:
+        months = months[months['year'].between(*measures['years'])]
+    rows = len(months)
+    df = pd.DataFrame({
+        'year_month': month_start(months['year'], months['month']),
+        'uf': _constant(dimensions.get('uf'), rows),
+        'product': _constant(dimensions.get('product'), rows),
+        'unit': _constant(dimensions.get('unit'), rows),
+        'volume': months['volume'].to_numpy(dtype=np.float64),
+    })
+    return sort(conform(df)).reset_index(drop=True)
+
+
+def extract_workbook(file_name, specs, anchors_folder=None):
+    """
+    Extract all the tables of the specs from a workbook (task of the process pool).
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the xlsx or xls file.
+    specs : list
+        Specs of the tables.
+    anchors_folder : String
+        Folder of the anchors of the sheet tables.
+
+    Returns
+    -------
+    frames : list
+        Pairs (name of the table, rows) of the tables found.
+    tables : list
+        Metrics of each table: file, table, status (ok, missing or the error), rows and seconds.
+    workbook : dict
+        Metrics of the workbook: file, bytes, tables found, rows and seconds.
+    """
+    source = os.path.basename(file_name)
+    start = time.perf_counter()
+    frames, tables = [], []
+    located = {}
+    for spec in specs:
+        table_start = time.perf_counter()
+        try:
+            df = extract_table(file_name, spec, located, anchors_folder)
+            status = 'ok' if df is not None else 'missing'
+        except Exception as error:
+            # A table that can not be read does not stop the batch, it is reported
+            df, status = None, f'{type(error).__name__}: {error}'
+        if df is not None:
+            frames.append((spec['name'], df))
+        tables.append({'file': source, 'table': spec['name'], 'status': status, 'rows': len(df) if df is not None else 0, 'seconds': time.perf_counter() - table_start})
+    workbook = {
+        'file': source,
+        'bytes': os.path.getsize(file_name),
+        'tables': len(frames),
+        'rows': sum(len(df) for _, df in frames),
+        'seconds': time.perf_counter() - start,
+    }
+    return frames, tables, workbook
+
+
+def consolidate(results, created_at):
+    """
+    Concatenate the tables of all the workbooks, the categoricals are kept
+    (their categories are merged).
+
+    Parameters
+    ----------
+    results : list
+        Result of extract_workbook of each workbook.
+    created_at : Timestamp
+        Date of the processing.
+
+    Returns
+    -------
+    df : ndarray
+        Columns of BATCH_COLUMNS.
+    """
+    frames = []
+    for frames_file, _, workbook in results:
+        for name, df in frames_file:
+            rows = len(df)
+            frames.append(pd.DataFrame({
+                'source': _constant(workbook['file'], rows),
+                'table': _constant(name, rows),
+                **{column: df[column] for column in COLUMNS if column != 'created_at'},
+            }))
+    if not frames:
+        return conform(pd.DataFrame({column: pd.Series(dtype=object) for column in BATCH_COLUMNS if column != 'created_at'}), created_at)[BATCH_COLUMNS]
+    data = {}
+    for column in frames[0].columns:
+        values = [df[column] for df in frames]
+        if isinstance(values[0].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals([value.array for value in values])
+        else:
+            data[column] = np.concatenate([value.to_numpy() for value in values])
+    df = conform(pd.DataFrame(data), created_at)
+    df['source'] = pd.Categorical(df['source'])
+    df['table'] = pd.Categorical(df['table'])
+    return df[BATCH_COLUMNS]
+
+
+def list_workbooks(folder):
+    # Workbooks of the folder in name order, without the lock files of Excel (~$)
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(WORKBOOK_EXTENSIONS) and not name.startswith('~$')
+    )
+
+
+def extract_batch(folder, output, specs=None, workers=None, report=None):
+    """
+    Extract the tables of all the workbooks of a folder in a process pool and
+    write one consolidated dataset. The throughput of each workbook and of each
+    table is printed and, optionally, written to a csv.
+
+    Parameters
+    ----------
+    folder : String
+        Folder of the workbooks (xlsx and xls).
+    output : String
+        Path of the consolidated dataset (csv).
+    specs : list
+        Specs of the tables, the ones of SPECS_FILE by default.
+    workers : int
+        Number of processes, RAIZEN_BATCH_WORKERS (all the cores) by default.
+    report : String
+        Path of the csv of the throughput of each workbook and table.
+
+    Returns
+    -------
+    metrics : ndarray
+        Throughput of each workbook (level file) and of each table (level table).
+    """
+    specs = specs or load_specs()
+    files = list_workbooks(folder)
+    anchors_folder = os.path.join(os.path.dirname(os.path.abspath(output)), ANCHORS_FOLDER)
+    os.makedirs(anchors_folder, exist_ok=True)
+    created_at = processing_time()
+
+    print('********Start - Batch Extract********')
+    start = time.perf_counter()
+    results = []
+    if files:
+        with ProcessPoolExecutor(max_workers=min(workers or BATCH_WORKERS, len(files))) as executor:
+            futures = [executor.submit(extract_workbook, file_name, specs, anchors_folder) for file_name in files]
+            for future in futures:
+                results.append(future.result())
+                _, tables, workbook = results[-1]
+                print(f"{workbook['file']}: {workbook['tables']}/{len(specs)} tables, {workbook['rows']} rows, "
+                      f"{workbook['seconds']:.2f}s ({workbook['bytes'] / 2 ** 20 / workbook['seconds']:.1f} MB/s, {workbook['rows'] / workbook['seconds']:.0f} rows/s)")
+                for table in tables:
+                    print(f"    {table['table']}: {table['status']}, {table['rows']} rows, {table['seconds']:.2f}s ({table['rows'] / table['seconds']:.0f} rows/s)")
+
+    df = consolidate(results, created_at)
+    tmp = output + '.tmp'
+    to_csv(df, tmp, sep=';', index=False)
+    os.replace(tmp, output)
+    elapsed = time.perf_counter() - start
+    print(f'Batch Extract - {len(files)} files, {len(df)} rows in {elapsed:.2f}s ({len(df) / elapsed if elapsed else 0:.0f} rows/s)')
+
+    metrics = pd.DataFrame(
+        [dict(workbook, level='file', table=None, status='ok') for _, _, workbook in results]
+        + [dict(table, level='table') for _, tables, _ in results for table in tables],
+        columns=['level', 'file', 'table', 'status', 'tables', 'bytes', 'rows', 'seconds'],
+    )
+    metrics['rows_per_s'] = metrics['rows'] / metrics['seconds']
+    metrics['mb_per_s'] = metrics['bytes'] / 2 ** 20 / metrics['seconds']
+    if report:
+        metrics.to_csv(report, sep=';', index=False)
+    print('********End - Batch Extract********', end='\n\n')
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', required=True, help='folder of the workbooks')
+    parser.add_argument('--output', help='consolidated dataset, consolidated.csv in the folder by default')
+    parser.add_argument('--specs', default=SPECS_FILE, help='specs of the tables (json)')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help='number of processes')
+    parser.add_argument('--report', help='csv of the throughput of each workbook and table')
+    args = parser.parse_args(argv)
+
+    try:
+        specs = load_specs(args.specs)
+    except (KeyError, ValueError) as error:
+        parser.error(f'Invalid specs file: {error}')
+    extract_batch(args.folder, args.output or os.path.join(args.folder, 'consolidated.csv'), specs, args.workers, args.report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from schema import COLUMNS, conform
+
+# Folder of the columnar (parquet) dataset, partitioned as dataset=<name>/year=<year>
+COLUMNAR_FOLDER = 'columnar'
+
+# Columns of the parquet files, uf, product and unit are dictionary encoded
+SCHEMA = pa.schema([
+    ('year_month', pa.date32()),
+    ('uf', pa.dictionary(pa.int32(), pa.string())),
+    ('product', pa.dictionary(pa.int32(), pa.string())),
+    ('unit', pa.dictionary(pa.int32(), pa.string())),
+    ('volume', pa.float64()),
+    ('created_at', pa.timestamp('s')),
+    ('year', pa.int16()),
+])
+
+# Partition keys, the year is written by write_columnar and the dataset is the folder of each dataset
+PARTITIONING_YEAR = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+PARTITIONING = ds.partitioning(pa.schema([('dataset', pa.string()), ('year', pa.int16())]), flavor='hive')
+
+# Rows of each row group
+ROW_GROUP_SIZE = 1024 * 1024
+
+# Folder of the arrow files exchanged between the tasks, one per dataset
+HANDOFF_FOLDER = 'handoff'
+
+
+def columnar_folder(path, dataset=None):
+    """
+    Folder of the columnar dataset, or of the partitions of one dataset.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    folder : String
+        Path of the folder.
+    """
+    folder = os.path.join(path, COLUMNAR_FOLDER)
+    return os.path.join(folder, f'dataset={dataset}') if dataset else folder
+
+
+def _dictionary(values):
+    # Dictionary array of a label column, the categoricals reuse their codes
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return pa.array(np.asarray(values, dtype=object), type=pa.string(), from_pandas=True).dictionary_encode()
+    codes = values.cat.codes.to_numpy()
+    categories = pa.array([str(label) for label in values.cat.categories], type=pa.string())
+    return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32(), mask=codes < 0), categories)
+
+
+def _seconds(values):
+    # Dates as datetime64[s], the categoricals (created_at) are converted once per category
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.to_datetime(values).to_numpy().astype('datetime64[s]')
+    categories = pd.DatetimeIndex(values.cat.categories).to_numpy().astype('datetime64[s]')
+    # Code -1 (missing) takes the last value, NaT
+    return np.append(categories, np.datetime64('NaT', 's')).take(values.cat.codes.to_numpy())
+
+
+def to_table(df):
+    """
+    Convert a cleaned dataframe to an arrow table with the columnar schema.
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe with the columns year_month, uf, product, unit, volume and created_at.
+
+    Returns
+    -------
+    table : Table
+        Arrow table, with the year partition key.
+    """
+    year_month = pd.to_datetime(df['year_month'])
+    columns = [
+        pa.array(year_month.to_numpy().astype('datetime64[D]')),
+        *[_dictionary(df[column]) for column in ['uf', 'product', 'unit']],
+        pa.array(df['volume'], type=pa.float64(), from_pandas=True),
+        pa.array(_seconds(df['created_at'])),
+        pa.array(year_month.dt.year.to_numpy(), type=pa.int16()),
+    ]
+    return pa.Table.from_arrays(columns, schema=SCHEMA)
+
+
+def to_frame(table):
+    """
+    Convert an arrow table of the columnar schema to a dataframe with the
+    dtypes of the schema (schema.py).
+
+    Parameters
+    ----------
+    table : Table
+        Arrow table.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe, uf, product and unit as categoricals, typed dates and
+        created_at as a categorical (converted once per batch, not once per row).
+    """
+    if 'created_at' in table.column_names:
+        table = table.set_column(table.column_names.index('created_at'), 'created_at', table.column('created_at').dictionary_encode())
+    return conform(table.to_pandas(date_as_object=False, split_blocks=True))
+
+
+def write_columnar(path, dataset, frames, years=None):
+    """
+    Write the cleaned rows of a dataset as parquet files partitioned by year.
+
+    The files are written to a temporary folder and moved in place, readers
+    never see a partition half written.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    frames : list
+        Dataframes (or a single dataframe) with the cleaned rows, in order.
+    years : list
+        Years replaced, the partitions of the other years are kept and the years
+        without rows are deleted. None replaces the whole dataset.
+
+    Returns
+    -------
+    rows : int
+        Number of rows written.
+    """
+    frames = [frames] if isinstance(frames, pd.DataFrame) else frames
+    target = columnar_folder(path, dataset)
+    os.makedirs(columnar_folder(path), exist_ok=True)
+    # Prefix '_' is ignored by the readers of the dataset
+    tmp = tempfile.mkdtemp(prefix='_tmp_', dir=columnar_folder(path))
+    rows = 0
+
+    def batches():
+        nonlocal rows
+        for df in frames:
+            rows += len(df)
+            yield from to_table(df).to_batches()
+
+    try:
+        ds.write_dataset(
+            batches(), tmp, schema=SCHEMA, format='parquet', partitioning=PARTITIONING_YEAR,
+            basename_template='part-{i}.parquet', existing_data_behavior='overwrite_or_ignore',
+            max_rows_per_group=ROW_GROUP_SIZE,
+        )
+        if years is None:
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp, target)
+        else:
+            os.makedirs(target, exist_ok=True)
+            for year in years:
+                partition = os.path.join(target, f'year={int(year)}')
+                shutil.rmtree(partition, ignore_errors=True)
+                if os.path.exists(os.path.join(tmp, f'year={int(year)}')):
+                    os.replace(os.path.join(tmp, f'year={int(year)}'), partition)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return rows
+
+
+def prune_columnar(path, dataset, years):
+    """
+    Delete the year partitions of a dataset that are not in a list of years.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    years : list
+        Years kept.
+    """
+    folder = columnar_folder(path, dataset)
+    if not os.path.isdir(folder):
+        return
+    kept = {f'year={int(year)}' for year in years}
+    for name in os.listdir(folder):
+        if name.startswith('year=') and name not in kept:
+            shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+
+
+def columnar_filter(dataset=None, years=None, ufs=None):
+    """
+    Filter expression of the columnar dataset, the dataset and years prune the
+    partitions and the uf is pushed down to the row groups.
+
+    Parameters
+    ----------
+    dataset : String or list
+        Datasets.
+    years : int or list
+        Years, a pair (first, last) inside a tuple selects a range.
+    ufs : String or list
+        UFs.
+
+    Returns
+    -------
+    expression : Expression
+        Filter, None when there is nothing to filter.
+    """
+    conditions = []
+    if dataset is not None:
+        conditions.append(ds.field('dataset').isin(np.atleast_1d(dataset).tolist()))
+    if isinstance(years, tuple):
+        conditions.append((ds.field('year') >= years[0]) & (ds.field('year') <= years[1]))
+    elif years is not None:
+        conditions.append(ds.field('year').isin(np.atleast_1d(years).tolist()))
+    if ufs is not None:
+        conditions.append(ds.field('uf').isin(np.atleast_1d(ufs).tolist()))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_columnar(path, dataset=None, columns=None, years=None, ufs=None):
+    """
+    Read the columnar dataset, loading only the columns and partitions needed.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String or list
+        Datasets (derivative or diesel), all by default.
+    columns : list
+        Columns, all the columns of the cleaned dataset by default
+        (the partition keys dataset and year may be requested too).
+    years : int, list or tuple
+        Years, a tuple (first, last) selects a range.
+    ufs : String or list
+        UFs.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the dtypes of the schema (to_frame).
+    """
+    columns = columns or COLUMNS
+    dataset_files = ds.dataset(columnar_folder(path), format='parquet', partitioning=PARTITIONING)
+    table = dataset_files.to_table(columns=columns, filter=columnar_filter(dataset, years, ufs))
+    return to_frame(table)
+
+
+def has_columnar(path, dataset):
+    return os.path.isdir(columnar_folder(path, dataset))
+
+
+def handoff_file(path, dataset):
+    """
+    Arrow file of a dataset, exchanged between the tasks.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    file_name : String
+        Path of the file.
+    """
+    return os.path.join(path, HANDOFF_FOLDER, f'{dataset}.arrow')
+
+
+def _dictionaries(dataset_files):
+    """
+    Dictionary of each label column over all the files of a dataset.
+
+    The file format keeps a single dictionary per column, the batches are
+    written with these dictionaries. Only the label columns are scanned.
+
+    Parameters
+    ----------
+    dataset_files : Dataset
+        Parquet files of the dataset.
+
+    Returns
+    -------
+    dictionaries : dict
+        Sorted labels of each dictionary column.
+    """
+    columns = [field.name for field in SCHEMA if pa.types.is_dictionary(field.type)]
+    labels = {column: set() for column in columns}
+    for batch in dataset_files.to_batches(columns=columns, batch_size=ROW_GROUP_SIZE):
+        for column in columns:
+            labels[column].update(batch.column(column).dictionary.to_pylist())
+    return {column: pa.array(sorted(values), type=pa.string()) for column, values in labels.items()}
+
+
+def _recode(batch, dictionaries):
+    # Indexes of the batch into the dictionaries of the file, mapped once per label
+    columns = []
+    for field, values in zip(batch.schema, batch.columns):
+        if field.name in dictionaries:
+            positions = pc.index_in(values.dictionary, value_set=dictionaries[field.name])
+            indices = pc.take(positions, values.indices).cast(pa.int32())
+            values = pa.DictionaryArray.from_arrays(indices, dictionaries[field.name])
+        columns.append(values)
+    return pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+
+def write_handoff(path, dataset):
+    """
+    Write the arrow file of a dataset from its columnar dataset.
+
+    The file is in the arrow IPC format without compression, so the readers
+    map it in memory instead of parsing it. It is replaced atomically.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    rows : int
+        Number of rows written.
+    """
+    file_name = handoff_file(path, dataset)
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    # Parquet stores created_at in milliseconds, the schema casts it back
+    dataset_files = ds.dataset(columnar_folder(path, dataset), schema=SCHEMA, format='parquet', partitioning=PARTITIONING_YEAR)
+    dictionaries = _dictionaries(dataset_files)
+    rows = 0
+    tmp = file_name + '.tmp'
+    with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+        # Batch by batch, the dataset is never loaded whole (chunked mode)
+        for batch in dataset_files.to_batches(batch_size=ROW_GROUP_SIZE):
+            writer.write_batch(_recode(batch, dictionaries))
+            rows += batch.num_rows
+    os.replace(tmp, file_name)
+    return rows
+
+
+def read_handoff(path, dataset, columns=None):
+    """
+    Read the arrow file of a dataset, mapped in memory.
+
+    Only the columns requested are converted, the buffers of the others are
+    never read.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    columns : list
+        Columns, all the columns of the cleaned dataset by default.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the dtypes of the schema (to_frame).
+    """
+    columns = columns or COLUMNS
+    with pa.memory_map(handoff_file(path, dataset)) as source:
+        table = pa.ipc.open_file(source).read_all().select(columns)
+        return to_frame(table)
+
+
+def has_handoff(path, dataset):
+    return os.path.exists(handoff_file(path, dataset))
+
+
+def handoff_rows(path, dataset):
+    """
+    Number of rows of the arrow file of a dataset, read from the mapped file
+    without converting it.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    rows : int
+        Number of rows.
+    """
+    with pa.memory_map(handoff_file(path, dataset)) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
@@ -0,0 +1,340 @@
+import os
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from columnar import read_handoff, handoff_file
+
+# Folder of the cubes, one per dataset (<dataset>.npy and <dataset>.json)
+CUBE_FOLDER = 'cube'
+
+# Volumes are stored in thousandths of m3 (integers), the sums are exact
+SCALE = 1000
+
+# Layers of the cube
+LAYERS = ['volume', 'rows']
+
+# Keys of the groups of aggregate
+GROUP_KEYS = ['product', 'uf', 'year', 'month']
+
+
+def cube_files(path, dataset):
+    """
+    Files of the cube of a dataset.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    files : tuple
+        Paths of the array (.npy) and of the metadata (.json).
+    """
+    prefix = os.path.join(path, CUBE_FOLDER, dataset)
+    return prefix + '.npy', prefix + '.json'
+
+
+def _source(path, dataset):
+    # Signature of the arrow file the cube is built from
+    stat = os.stat(handoff_file(path, dataset))
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_cube(df):
+    """
+    Build the summed-area table of the volumes by product x uf x month.
+
+    sums[layer, p, u, t] is the sum of the cells of the products < p, the
+    ufs < u and the months < t, so the sum of any box of products, ufs and
+    months is read with 8 lookups.
+
+    Parameters
+    ----------
+    df : ndarray
+        Cleaned dataset with the columns year_month, uf, product and volume.
+
+    Returns
+    -------
+    sums : ndarray
+        Array int64 (layer, product + 1, uf + 1, month + 1), layers volume
+        (thousandths of m3) and rows.
+    metadata : dict
+        Products, ufs and first month (YYYY-MM) of the axes.
+    """
+    year_month = pd.DatetimeIndex(df['year_month'])
+    months = year_month.year.to_numpy() * 12 + year_month.month.to_numpy() - 1
+    first = int(months.min()) if len(months) else 0
+    products = pd.Categorical(df['product'].astype(str))
+    ufs = pd.Categorical(df['uf'].astype(str))
+    shape = (len(products.categories), len(ufs.categories), int(months.max()) - first + 1 if len(months) else 0)
+
+    # Cells by flat index, volumes as integers before the sums
+    cells = (products.codes.astype(np.int64) * shape[1] + ufs.codes) * shape[2] + (months - first)
+    volume = np.rint(df['volume'].to_numpy(dtype=float) * SCALE)
+    size = int(np.prod(shape))
+    cube = np.stack([
+        np.rint(np.bincount(cells, weights=volume, minlength=size)).astype(np.int64).reshape(shape),
+        np.bincount(cells, minlength=size).astype(np.int64).reshape(shape),
+    ])
+    sums = np.zeros((2, shape[0] + 1, shape[1] + 1, shape[2] + 1), dtype=np.int64)
+    sums[:, 1:, 1:, 1:] = cube.cumsum(axis=1).cumsum(axis=2).cumsum(axis=3)
+    metadata = {
+        'products': list(products.categories),
+        'ufs': list(ufs.categories),
+        'first_month': f'{first // 12:04d}-{first % 12 + 1:02d}',
+        'months': shape[2],
+        'scale': SCALE,
+        'layers': LAYERS,
+    }
+    return sums, metadata
+
+
+def write_cube(path, dataset):
+    """
+    Build the cube of a dataset from its arrow file, skipped when the cube is
+    already built from the current arrow file.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    built : bool
+        False when the cube was current.
+    """
+    file_array, file_metadata = cube_files(path, dataset)
+    source = _source(path, dataset)
+    try:
+        with open(file_metadata, encoding='utf-8') as fp:
+            if json.load(fp).get('source') == source and os.path.exists(file_array):
+                return False
+    except (FileNotFoundError, ValueError):
+        pass
+    os.makedirs(os.path.dirname(file_array), exist_ok=True)
+    sums, metadata = build_cube(read_handoff(path, dataset, ['year_month', 'uf', 'product', 'volume']))
+    metadata.update(dataset=dataset, source=source)
+    # The array is replaced before the metadata, a reader never sees a newer signature with an older array
+    with open(file_array + '.tmp', 'wb') as fp:
+        np.save(fp, sums)
+    os.replace(file_array + '.tmp', file_array)
+    with open(file_metadata + '.tmp', 'w', encoding='utf-8') as fp:
+        json.dump(metadata, fp, indent=2, ensure_ascii=False)
+    os.replace(file_metadata + '.tmp', file_metadata)
+    return True
+
+
+def load_cube(path, dataset):
+    """
+    Load the cube of a dataset, the array is mapped in memory.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    cube : VolumeCube
+        Cube.
+    """
+    file_array, file_metadata = cube_files(path, dataset)
+    with open(file_metadata, encoding='utf-8') as fp:
+        metadata = json.load(fp)
+    return VolumeCube(np.load(file_array, mmap_mode='r'), metadata)
+
+
+def _month_number(value):
+    # Months since year 0 of a YYYY-MM string, date or timestamp
+    if isinstance(value, str):
+        value = datetime.strptime(value[:7], '%Y-%m')
+    elif not isinstance(value, (date, datetime)):
+        value = pd.Timestamp(value)
+    return value.year * 12 + value.month - 1
+
+
+class VolumeCube:
+    """
+    Range aggregates of a dataset read from its summed-area table.
+
+    Parameters
+    ----------
+    sums : ndarray
+        Summed-area table (see build_cube).
+    metadata : dict
+        Axes of the cube.
+    """
+
+    def __init__(self, sums, metadata):
+        self.sums = sums
+        self.metadata = metadata
+        self.products = metadata['products']
+        self.ufs = metadata['ufs']
+        self.first = _month_number(metadata['first_month'])
+        self.months = metadata['months']
+        self.scale = metadata['scale']
+        self.positions_products = {label: i for i, label in enumerate(self.products)}
+        self.positions_ufs = {label: i for i, label in enumerate(self.ufs)}
+
+    def _runs(self, positions, selected):
+        # Starts and ends of the runs of consecutive positions of the selected labels, all the labels by default
+        if selected is None:
+            return np.array([0]), np.array([len(positions)])
+        indexes = []
+        for label in np.atleast_1d(selected).tolist():
+            if label not in positions:
+                raise KeyError(f'Not in the cube: {label}')
+            indexes.append(positions[label])
+        indexes = np.unique(indexes)
+        breaks = np.flatnonzero(np.diff(indexes) != 1) + 1
+        return indexes[np.r_[0, breaks]], indexes[np.r_[breaks - 1, len(indexes) - 1]] + 1
+
+    def _groups(self, positions, labels, selected, grouped):
+        # Starts, ends and labels of the groups of an axis, the runs of the selection when it is not grouped
+        if not grouped:
+            starts, ends = self._runs(positions, selected)
+            return starts, ends, None
+        if selected is None:
+            indexes = np.arange(len(labels))
+        else:
+            starts, ends = self._runs(positions, selected)
+            indexes = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        return indexes, indexes + 1, [labels[i] for i in indexes]
+
+    def _position(self, value, offset=0):
+        # Position of a month on the time axis, clipped to the cube
+        return min(max(_month_number(value) - self.first + offset, 0), self.months)
+
+    def _box(self, p0, p1, u0, u1, t0, t1):
+        # Sums of the boxes by inclusion-exclusion of the 8 corners (the runs are broadcast)
+        s = self.sums
+        return (s[:, p1, u1, t1] - s[:, p0, u1, t1] - s[:, p1, u0, t1] - s[:, p1, u1, t0]
+                + s[:, p0, u0, t1] + s[:, p0, u1, t0] + s[:, p1, u0, t0] - s[:, p0, u0, t0])
+
+    def query(self, products=None, ufs=None, start=None, end=None):
+        """
+        Volume and rows of a range of months, for some products and ufs.
+
+        Parameters
+        ----------
+        products : String or list
+            Products, all by default.
+        ufs : String or list
+            UFs, all by default.
+        start : String
+            First month (YYYY-MM, date or timestamp), the first of the cube by default.
+        end : String
+            Last month (included), the last of the cube by default.
+
+        Returns
+        -------
+        volume : float
+            Sum of the volumes (m3).
+        rows : int
+            Number of rows of the dataset summed.
+        """
+        t0 = 0 if start is None else self._position(start)
+        t1 = self.months if end is None else self._position(end, 1)
+        p0, p1 = self._runs(self.positions_products, products)
+        u0, u1 = self._runs(self.positions_ufs, ufs)
+        if t1 <= t0:
+            return 0.0, 0
+        total = self._box(p0[:, None], p1[:, None], u0[None, :], u1[None, :], t0, t1).sum(axis=(1, 2))
+        return int(total[0]) / self.scale, int(total[1])
+
+    def aggregate(self, products=None, ufs=None, start=None, end=None, by=()):
+        """
+        Volume and rows of a range of months grouped by product, uf, year or
+        month, a box of the summed-area table per group.
+
+        Parameters
+        ----------
+        products : String or list
+            Products, all by default.
+        ufs : String or list
+            UFs, all by default.
+        start : String
+            First month (YYYY-MM, date or timestamp), the first of the cube by default.
+        end : String
+            Last month (included), the last of the cube by default.
+        by : list
+            Keys of the groups (product, uf, year, month), a single group by default.
+
+        Returns
+        -------
+        df : ndarray
+            Dataframe with the keys, volume and rows, groups without rows are dropped.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = set(by) - set(GROUP_KEYS)
+        if unknown:
+            raise ValueError(f'Unknown group keys: {sorted(unknown)}')
+        p0, p1, labels_products = self._groups(self.positions_products, self.products, products, 'product' in by)
+        u0, u1, labels_ufs = self._groups(self.positions_ufs, self.ufs, ufs, 'uf' in by)
+        t0 = 0 if start is None else self._position(start)
+        t1 = self.months if end is None else self._position(end, 1)
+        columns = [key for key in GROUP_KEYS if key in by]
+        if t1 <= t0:
+            return pd.DataFrame(columns=columns + ['volume', 'rows'])
+
+        # Months split at each month or at the first month of each year
+        if 'month' in by:
+            edges = np.arange(t0, t1 + 1)
+        elif 'year' in by:
+            edges = np.unique(np.r_[t0, np.arange(t0 + (-(self.first + t0)) % 12, t1, 12), t1])
+        else:
+            edges = np.array([t0, t1])
+        sums = self._box(p0[:, None, None], p1[:, None, None], u0[None, :, None], u1[None, :, None], edges[None, None, :-1], edges[None, None, 1:])
+        # Runs of the axes not grouped are summed
+        grouped = ['product' in by, 'uf' in by, 'year' in by or 'month' in by]
+        axes = tuple(axis + 1 for axis in range(3) if not grouped[axis])
+        sums = sums.sum(axis=axes, keepdims=True)
+
+        months = self.first + edges[:-1]
+        keys = {
+            'product': labels_products,
+            'uf': labels_ufs,
+            'year': (months // 12).tolist(),
+            'month': [f'{month // 12:04d}-{month % 12 + 1:02d}' for month in months],
+        }
+        grid = np.meshgrid(*[np.arange(size) for size in sums.shape[1:]], indexing='ij')
+        axis_keys = {'product': 0, 'uf': 1, 'year': 2, 'month': 2}
+        df = pd.DataFrame({key: np.asarray(keys[key], dtype=object)[grid[axis_keys[key]].ravel()] for key in columns})
+        df['volume'] = sums[0].ravel() / self.scale
+        df['rows'] = sums[1].ravel()
+        return df[df['rows'] > 0].reset_index(drop=True)
+
+    def total(self, products=None, ufs=None, start=None, end=None):
+        """
+        Sum of the volumes of a range of months (see query).
+        """
+        return self.query(products, ufs, start, end)[0]
+
+    def totals(self, products=None, ufs=None):
+        """
+        Volume by year, for some products and ufs.
+
+        Parameters
+        ----------
+        products : String or list
+            Products, all by default.
+        ufs : String or list
+            UFs, all by default.
+
+        Returns
+        -------
+        df : ndarray
+            Dataframe with the columns year, volume and rows.
+        """
+        return self.aggregate(products, ufs, by=['year'])
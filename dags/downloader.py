@@ -0,0 +1,434 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Manifest with the checksum and the validators of each downloaded file
+MANIFEST = 'manifest.json'
+
+# Size of the blocks streamed to disk
+BLOCK_SIZE = 1024 * 1024
+
+# Redirects followed by a request (e.g. github.com to raw.githubusercontent.com)
+MAX_REDIRECTS = 5
+
+# Status of the redirects
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class DownloadError(Exception):
+    """
+    Raised when a file could not be downloaded after all the attempts.
+    """
+
+
+def file_sha256(path):
+    """
+    Checksum of a file.
+
+    Parameters
+    ----------
+    path : String
+        Path of the file.
+
+    Returns
+    -------
+    checksum : String
+        Sha256 hex digest, None when the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    """
+    Load the manifest of the downloaded files.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the files.
+
+    Returns
+    -------
+    manifest : dict
+        Entry of each file by name.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    """
+    Save the manifest atomically.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the files.
+    manifest : dict
+        Entry of each file by name.
+    """
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+class Connections:
+    """
+    Pool of keep-alive connections by host, shared by the download threads: a
+    request takes an idle connection of its host (or opens one) and gives it
+    back once the response is read, so the next requests to the same host
+    (other sources, redirects, retries) reuse the TCP and TLS connection.
+    Requests through a proxy (http_proxy/https_proxy) use urlopen.
+
+    Parameters
+    ----------
+    timeout : int
+        Timeout in seconds of the connection and of each read.
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _request(self, parts, headers):
+        key = (parts.scheme, parts.netloc)
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        with self.lock:
+            connection = self.idle[key].pop() if self.idle.get(key) else None
+        if connection is not None:
+            try:
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                response.connection = connection
+                return response
+            except (http.client.HTTPException, OSError):
+                # The server closed the idle connection, the request is sent again on a new one
+                connection.close()
+        factory = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        connection = factory(parts.netloc, timeout=self.timeout)
+        try:
+            connection.request('GET', target, headers=headers)
+            response = connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+        response.connection = connection
+        return response
+
+    def open(self, url, headers):
+        """
+        GET request, following the redirects.
+
+        Parameters
+        ----------
+        url : String
+            Url of the file.
+        headers : dict
+            Headers of the request.
+
+        Returns
+        -------
+        response : HTTPResponse
+            Response 200 or 206, given back with release once read.
+
+        Raises
+        ------
+        HTTPError
+            Other status (e.g. 304 or 404), like urlopen.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if urllib.request.getproxies().get(parts.scheme) and not urllib.request.proxy_bypass(parts.hostname):
+            return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout)
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._request(urllib.parse.urlsplit(url), headers)
+            response.url = url
+            if response.status in (200, 206):
+                return response
+            # The body is read, the connection goes back to the pool
+            response.read()
+            self.release(response)
+            if response.status in REDIRECTS and response.headers.get('Location'):
+                url = urllib.parse.urljoin(url, response.headers['Location'])
+                continue
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        raise urllib.error.HTTPError(url, response.status, 'Too many redirects', response.headers, None)
+
+    def release(self, response, reusable=True):
+        """
+        Give back the connection of a response.
+
+        Parameters
+        ----------
+        response : HTTPResponse
+            Response of open.
+        reusable : bool
+            False when the response was not read to the end, the connection is closed.
+        """
+        connection = getattr(response, 'connection', None)
+        if connection is None:
+            return
+        response.close()
+        if not reusable or connection.sock is None:
+            connection.close()
+            return
+        parts = urllib.parse.urlsplit(response.url)
+        with self.lock:
+            self.idle.setdefault((parts.scheme, parts.netloc), []).append(connection)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp)
+
+
+def fetch(url, destination, entry=None, timeout=60, connections=None):
+    """
+    Download a single file.
+
+    The request is conditional (If-None-Match/If-Modified-Since) when the local
+    file still matches the manifest, a partial download (.part) is resumed with
+    a Range request and the file is streamed to the .part file and renamed when
+    complete.
+
+    Parameters
+    ----------
+    url : String
+        Url of the file.
+    destination : String
+        Path of the file.
+    entry : dict
+        Manifest entry of the file from the previous download.
+    timeout : int
+        Timeout in seconds of the connection and of each read.
+    connections : Connections
+        Pool of the connections, the connections of the request are closed at the end by default.
+
+    Returns
+    -------
+    entry : dict
+        New manifest entry, with status 'not_modified', 'downloaded' or 'resumed'.
+    """
+    if connections is None:
+        connections = Connections(timeout)
+        try:
+            return fetch(url, destination, entry, timeout, connections)
+        finally:
+            connections.close()
+    entry = entry or {}
+    part = destination + '.part'
+    part_info = part + '.json'
+    headers = {'User-Agent': 'raizen-etl'}
+
+    # Conditional request only if the local file is the one of the manifest
+    local_valid = entry.get('sha256') is not None and file_sha256(destination) == entry['sha256']
+    if local_valid:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    # Resume a partial download of the same version
+    offset = 0
+    validators = _read_json(part_info)
+    if os.path.exists(part) and (validators.get('etag') or validators.get('last_modified')):
+        offset = os.path.getsize(part)
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = validators.get('etag') or validators.get('last_modified')
+        # A full response may come instead of 304, avoid the conditional headers
+        headers.pop('If-None-Match', None)
+        headers.pop('If-Modified-Since', None)
+
+    try:
+        response = connections.open(url, headers)
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return dict(entry, status='not_modified', checked_at=datetime.now().isoformat(timespec='seconds'))
+        if error.code == 416 and offset:
+            # Range not satisfiable, the partial file is discarded
+            os.remove(part)
+            os.remove(part_info)
+        raise
+
+    try:
+        with response:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            resumed = response.status == 206
+            if not resumed:
+                offset = 0
+            _write_json(part_info, {'etag': etag, 'last_modified': last_modified})
+
+            # Stream to the partial file
+            digest = hashlib.sha256()
+            if resumed:
+                with open(part, 'rb') as fp:
+                    for block in iter(lambda: fp.read(BLOCK_SIZE), b''):
+                        digest.update(block)
+            expected = response.headers.get('Content-Length')
+            received = 0
+            with open(part, 'ab' if resumed else 'wb') as fp:
+                for block in iter(lambda: response.read(BLOCK_SIZE), b''):
+                    fp.write(block)
+                    digest.update(block)
+                    received += len(block)
+                fp.flush()
+                os.fsync(fp.fileno())
+            if expected is not None and received != int(expected):
+                raise DownloadError(f'Incomplete download of {url}: {received} of {expected} bytes')
+    except BaseException:
+        # Response not read to the end, its connection can not be reused
+        connections.release(response, reusable=False)
+        raise
+    connections.release(response)
+
+    # Complete file replaces the previous version
+    os.replace(part, destination)
+    os.remove(part_info)
+    return {
+        'url': url,
+        'sha256': digest.hexdigest(),
+        'size': os.path.getsize(destination),
+        'etag': etag,
+        'last_modified': last_modified,
+        'downloaded_at': datetime.now().isoformat(timespec='seconds'),
+        'status': 'resumed' if resumed else 'downloaded',
+    }
+
+
+def fetch_with_retry(url, destination, entry=None, timeout=60, retries=3, backoff=2.0, connections=None):
+    """
+    Download a file retrying on network and server errors, each attempt
+    resumes from the data already received.
+
+    Parameters
+    ----------
+    url : String
+        Url of the file.
+    destination : String
+        Path of the file.
+    entry : dict
+        Manifest entry of the file from the previous download.
+    timeout : int
+        Timeout in seconds.
+    retries : int
+        Number of attempts.
+    backoff : float
+        Wait before the second attempt, doubled at each attempt.
+    connections : Connections
+        Pool of the connections, shared by the attempts by default.
+
+    Returns
+    -------
+    entry : dict
+        New manifest entry.
+    """
+    if connections is None:
+        connections = Connections(timeout)
+        try:
+            return fetch_with_retry(url, destination, entry, timeout, retries, backoff, connections)
+        finally:
+            connections.close()
+    for attempt in range(1, retries + 1):
+        try:
+            return fetch(url, destination, entry, timeout, connections)
+        except urllib.error.HTTPError as error:
+            # Client errors are not retried
+            if 400 <= error.code < 500 and error.code not in (408, 416, 429):
+                raise DownloadError(f'{url}: HTTP {error.code}') from error
+            last_error = error
+        except (urllib.error.URLError, http.client.HTTPException, OSError, DownloadError) as error:
+            last_error = error
+        if attempt < retries:
+            time.sleep(backoff * 2 ** (attempt - 1))
+    raise DownloadError(f'{url}: {last_error}') from last_error
+
+
+def download_files(sources, path, workers=3, timeout=60, retries=3):
+    """
+    Download the sources concurrently, files that did not change are not downloaded again.
+    The threads share a pool of keep-alive connections by host (Connections).
+
+    Parameters
+    ----------
+    sources : dict
+        Url of each file by file name.
+    path : String
+        Folder of the files.
+    workers : int
+        Number of concurrent downloads.
+    timeout : int
+        Timeout in seconds.
+    retries : int
+        Number of attempts of each file.
+
+    Returns
+    -------
+    results : dict
+        Manifest entry of each file, with the status of this run.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = load_manifest(path)
+    lock = threading.Lock()
+    errors = {}
+    connections = Connections(timeout)
+
+    def download(name):
+        try:
+            entry = fetch_with_retry(sources[name], os.path.join(path, name), manifest.get(name), timeout, retries, connections=connections)
+        except DownloadError as error:
+            errors[name] = error
+            return
+        with lock, open(os.path.join(path, MANIFEST + '.lock'), 'w') as lock_file:
+            # Other tasks may update the manifest at the same time
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            current = load_manifest(path)
+            current[name] = manifest[name] = entry
+            save_manifest(path, current)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(download, sources))
+    finally:
+        connections.close()
+
+    if errors:
+        raise DownloadError('; '.join(f'{name}: {error}' for name, error in errors.items()))
+    return {name: manifest[name] for name in sources}
@@ -0,0 +1,122 @@
+import os
+import csv
+import heapq
+import shutil
+import tempfile
+
+from schema import to_csv
+
+# Maximum number of runs merged at the same time
+MERGE_FAN_IN = 64
+
+
+def sort_key(columns):
+    """
+    Build the sort key of a csv row, empty values are sorted last as pandas does with NaN.
+
+    Parameters
+    ----------
+    columns : list
+        Position of the sort columns in the row.
+
+    Returns
+    -------
+    key : function
+        Function row -> key.
+    """
+    def key(row):
+        return tuple((row[i] == '', row[i]) for i in columns)
+    return key
+
+
+class RunWriter:
+    """
+    Spill sorted chunks of a dataframe to run files of an external merge sort.
+
+    Parameters
+    ----------
+    folder : String
+        Folder where the temporary runs are created.
+    """
+
+    def __init__(self, folder=None):
+        self.folder = tempfile.mkdtemp(prefix='runs_', dir=folder)
+        self.runs = []
+
+    def write(self, df):
+        """
+        Write an already sorted dataframe as a new run.
+
+        Parameters
+        ----------
+        df : ndarray
+            Sorted dataframe.
+        """
+        run = os.path.join(self.folder, f'run_{len(self.runs):06d}.csv')
+        to_csv(df, run, sep=';', index=False, header=False)
+        self.runs.append(run)
+
+    def cleanup(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def _iter_rows(run):
+    with open(run, newline='', encoding='utf-8') as fp:
+        yield from csv.reader(fp, delimiter=';')
+
+
+def _merge(runs, fp, key):
+    writer = csv.writer(fp, delimiter=';', lineterminator=os.linesep)
+    # heapq.merge is stable, rows with the same key keep the order of the runs
+    writer.writerows(heapq.merge(*[_iter_rows(run) for run in runs], key=key))
+
+
+def merge_runs(runs, output, header, key, fan_in=MERGE_FAN_IN):
+    """
+    Merge sorted runs into a single sorted csv file.
+
+    Parameters
+    ----------
+    runs : list
+        Paths of the sorted runs, in input order.
+    output : String
+        Path of the output csv (written to a temporary file and renamed).
+    header : list
+        Column names.
+    key : function
+        Sort key of a row (see sort_key).
+    fan_in : int
+        Maximum number of runs opened at the same time.
+
+    Returns
+    -------
+    output : String
+        Path of the output csv.
+    """
+    runs = list(runs)
+    folder = os.path.dirname(os.path.abspath(output))
+    temporary = []
+    try:
+        # Intermediate passes while there are more runs than the fan-in
+        while len(runs) > fan_in:
+            merged = []
+            for i in range(0, len(runs), fan_in):
+                fd, run = tempfile.mkstemp(prefix='merge_', suffix='.csv', dir=folder)
+                with os.fdopen(fd, 'w', newline='', encoding='utf-8') as fp:
+                    _merge(runs[i:i + fan_in], fp, key)
+                temporary.append(run)
+                merged.append(run)
+            runs = merged
+
+        # Final pass
+        fd, tmp_output = tempfile.mkstemp(prefix='merge_', suffix='.csv', dir=folder)
+        temporary.append(tmp_output)
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as fp:
+            csv.writer(fp, delimiter=';', lineterminator=os.linesep).writerow(header)
+            _merge(runs, fp, key)
+        os.replace(tmp_output, output)
+    finally:
+        for run in temporary:
+            if os.path.exists(run):
+                os.remove(run)
+    return output
@@ -1,376 +1,1266 @@
-import os
-import urllib.request
-import pandas as pd
-import numpy as np
-
-from openpyxl import Workbook, load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from datetime import datetime 
-
-def _download_datasets():
-    """
-    The federal government makes available a set of public datasets, including those that will be part of this analysis.
-    Link: https://dados.gov.br/dataset
-
-    
-    The datasets that are part of this analysis can be found in the links below::   
-        -> https://dados.gov.br/dataset/vendas-de-derivados-de-petroleo-e-biocombustiveis/resource/c3d6e0b4-f86e-48f8-9325-6cc0d434b33f
-        -> https://dados.gov.br/dataset/vendas-de-derivados-de-petroleo-e-biocombustiveis/resource/2429fdeb-df86-4e63-b248-2038f6c3e3cc
-    """ 
-        
-    # Download Files
-    try:
-        # Path the storage 
-        path = os.path.dirname(os.path.abspath(__file__)) + '/dados/'
-        
-        # Create paht case not exist
-        if not os.path.exists(path):
-            os.makedirs(path)
-
-        print('********Start - Download Datasets********')
-        # Link reference            
-        link_ref = 'https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-abertos/arquivos/vdpb'
-        
-        # Download - Sales of oil derivative fuels by UF and product        
-        url = f'{link_ref}/vendas-derivados-petroleo-e-etanol/vendas-derivados-petroleo-etanol-m3-1990-2022.csv'
-        urllib.request.urlretrieve(url, path + "dataset_derivative.csv")
-        print("Download successful - Derivative Fuels")  
-
-        # Download - Sales of oil derivative fuels by UF and product        
-        url = f'{link_ref}/vct/vendas-oleo-diesel-tipo-m3-2013-2022.csv'
-        urllib.request.urlretrieve(url, path + "dataset_diesel.csv")
-        print("Download successful - Diesel")          
-        print('********End - Download Datasets********', end='\n\n')
-    except:
-        print("Download Dataset failed")
-        print('********End - Download Datasets********', end='\n\n')
-
-def _download_data_pivot():
-    """
-    Analysis file (pivoted data)
-        File provided by Raizen
-        -> https://github.com/raizen-analytics/data-engineering-test/raw/master/assets/vendas-combustiveis-m3.xls
-        File provided by Federal government
-        XLX
-            -> https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls
-        XLSX
-        -> https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls/view
-            -> permite baixar o xlsx através do link :
-            https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls/@@download/file/vendas-combustiveis-m3.xlsx
-    """
-    try:
-        # Path the storage 
-        path = os.path.dirname(os.path.abspath(__file__)) + '/dados/'
-        print('********Start - Download Pivot********')
-        # Download - Sales of oil derivative fuels by UF and product        
-        url = 'https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls/@@download/file/vendas-combustiveis-m3.xlsx'
-        urllib.request.urlretrieve(url, path + "vendas-combustiveis-m3.xlsx")
-    
-        print("Download successful - Data Pivot") 
-        print('********End - Download Pivot********', end='\n\n')
-    except:
-        print("Download Dataset failed")
-        print('********End - Download Pivot********', end='\n\n')
-
-
-def formated_year_month(year, month):
-    """
-    Format field year_month	date
-
-    Parameters
-    ----------
-    year : String
-        Year extraction from pivot table.
-    month : String
-        Month extraction from pivot table.
-        
-    Returns
-    -------
-    date : String
-        Returns returns the date according to the past period.
-    """  
-    month_name = {
-        'JAN':1,
-        'FEV':2,
-        'MAR':3,
-        'ABR':4,
-        'MAI':5,
-        'JUN':6,
-        'JUL':7,
-        'AGO':8,
-        'SET':9,
-        'OUT':10,
-        'NOV':11,
-        'DEZ':12        
-    }
-    date = datetime(int(year), month_name[month], 1)
-    #date = f'{str(year)}_{str(month_name[month])}'
-    return date
-
-def trim_all_columns(dataframe):
-    """
-    Trim whitespace from ends of each value across all series in dataframe
-    
-    Parameters
-    ----------
-    dataframe : array
-        Data extracted from excel file.            
-        
-    Returns:
-    --------
-        Dataframe Cleaning
-    """
-
-    trim_strings = lambda x: x.strip() if isinstance(x, str) else x
-    return dataframe.applymap(trim_strings)
-
-def get_total_pivot(df):
-    """
-    Calculates the pivot total.
-
-    Parameters
-    ----------
-    df : ndarray
-        Data Frame.
-
-    Returns
-    -------
-    df : ndarray
-        Returns a dataframe with the consolidated total by year.
-    """         
-    # Filter row with values total
-    df = df.query("Mês == 'Total do Ano'")   
-    # It's used to create a specific format of the DataFrame object where one or more columns work as identifiers.
-    df = df.melt(id_vars=["Mês"], var_name="year_total", value_name="volume_total")
-    df['year_total'] = df['year_total'].astype(int)
-    # Value format
-    df['volume_total'] = df['volume_total'].apply(lambda x:  "{:.2f}".format(x))     
-    # sorting dataframe
-    df = df.sort_values(by=['year_total'])
-    # Drop columns    
-    df = df.drop(columns=['Mês']);
-    
-    return df
-
-def get_total_dataframe(df):
-    """
-    Calculates the dataframe total.
-
-    Parameters
-    ----------
-    df : ndarray
-        Data Frame.
-
-    Returns
-    -------
-    df : ndarray
-        Returns a dataframe with the consolidated total by year.
-    """      
-    # Drop columns
-    df = df.drop(columns=['uf','product','unit','created_at']);
-    # It's used to create a specific format of the DataFrame object where one or more columns work as identifiers.
-    df = df.melt(id_vars=["year_month"], var_name="vol", value_name="volume_df")
-    # Get year
-    df['year_df'] = df['year_month'].apply(lambda x: x[:4]).astype(int)
-    # Drop columns
-    df = df.drop(columns=['vol', 'year_month']);
-    # Group by year and sum column volume
-    df = df.groupby(['year_df'])['volume_df'].sum().reset_index()
-    # Value format
-    df['volume_df'] = df['volume_df'].apply(lambda x:  "{:.2f}".format(x))  
-    return df
-
-def clean_dataframe(file_name, start_period):
-    """
-    Clean up the dataframe and name the columns.
-
-    Parameters
-    ----------
-    df : ndarray
-        Dataframe.
-    start_period: int
-        Period you want to return from the dataset.   
-
-    Returns
-    -------
-    df : ndarray
-        Dataframe.
-    """  
-    # Path dataset
-    path = os.path.dirname(os.path.abspath(__file__)) + '/dados/' + file_name + '.csv'
-    
-    print('********Start - Data Clean********')
-    # Mount dataframe
-    df = pd.read_csv(
-        path,
-        index_col=None,
-        delimiter=';'
-    )
-    # Set titles columns
-    header_df = ['year', 'month', 'region', 'uf', 'product', 'volume']
-    df.columns = header_df
-    
-    # sorting dataframe
-    df = df.sort_values(by=['year', 'month', 'uf', 'product'])
-
-    # Filter Period
-    df = df.where(df['year']>=int(start_period))
-        
-    # Data cleaning        
-    print(f'Data Clean - {file_name.upper()}')
-    df = df.dropna(how='all')
-    df = df.fillna(np.nan).replace([np.nan], [None])
-    df = trim_all_columns(df)
-    
-    # Data transformation
-    df['year_month'] = df.apply(lambda x: formated_year_month(int(x['year']), x['month']), axis=1)
-    df['unit'] = 'm3'
-    df['volume'] = df['volume'].str.replace(',', '.').apply(lambda x: float(x))
-    df['created_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %X')
-    
-    # Drop columns    
-    df = df.drop(columns=['year','month', 'region']);
-
-    # Reordering columns
-    df = df[['year_month', 'uf', 'product', 'unit', 'volume', 'created_at']]
-    # Order by columns
-    df = df.sort_values(by=['year_month', 'uf', 'product'])
-    
-    # File csv
-    df.to_csv(path, sep = ';', index=False)
-    print(f'Generated dataset - {file_name.upper()}')
-    
-    print('********End - Data Clean********', end='\n\n')
-    return df
-
-def _clean_file():
-    """
-    This function is intended to carry out the cleaning process of downloaded datasets.
-    """  
-    clean_dataframe('dataset_derivative', 2000)
-    clean_dataframe('dataset_diesel', 2013)
-
-def _generation_file():
-    """
-    This function generates the final file with the result of the extracted datasets in addition to consolidating these datasets.
-    """
-    
-    # Paths files
-    path = os.path.dirname(os.path.abspath(__file__)) + '/dados/'
-    file_derivative = path + 'dataset_derivative.csv'
-    file_diesel = path + 'dataset_diesel.csv'
-    file_final = path + 'data_extracted.xlsx'
-    
-    df_deravative = pd.read_csv(file_derivative,delimiter=';')
-    df_diesel = pd.read_csv(file_diesel,delimiter=';')
-    df_final = pd.concat([df_deravative, df_diesel], ignore_index=True, sort=False)
-    wb = Workbook()
-    
-    print('********Start - Create File Final********')
-    
-    # Insert row derivative
-    ws1 = wb.create_sheet('DERIVATIVES',0)
-    for row in dataframe_to_rows(df_deravative, index = False):
-        ws1.append(row)
-    print('Create Sheet - DERIVATIVES')
-           
-    # Insert row diesel
-    ws2 = wb.create_sheet('DIESEL',1)
-    for row in dataframe_to_rows(df_diesel, index = False):
-        ws2.append(row)
-    print('Create Sheet - DIESEL')        
-        
-    # Insert row final
-    ws3 = wb.create_sheet('DERIVATIVES_DISEL_FINAL',2)
-    for row in dataframe_to_rows(df_final, index = False):
-        ws3.append(row)
-    print('Create Sheet - DERIVATIVES_DISEL_FINAL')           
-    
-    # Remove existing sheet template
-    wb.remove(wb['Sheet'])
-    
-    # Save file final
-    wb.save(file_final)      
-    print('********End - Create File Final********', end='\n\n')
-
-
-def _check_results():
-    """
-    This function checks if the result extracted from the datasets match the data in the pivoted file.
-    """
-    print('********Start - Check Result********')
-    # Paths files
-    path = os.path.dirname(os.path.abspath(__file__)) + '/dados/'
-    file_derivative = path + 'dataset_derivative.csv'
-    file_diesel = path + 'dataset_diesel.csv'
-    file_pivot = path + 'vendas-combustiveis-m3.xlsx'
-    file_result = path + 'data_extracted.xlsx'
-    
-    # Load file final
-    wb = load_workbook(filename = file_result)
-    
-    
-    # Compare total Derivative x Pivot
-    # Extract cvs Derivative
-    df_deravative = pd.read_csv(file_derivative,delimiter=';')
-    
-    # Extract pivot derivative
-    df_pivot_derivative = pd.read_excel(
-                    io=file_pivot,
-                    sheet_name="Plan1",
-                    index_col=None,
-                    header=52,
-                    nrows = 13,
-                    na_values=["NA"],
-                    usecols="B:Y",
-                    engine="openpyxl",
-                )
-    
-    df_result_derivative = pd.concat([get_total_pivot(df_pivot_derivative), get_total_dataframe(df_deravative)], axis=1, join="inner")
-    df_result_derivative['value_equal'] = df_result_derivative['volume_total'].equals(df_result_derivative['volume_df'])
-    
-    ws1 = wb.create_sheet('RESULT_DERIVATIVESxPIVOT',3)
-     # Insert row final
-    for row in dataframe_to_rows(df_result_derivative, index = False):
-        ws1.append(row)
-    
-    print('Check Result - RESULT_DERIVATIVESxPIVOT')
-    
-    # Compare total Diesel x Pivot
-    # Extract cvs Diesel
-    df_diesel = pd.read_csv(file_diesel,delimiter=';')
-    
-    # Extract pivot derivative
-    df_pivot_diesel = pd.read_excel(
-                    io=file_pivot,
-                    sheet_name="Plan1",
-                    index_col=None,
-                    header=188,
-                    nrows = 13,
-                    na_values=["NA"],
-                    usecols="B:L",
-                    engine="openpyxl",
-                )
-    
-    df_result_diesel = pd.concat([get_total_pivot(df_pivot_diesel), get_total_dataframe(df_diesel)], axis=1, join="inner")
-    df_result_diesel['value_equal'] = df_result_diesel['volume_total'].equals(df_result_diesel['volume_df'])
-    
-    ws2 = wb.create_sheet('RESULT_DIESELxPIVOT',4)
-     # Insert row final
-    for row in dataframe_to_rows(df_result_diesel, index = False):
-        ws2.append(row)
-    
-    print('Check Result - RESULT_DIESELxPIVOT')
-           
-    # Save file final
-    wb.save(file_result)
-    print('********End - Check Result********')
-
-'''
-Execution Sequence
-_download_datasets()
-_download_data_pivot()
-_clean_file()
-_generation_file()
-_check_results()
-'''
+import os
+import io
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+
+from datetime import datetime 
+from concurrent.futures import ProcessPoolExecutor
+from pivot_cache import read_pivot_cache
+from pivot_cache_xls import read_pivot_cache_xls
+from external_sort import RunWriter, merge_runs, sort_key
+from xlsx_writer import write_workbook, write_fragment, read_fragment
+from downloader import download_files, file_sha256
+from watermark import load_watermark, save_watermark, partition_hashes, plan_partitions, write_partitions, assemble_partitions, partition_folder, watermark_file, PARTITIONS_FOLDER
+from columnar import write_columnar, has_columnar, prune_columnar, write_handoff, read_handoff, has_handoff, columnar_folder, handoff_file, handoff_rows
+from sharding import byte_ranges, read_byte_range, concatenate_files
+from reconciliation import reconcile_pivot, mismatches
+from pivot_locator import locate_pivot_tables, find_table
+from instrumentation import instrumented, step, count_rows, annotate
+from cube import write_cube, cube_files
+from stage_cache import cached_stage
+from warehouse import load_dataset
+from schema import COLUMNS, DATASET_COLUMNS, DATASET_DTYPES, CLEAN_DTYPES, DATE_COLUMNS, processing_time, month_start, strip_categories, conform, sort, to_csv
+
+# Pivot caches of vendas-combustiveis-m3.xlsx, in the order of the tables
+PIVOT_CACHES = {
+    'derivative': 1,
+    'diesel': 2,
+}
+
+# Pivot tables of Plan1, by a keyword of the title
+PIVOT_TABLES = {
+    'derivative': 'derivados',
+    'diesel': 'diesel',
+}
+
+# Link reference
+LINK_REF = 'https://www.gov.br/anp/pt-br/centrais-de-conteudo'
+
+# Datasets: Sales of oil derivative fuels by UF and product | Sales of diesel by UF and type
+SOURCES_DATASETS = {
+    'dataset_derivative.csv': f'{LINK_REF}/dados-abertos/arquivos/vdpb/vendas-derivados-petroleo-e-etanol/vendas-derivados-petroleo-etanol-m3-1990-2022.csv',
+    'dataset_diesel.csv': f'{LINK_REF}/dados-abertos/arquivos/vdpb/vct/vendas-oleo-diesel-tipo-m3-2013-2022.csv',
+}
+
+# Folder of the downloaded datasets, apart from the cleaned datasets (same names) so the manifest still matches them
+RAW_FOLDER = 'raw'
+
+# Pivot file (xlsx version of vendas-combustiveis-m3.xls)
+SOURCES_PIVOT = {
+    'vendas-combustiveis-m3.xlsx': f'{LINK_REF}/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls/@@download/file/vendas-combustiveis-m3.xlsx',
+}
+
+# Columns of the datasets downloaded from the federal government (schema.py)
+HEADER_DATASET = DATASET_COLUMNS
+
+# Rows per chunk of the cleaning stage (0 loads the whole dataset in memory)
+CLEAN_CHUNKSIZE = int(os.environ.get('RAIZEN_CLEAN_CHUNKSIZE', '0'))
+
+# Mode of the cleaning stage (memory, chunked, incremental or parallel)
+CLEAN_MODE = os.environ.get('RAIZEN_CLEAN_MODE', 'chunked' if CLEAN_CHUNKSIZE else 'incremental')
+
+# Processes of the parallel cleaning stage (0 uses all the cores)
+CLEAN_WORKERS = int(os.environ.get('RAIZEN_CLEAN_WORKERS', '0')) or os.cpu_count()
+
+# Export the cleaned datasets as csv, the tasks exchange the arrow files of the handoff folder
+EXPORT_CSV = os.environ.get('RAIZEN_EXPORT_CSV', '1') == '1'
+
+# Cleaned datasets
+DATASETS = ['dataset_derivative', 'dataset_diesel']
+
+# First year kept of each dataset
+START_PERIODS = {
+    'dataset_derivative': 2000,
+    'dataset_diesel': 2013,
+}
+
+# Columns of the cleaned datasets (schema.py)
+HEADER_CLEAN = COLUMNS
+
+# Sheets of data_extracted.xlsx with the results of _check_dataset (the mismatches are gathered by _assemble_file)
+RESULT_SHEETS = {
+    'RESULT_DERIVATIVESxPIVOT': 'result_derivative.csv',
+    'RESULT_DIESELxPIVOT': 'result_diesel.csv',
+    'RESULT_MISMATCHES': 'result_mismatches.csv',
+}
+
+# Sheet of the results of each dataset
+RESULT_DATASETS = {
+    'derivative': 'RESULT_DERIVATIVESxPIVOT',
+    'diesel': 'RESULT_DIESELxPIVOT',
+}
+
+# Sheets of data_extracted.xlsx with the cleaned datasets, the final sheet has the datasets in the order of DATASETS
+DATA_SHEETS = {
+    'derivative': 'DERIVATIVES',
+    'diesel': 'DIESEL',
+}
+DATA_SHEET_FINAL = 'DERIVATIVES_DISEL_FINAL'
+
+# Folder of the rows of the data sheets serialized by _generation_sheet
+SHEETS_FOLDER = 'sheets'
+
+# Deflate level of data_extracted.xlsx in _assemble_file, the fastest by default (the file is about 25% larger)
+ASSEMBLY_LEVEL = int(os.environ.get('RAIZEN_ASSEMBLY_LEVEL', '1'))
+
+# Month abbreviations used by the datasets
+MONTH_NAME = ['JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN', 'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+
+@instrumented('download_datasets')
+def _download_datasets():
+    """
+    The federal government makes available a set of public datasets, including those that will be part of this analysis.
+    Link: https://dados.gov.br/dataset
+
+    
+    The datasets that are part of this analysis can be found in the links below::   
+        -> https://dados.gov.br/dataset/vendas-de-derivados-de-petroleo-e-biocombustiveis/resource/c3d6e0b4-f86e-48f8-9325-6cc0d434b33f
+        -> https://dados.gov.br/dataset/vendas-de-derivados-de-petroleo-e-biocombustiveis/resource/2429fdeb-df86-4e63-b248-2038f6c3e3cc
+    """ 
+        
+    # Path the storage, the cleaning stage reads the raw datasets and writes the cleaned ones in dados
+    path = os.path.dirname(os.path.abspath(__file__)) + '/dados/' + RAW_FOLDER + '/'
+
+    print('********Start - Download Datasets********')
+    # Download - Sales of oil derivative fuels by UF and product | Sales of diesel by UF and type
+    results = download_files(SOURCES_DATASETS, path)
+    for name, entry in results.items():
+        print(f"Download {entry['status']} - {name}")
+    count_rows(rows_out=len(results))
+    print('********End - Download Datasets********', end='\n\n')
+
+@instrumented('download_pivot')
+def _download_data_pivot():
+    """
+    Analysis file (pivoted data)
+        File provided by Raizen
+        -> https://github.com/raizen-analytics/data-engineering-test/raw/master/assets/vendas-combustiveis-m3.xls
+        File provided by Federal government
+        XLX
+            -> https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls
+        XLSX
+        -> https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls/view
+            -> permite baixar o xlsx através do link :
+            https://www.gov.br/anp/pt-br/centrais-de-conteudo/dados-estatisticos/de/vdpb/vendas-combustiveis-m3.xls/@@download/file/vendas-combustiveis-m3.xlsx
+    """
+    # Path the storage 
+    path = os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    print('********Start - Download Pivot********')
+    results = download_files(SOURCES_PIVOT, path)
+    for name, entry in results.items():
+        print(f"Download {entry['status']} - {name}")
+    count_rows(rows_out=len(results))
+    print('********End - Download Pivot********', end='\n\n')
+
+
+def _extract_pivot_cache_files(file_name='vendas-combustiveis-m3.xlsx', path=None):
+    # Folder, inputs, outputs and parameters of _extract_pivot_cache (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    return path, [path + file_name], [path + f'pivot_{name}.csv' for name in PIVOT_CACHES], {'file_name': file_name}
+
+@instrumented('extract_pivot_cache')
+@cached_stage('extract_pivot_cache', _extract_pivot_cache_files)
+def _extract_pivot_cache(file_name='vendas-combustiveis-m3.xlsx', path=None):
+    """
+    Extract the records of the pivot caches of vendas-combustiveis-m3 without Excel.
+    Both the xlsx file and the legacy xls (BIFF8) file are supported.
+        -> pivot_derivative.csv - Sales of oil derivative fuels by UF and product
+        -> pivot_diesel.csv - Sales of diesel by UF and type
+
+    Parameters
+    ----------
+    file_name : String
+        Pivot file stored in the dados folder.
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    # Path the storage 
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    file_pivot = path + file_name
+    # Reader according to the file format
+    reader = read_pivot_cache_xls if file_name.lower().endswith('.xls') else read_pivot_cache
+    
+    print('********Start - Extract Pivot Cache********')
+    created_at = processing_time()
+    for name, cache_number in PIVOT_CACHES.items():
+        with step(f'{name}.read') as measure:
+            df = reader(file_pivot, cache_number)
+            measure.rows(rows_out=len(df))
+        df = conform(df, created_at)
+        with step(f'{name}.write', rows_in=len(df)):
+            to_csv(df, path + f'pivot_{name}.csv', sep = ';', index=False)
+        count_rows(rows_out=len(df))
+        print(f'Extract Pivot Cache - {name.upper()}')
+    print('********End - Extract Pivot Cache********', end='\n\n')
+
+
+def read_pivot_cache_csv(path, name):
+    """
+    Read the records of a pivot cache extracted by _extract_pivot_cache.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    name : String
+        Name of the pivot cache (derivative or diesel).
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe, None when the pivot cache was not extracted. year_month is
+        kept as text, reconciliation.prepare parses it once per month.
+    """
+    file_cache = path + f'pivot_{name}.csv'
+    if not os.path.exists(file_cache):
+        return None
+    return pd.read_csv(
+        file_cache, delimiter=';', usecols=['year_month', 'uf', 'product', 'volume'],
+        dtype=CLEAN_DTYPES, float_precision='round_trip',
+    )
+
+
+def formated_year_month(year, month):
+    """
+    Format field year_month	date
+
+    Parameters
+    ----------
+    year : String
+        Year extraction from pivot table.
+    month : String
+        Month extraction from pivot table.
+        
+    Returns
+    -------
+    date : String
+        Returns returns the date according to the past period.
+    """  
+    month_name = {
+        'JAN':1,
+        'FEV':2,
+        'MAR':3,
+        'ABR':4,
+        'MAI':5,
+        'JUN':6,
+        'JUL':7,
+        'AGO':8,
+        'SET':9,
+        'OUT':10,
+        'NOV':11,
+        'DEZ':12        
+    }
+    date = datetime(int(year), month_name[month], 1)
+    #date = f'{str(year)}_{str(month_name[month])}'
+    return date
+
+def raw_file(folder, file_name):
+    """
+    Path of a downloaded dataset.
+
+    Parameters
+    ----------
+    folder : String
+        Folder of the datasets.
+    file_name : String
+        Name of the dataset (without extension).
+
+    Returns
+    -------
+    path : String
+        Path of the csv file in the raw folder.
+    """
+    return os.path.join(folder, RAW_FOLDER, file_name + '.csv')
+
+def trim_all_columns(dataframe):
+    """
+    Trim whitespace from ends of each value across all series in dataframe
+    
+    Parameters
+    ----------
+    dataframe : array
+        Data extracted from excel file.            
+        
+    Returns:
+    --------
+        Dataframe Cleaning
+    """
+
+    dataframe = dataframe.copy()
+    for column in dataframe.columns:
+        if isinstance(dataframe[column].dtype, pd.CategoricalDtype):
+            # Strip the categories, the codes are kept
+            dataframe[column] = strip_categories(dataframe[column])
+        elif dataframe[column].dtype == object:
+            # Strip only the distinct values, values that are not strings are kept as they are
+            codes, uniques = pd.factorize(dataframe[column])
+            uniques = np.array([x.strip() if isinstance(x, str) else x for x in uniques] + [np.nan], dtype=object)
+            dataframe[column] = uniques.take(codes)
+    return dataframe
+
+def read_dataset(path):
+    """
+    Read the dataset downloaded from the federal government.
+    The volume with decimal comma is parsed at read time and the labels are
+    read as categoricals (schema.py).
+
+    Parameters
+    ----------
+    path : String
+        Path of the csv file.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the columns year, month, region, uf, product and volume.
+    """
+    df = pd.read_csv(
+        path,
+        index_col=None,
+        delimiter=';',
+        header=0,
+        names=HEADER_DATASET,
+        dtype=DATASET_DTYPES,
+        decimal=',',
+        float_precision='round_trip',
+    )
+    return df
+
+def read_dataset_chunks(path, start_period, chunksize):
+    """
+    Read the dataset in chunks, keeping only the rows of the period.
+
+    Parameters
+    ----------
+    path : String
+        Path of the csv file.
+    start_period: int
+        Period you want to return from the dataset.
+    chunksize : int
+        Number of rows of each chunk.
+
+    Returns
+    -------
+    chunks : generator
+        Dataframes with the columns year, month, uf, product and volume.
+    """
+    reader = pd.read_csv(
+        path,
+        index_col=None,
+        delimiter=';',
+        header=0,
+        names=HEADER_DATASET,
+        usecols=['year', 'month', 'uf', 'product', 'volume'],
+        dtype=DATASET_DTYPES,
+        decimal=',',
+        float_precision='round_trip',
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            chunk = chunk[chunk['year'] >= int(start_period)]
+            if len(chunk):
+                yield chunk
+
+def read_clean_chunks(path, chunksize=100000, header=True):
+    """
+    Read a cleaned dataset (or a partition of it) in chunks with the dtypes of the schema.
+
+    Parameters
+    ----------
+    path : String
+        Path of the csv file.
+    chunksize : int
+        Number of rows of each chunk.
+    header : bool
+        False for the partitions, written without header.
+
+    Returns
+    -------
+    chunks : generator
+        Dataframes with the columns year_month, uf, product, unit, volume and created_at.
+    """
+    reader = pd.read_csv(
+        path,
+        delimiter=';',
+        header=0 if header else None,
+        names=HEADER_CLEAN,
+        dtype=CLEAN_DTYPES,
+        parse_dates=DATE_COLUMNS,
+        float_precision='round_trip',
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            yield conform(chunk)
+
+def transform_dataframe(df, start_period, created_at):
+    """
+    Filter and transform the dataset, one column at a time.
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe with the columns year, month, region, uf, product and volume.
+    start_period: int
+        Period you want to return from the dataset.
+    created_at : Timestamp
+        Date of the processing.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the columns year_month, uf, product, unit, volume and created_at (schema.py).
+    """
+    # Filter Period
+    period = df['year'] >= int(start_period)
+    if not period.all():
+        df = df[period]
+    df = trim_all_columns(df)
+
+    # Volume not parsed by the reader (e.g. values with blank spaces)
+    volume = df['volume']
+    if volume.dtype == object:
+        volume = volume.str.strip().str.replace(',', '.').astype(float)
+
+    # Month name -> month number through a categorical lookup
+    month = pd.Categorical(df['month'], categories=MONTH_NAME).codes + 1
+    if (month == 0).any():
+        raise KeyError(f"Invalid month: {sorted(set(df['month'][month == 0].astype(str)))}")
+
+    # Data transformation
+    df = conform(pd.DataFrame({
+        'year_month': month_start(df['year'].to_numpy(), month),
+        'uf': df['uf'],
+        'product': df['product'],
+        'unit': pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=['m3']),
+        'volume': volume.astype(float),
+    }, index=df.index), created_at)
+    # Order by columns
+    df = sort(df)
+    return df
+
+def clean_dataframe(file_name, start_period, path=None):
+    """
+    Clean up the dataframe and name the columns.
+
+    Parameters
+    ----------
+    file_name : String
+        Name of the dataset (without extension).
+    start_period: int
+        Period you want to return from the dataset.   
+    path : String
+        Folder of the dataset, the dados folder by default.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe.
+    """  
+    # Path dataset
+    folder = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    path = folder + file_name + '.csv'
+    
+    print('********Start - Data Clean********')
+    dataset = file_name.replace('dataset_', '')
+    # Mount dataframe
+    with step(f'{dataset}.read') as measure:
+        df = read_dataset(raw_file(folder, file_name))
+        measure.rows(rows_out=len(df))
+    count_rows(rows_in=len(df))
+        
+    # Data cleaning and transformation
+    print(f'Data Clean - {file_name.upper()}')
+    with step(f'{dataset}.transform', rows_in=len(df)) as measure:
+        df = transform_dataframe(df, start_period, processing_time())
+        measure.rows(rows_out=len(df))
+    count_rows(rows_out=len(df))
+    
+    # File csv
+    if EXPORT_CSV:
+        with step(f'{dataset}.write_csv', rows_in=len(df)):
+            to_csv(df, path, sep = ';', index=False)
+    print(f'Generated dataset - {file_name.upper()}')
+    
+    # Columnar dataset and arrow file of the next tasks
+    with step(f'{dataset}.write_columnar', rows_in=len(df)):
+        write_columnar(folder, dataset, df)
+    with step(f'{dataset}.write_handoff'):
+        write_handoff(folder, dataset)
+    
+    print('********End - Data Clean********', end='\n\n')
+    return df
+
+def clean_dataframe_chunked(file_name, start_period, path=None, chunksize=None):
+    """
+    Clean up the dataset with bounded memory: the dataset is read and transformed
+    in chunks, each chunk is sorted and spilled to disk and the output is produced
+    by an external merge sort of the spilled runs.
+
+    Parameters
+    ----------
+    file_name : String
+        Name of the dataset (without extension).
+    start_period: int
+        Period you want to return from the dataset.
+    path : String
+        Folder of the dataset, the dados folder by default.
+    chunksize : int
+        Number of rows of each chunk, peak memory is proportional to it.
+
+    Returns
+    -------
+    rows : int
+        Number of rows of the dataset generated.
+    """
+    # Path dataset
+    folder = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    path = folder + file_name + '.csv'
+    chunksize = chunksize or CLEAN_CHUNKSIZE or 100000
+    created_at = processing_time()
+    header = HEADER_CLEAN
+    # The merged dataset is the csv export, or a temporary file
+    output = path if EXPORT_CSV else path + '.merged'
+
+    print('********Start - Data Clean (chunked)********')
+    print(f'Data Clean - {file_name.upper()}')
+    dataset = file_name.replace('dataset_', '')
+    runs = RunWriter(folder)
+    rows = 0
+    try:
+        # Transform and spill sorted runs
+        with step(f'{dataset}.transform_spill') as measure:
+            for chunk in read_dataset_chunks(raw_file(folder, file_name), start_period, chunksize):
+                df = transform_dataframe(chunk, start_period, created_at)
+                runs.write(df)
+                rows += len(df)
+            measure.rows(rows_out=rows)
+
+        # Merge the runs into the cleaned dataset
+        with step(f'{dataset}.merge', rows_in=rows):
+            merge_runs(runs.runs, output, header, sort_key([0, 1, 2]))
+    finally:
+        runs.cleanup()
+    count_rows(rows_out=rows)
+    print(f'Generated dataset - {file_name.upper()}')
+
+    # Columnar dataset, from the merged (sorted) dataset, and arrow file of the next tasks
+    try:
+        with step(f'{dataset}.write_columnar', rows_in=rows):
+            write_columnar(folder, dataset, read_clean_chunks(output, chunksize))
+    finally:
+        if output != path:
+            os.remove(output)
+    with step(f'{dataset}.write_handoff'):
+        write_handoff(folder, dataset)
+
+    print('********End - Data Clean (chunked)********', end='\n\n')
+    return rows
+
+def clean_dataframe_incremental(file_name, start_period, path=None):
+    """
+    Clean up the dataset processing only the new or revised months.
+
+    A watermark (last year_month processed and a content hash of each year_month
+    partition) is kept between runs. Only the partitions whose hash changed are
+    transformed and written, the dataset csv is then assembled from the stored partitions.
+
+    Parameters
+    ----------
+    file_name : String
+        Name of the dataset (without extension).
+    start_period: int
+        Period you want to return from the dataset.
+    path : String
+        Folder of the dataset, the dados folder by default.
+
+    Returns
+    -------
+    rows : int
+        Number of rows transformed.
+    """
+    # Path dataset
+    folder = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    path = folder + file_name + '.csv'
+    header = HEADER_CLEAN
+    dataset = file_name.replace('dataset_', '')
+
+    print('********Start - Data Clean (incremental)********')
+    # Download not changed since the last run (not_modified), the outputs are current
+    source = raw_file(folder, file_name)
+    checksum = file_sha256(source)
+    watermark = load_watermark(folder, file_name)
+    unchanged = watermark.get('source_sha256') == checksum and watermark['start_period'] == int(start_period)
+    if unchanged and os.path.exists(path) == EXPORT_CSV and has_columnar(folder, dataset) and has_handoff(folder, dataset):
+        print(f'No new data - {file_name.upper()}')
+        print('********End - Data Clean (incremental)********', end='\n\n')
+        return 0
+
+    # Mount dataframe and hash the partitions
+    with step(f'{dataset}.read') as measure:
+        df = read_dataset(source)
+        measure.rows(rows_out=len(df))
+    count_rows(rows_in=len(df))
+    with step(f'{dataset}.hash', rows_in=len(df)):
+        df = trim_all_columns(df[df['year'] >= int(start_period)])
+        month = pd.Categorical(df['month'], categories=MONTH_NAME).codes + 1
+        keys = df['year'].astype(int).astype(str).str.cat(pd.Series(month, index=df.index).map('{:02d}'.format), sep='-').to_numpy()
+        hashes = partition_hashes(df.drop(columns=['region']), keys)
+
+    changed, removed = plan_partitions(watermark, hashes, start_period)
+    print(f'Data Clean - {file_name.upper()} - {len(changed)} partitions changed, {len(removed)} removed')
+
+    # Transform only the changed partitions
+    rows = 0
+    if changed or removed:
+        with step(f'{dataset}.transform') as measure:
+            df = transform_dataframe(df[np.isin(keys, changed)], start_period, processing_time())
+            measure.rows(rows_out=len(df))
+        with step(f'{dataset}.write_partitions', rows_in=len(df)):
+            write_partitions(folder, file_name, df, removed)
+        rows = len(df)
+        count_rows(rows_out=rows)
+        watermark = {
+            'last_year_month': max(hashes) if hashes else None,
+            'partitions': hashes,
+            'start_period': int(start_period),
+            'version': watermark.get('version', 0) + 1,
+        }
+    watermark['source_sha256'] = checksum
+
+    # File csv
+    if EXPORT_CSV:
+        with step(f'{dataset}.write_csv'):
+            assemble_partitions(folder, file_name, path, header)
+
+    # Columnar dataset, only the years of the changed partitions are replaced
+    if changed or removed or not has_columnar(folder, dataset):
+        years = sorted({key[:4] for key in changed + removed}) if has_columnar(folder, dataset) else None
+        partitions = partition_folder(folder, file_name)
+        frames = (
+            chunk
+            for key in sorted(hashes) if years is None or key[:4] in years
+            for chunk in read_clean_chunks(os.path.join(partitions, key + '.csv'), header=False)
+        )
+        with step(f'{dataset}.write_columnar'):
+            write_columnar(folder, dataset, frames, years)
+    if changed or removed or not has_handoff(folder, dataset):
+        with step(f'{dataset}.write_handoff'):
+            write_handoff(folder, dataset)
+    save_watermark(folder, file_name, watermark)
+    print(f'Generated dataset - {file_name.upper()}')
+
+    print('********End - Data Clean (incremental)********', end='\n\n')
+    return rows
+
+def _clean_byte_range(path, start, end, start_period, created_at, folder):
+    """
+    Clean the rows of a byte range of the dataset and split them by year
+    (worker of clean_datasets_parallel).
+
+    Parameters
+    ----------
+    path : String
+        Path of the csv file.
+    start : int
+        First byte of the range.
+    end : int
+        Byte after the range.
+    start_period: int
+        Period you want to return from the dataset.
+    created_at : Timestamp
+        Date of the processing.
+    folder : String
+        Folder of the sorted runs.
+
+    Returns
+    -------
+    runs : list
+        Pairs (year, path of the sorted run).
+    """
+    data = read_byte_range(path, start, end)
+    if not data:
+        return []
+    df = pd.read_csv(
+        io.BytesIO(data),
+        index_col=None,
+        delimiter=';',
+        header=None,
+        names=HEADER_DATASET,
+        dtype=DATASET_DTYPES,
+        decimal=',',
+        float_precision='round_trip',
+    )
+    df = df[df['year'] >= int(start_period)]
+    if not len(df):
+        return []
+    df = transform_dataframe(df, start_period, created_at)
+    runs = []
+    for year, shard in df.groupby(df['year_month'].dt.year, sort=False):
+        # Typed intermediate file, parsed only once
+        run = os.path.join(folder, f'{os.path.basename(path)}_{year}_{start}.pkl')
+        shard.to_pickle(run)
+        runs.append((int(year), run))
+    return runs
+
+def _sort_shard(runs, output, folder, dataset, year):
+    """
+    Merge the sorted runs of a year (worker of clean_datasets_parallel),
+    the year partition of the columnar dataset is written too.
+
+    Parameters
+    ----------
+    runs : list
+        Paths of the runs, in input order.
+    output : String
+        Path of the shard (csv without header), None when the csv is not exported.
+    folder : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    year : int
+        Year of the shard.
+
+    Returns
+    -------
+    rows : int
+        Number of rows of the shard.
+    """
+    # The categories of the runs differ, the concatenated labels are categorized again
+    df = conform(pd.concat([pd.read_pickle(run) for run in runs], ignore_index=True))
+    df = sort(df)
+    if output:
+        to_csv(df, output, sep=';', index=False, header=False)
+    write_columnar(folder, dataset, df, years=[year])
+    return len(df)
+
+def clean_datasets_parallel(datasets, path=None, workers=None):
+    """
+    Clean up the datasets in a process pool.
+
+    Each dataset is split in byte ranges that are parsed and transformed
+    concurrently, the rows are split by year and each year shard is sorted
+    concurrently. The shards are already in order and are concatenated into
+    the dataset csv, the arrow file of the next tasks is written from the
+    year partitions. The byte ranges of all the datasets share the same pool.
+
+    Parameters
+    ----------
+    datasets : list
+        Pairs (name of the dataset, start_period).
+    path : String
+        Folder of the datasets, the dados folder by default.
+    workers : int
+        Number of processes, RAIZEN_CLEAN_WORKERS (all the cores) by default.
+
+    Returns
+    -------
+    rows : dict
+        Number of rows of each dataset generated.
+    """
+    folder = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    workers = workers or CLEAN_WORKERS
+    created_at = processing_time()
+    header = (';'.join(HEADER_CLEAN) + os.linesep).encode('utf-8')
+    tmp = tempfile.mkdtemp(prefix='parallel_', dir=folder)
+    rows = {}
+
+    print('********Start - Data Clean (parallel)********')
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Parse and transform the byte ranges of all the datasets
+            parsed = {}
+            for file_name, start_period in datasets:
+                source = raw_file(folder, file_name)
+                parsed[file_name] = [
+                    executor.submit(_clean_byte_range, source, start, end, start_period, created_at, tmp)
+                    for start, end in byte_ranges(source, workers * 2)
+                ]
+
+            # Sort the year shards of each dataset as soon as its ranges are done
+            shards = {}
+            for file_name, futures in parsed.items():
+                print(f'Data Clean - {file_name.upper()}')
+                runs = {}
+                for future in futures:
+                    for year, run in future.result():
+                        runs.setdefault(year, []).append(run)
+                shards[file_name] = []
+                for year in sorted(runs):
+                    output = os.path.join(tmp, f'{file_name}_{year}.csv') if EXPORT_CSV else None
+                    future = executor.submit(_sort_shard, runs[year], output, folder, file_name.replace('dataset_', ''), year)
+                    shards[file_name].append((year, output, future))
+
+            # Concatenate the shards in order
+            for file_name, futures in shards.items():
+                dataset = file_name.replace('dataset_', '')
+                rows[file_name] = sum(future.result() for _, _, future in futures)
+                count_rows(rows_out=rows[file_name])
+                if EXPORT_CSV:
+                    with step(f'{dataset}.write_csv', rows_in=rows[file_name]):
+                        concatenate_files([output for _, output, _ in futures], folder + file_name + '.csv', header)
+                prune_columnar(folder, dataset, [year for year, _, _ in futures])
+                with step(f'{dataset}.write_handoff'):
+                    write_handoff(folder, dataset)
+                print(f'Generated dataset - {file_name.upper()}')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print('********End - Data Clean (parallel)********', end='\n\n')
+    return rows
+
+def clean_dataframe_parallel(file_name, start_period, path=None, workers=None):
+    """
+    Clean up a dataset in a process pool (see clean_datasets_parallel).
+
+    Parameters
+    ----------
+    file_name : String
+        Name of the dataset (without extension).
+    start_period: int
+        Period you want to return from the dataset.
+    path : String
+        Folder of the dataset, the dados folder by default.
+    workers : int
+        Number of processes.
+
+    Returns
+    -------
+    rows : int
+        Number of rows of the dataset generated.
+    """
+    return clean_datasets_parallel([(file_name, start_period)], path, workers)[file_name]
+
+def clean_outputs(path, file_name):
+    """
+    Files and folders written by the cleaning of a dataset (stage cache).
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    file_name : String
+        Name of the dataset (without extension).
+
+    Returns
+    -------
+    outputs : list
+        Paths of the files and folders.
+    """
+    dataset = file_name.replace('dataset_', '')
+    outputs = [path + f'{file_name}.csv'] if EXPORT_CSV else []
+    outputs += [columnar_folder(path, dataset), handoff_file(path, dataset), *cube_files(path, dataset)]
+    if CLEAN_MODE == 'incremental':
+        outputs += [watermark_file(path, file_name), os.path.join(path, PARTITIONS_FOLDER, file_name)]
+    return outputs
+
+def clean_dataset(file_name, path=None):
+    """
+    Clean up a dataset with the mode of RAIZEN_CLEAN_MODE and build its volume cube.
+
+    Parameters
+    ----------
+    file_name : String
+        Name of the dataset (without extension).
+    path : String
+        Folder of the dataset, the dados folder by default.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    clean = {
+        'memory': clean_dataframe,
+        'chunked': clean_dataframe_chunked,
+        'incremental': clean_dataframe_incremental,
+        'parallel': clean_dataframe_parallel,
+    }[CLEAN_MODE]
+    clean(file_name, START_PERIODS[file_name], path=path)
+
+    # Cube of the range aggregates, rebuilt only when the arrow file changed
+    dataset = file_name.replace('dataset_', '')
+    with step(f'{dataset}.write_cube'):
+        write_cube(path, dataset)
+
+def _clean_file_files(path=None):
+    # Folder, inputs, outputs and parameters of _clean_file (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    inputs = [raw_file(path, file_name) for file_name in DATASETS]
+    outputs = [output for file_name in DATASETS for output in clean_outputs(path, file_name)]
+    return path, inputs, outputs, {'start_periods': START_PERIODS, 'export_csv': EXPORT_CSV, 'mode': CLEAN_MODE}
+
+@instrumented('clean_file')
+@cached_stage('clean_file', _clean_file_files)
+def _clean_file(path=None):
+    """
+    This function is intended to carry out the cleaning process of downloaded datasets.
+    Benchmark only, not a task of the DAG (that runs _clean_dataset once per dataset):
+    both datasets in one call, the reference of bench_dag_fanout and the input of the other benchmarks.
+    RAIZEN_CLEAN_MODE selects how the datasets are cleaned:
+        -> incremental - only the new or revised months are processed (default)
+        -> chunked - chunks with bounded memory (default when RAIZEN_CLEAN_CHUNKSIZE is set)
+        -> memory - the whole dataset in memory
+        -> parallel - byte ranges and year shards of both datasets in a process pool (RAIZEN_CLEAN_WORKERS)
+    The volume cubes (product x uf x month) of the cleaned datasets are built at the end.
+    The outputs are restored from the stage cache when the downloaded datasets did not change.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """  
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    if CLEAN_MODE == 'parallel':
+        # Both datasets in the same pool
+        clean_datasets_parallel(list(START_PERIODS.items()), path)
+        for dataset in ('derivative', 'diesel'):
+            with step(f'{dataset}.write_cube'):
+                write_cube(path, dataset)
+        return
+    for file_name in DATASETS:
+        clean_dataset(file_name, path)
+
+def _clean_dataset_files(dataset, path=None):
+    # Folder, inputs, outputs and parameters of _clean_dataset (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    file_name = f'dataset_{dataset}'
+    params = {'dataset': dataset, 'start_period': START_PERIODS[file_name], 'export_csv': EXPORT_CSV, 'mode': CLEAN_MODE}
+    return path, [raw_file(path, file_name)], clean_outputs(path, file_name), params
+
+@instrumented('clean_dataset')
+@cached_stage('clean_dataset', _clean_dataset_files)
+def _clean_dataset(dataset, path=None):
+    """
+    Clean up one dataset (mapped task of the DAG, one per dataset).
+
+    Parameters
+    ----------
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    annotate(dataset=dataset)
+    clean_dataset(f'dataset_{dataset}', path)
+
+def write_data_sheets(path, dataset):
+    """
+    Serialize the rows of a dataset for its sheet and for its part of the
+    final sheet (see xlsx_writer.write_fragment), the final sheet has the
+    datasets in the order of DATASETS.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+
+    Returns
+    -------
+    rows : int
+        Rows of the dataset.
+    """
+    folder = os.path.join(path, SHEETS_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    with step(f'{dataset}.read') as measure:
+        df = read_handoff(path, dataset)
+        measure.rows(rows_out=len(df))
+    with step(f'{dataset}.write', rows_in=len(df)):
+        write_fragment(os.path.join(folder, f'{dataset}.xml.gz'), df)
+        # Rows of the datasets before this one in the final sheet
+        previous = [file_name.replace('dataset_', '') for file_name in DATASETS[:DATASETS.index(f'dataset_{dataset}')]]
+        first_row = 2 + sum(handoff_rows(path, name) for name in previous)
+        if first_row > 2:
+            write_fragment(os.path.join(folder, f'{dataset}_final.xml.gz'), df, first_row)
+    return len(df)
+
+def sheet_fragments(path, dataset):
+    """
+    Fragments of a dataset written by write_data_sheets.
+
+    Returns
+    -------
+    sheet : String
+        Fragment of the sheet of the dataset.
+    final : String
+        Fragment of the final sheet.
+    """
+    folder = os.path.join(path, SHEETS_FOLDER)
+    sheet = os.path.join(folder, f'{dataset}.xml.gz')
+    final = os.path.join(folder, f'{dataset}_final.xml.gz')
+    return sheet, final if DATASETS.index(f'dataset_{dataset}') else sheet
+
+def _generation_sheet_files(dataset, path=None):
+    # Folder, inputs, outputs and parameters of _generation_sheet (stage cache), the rows of the previous datasets number the final sheet
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    position = DATASETS.index(f'dataset_{dataset}')
+    inputs = [handoff_file(path, file_name.replace('dataset_', '')) for file_name in DATASETS[:position + 1]]
+    outputs = [name + suffix for name in sorted(set(sheet_fragments(path, dataset))) for suffix in ('', '.json')]
+    return path, inputs, outputs, {'dataset': dataset}
+
+@instrumented('generation_sheet')
+@cached_stage('generation_sheet', _generation_sheet_files)
+def _generation_sheet(dataset, path=None):
+    """
+    Serialize the data sheets of one dataset (mapped task of the DAG, one per dataset),
+    _assemble_file only copies them into data_extracted.xlsx.
+
+    Parameters
+    ----------
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    annotate(dataset=dataset)
+    print(f'********Start - Create Sheets - {dataset.upper()}********')
+    rows = write_data_sheets(path, dataset)
+    count_rows(rows_in=rows, rows_out=rows)
+    print(f'********End - Create Sheets - {dataset.upper()}********', end='\n\n')
+
+def _assemble_file_files(path=None):
+    # Folder, inputs, outputs and parameters of _assemble_file (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    datasets = [file_name.replace('dataset_', '') for file_name in DATASETS]
+    inputs = [name + suffix for dataset in datasets for name in sorted(set(sheet_fragments(path, dataset))) for suffix in ('', '.json')]
+    inputs += [path + RESULT_SHEETS[RESULT_DATASETS[dataset]] for dataset in datasets]
+    return path, inputs, [path + 'data_extracted.xlsx', path + RESULT_SHEETS['RESULT_MISMATCHES']], {}
+
+@instrumented('assemble_file')
+@cached_stage('assemble_file', _assemble_file_files)
+def _assemble_file(path=None):
+    """
+    Assemble data_extracted.xlsx from the sheets serialized by _generation_sheet and the
+    results of _check_dataset, the cells that do not match are gathered in RESULT_MISMATCHES.
+    The rows are copied without being serialized again, only deflated (ASSEMBLY_LEVEL).
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    datasets = [file_name.replace('dataset_', '') for file_name in DATASETS]
+    print('********Start - Create File Final********')
+    with step('read_results'):
+        results = {dataset: pd.read_csv(path + RESULT_SHEETS[RESULT_DATASETS[dataset]], delimiter=';') for dataset in datasets}
+        write_mismatches(path, results)
+
+    fragments = {dataset: [read_fragment(name) for name in sheet_fragments(path, dataset)] for dataset in datasets}
+    sheets = [(DATA_SHEETS[dataset], [fragments[dataset][0]]) for dataset in datasets]
+    sheets.append((DATA_SHEET_FINAL, [fragments[dataset][1] for dataset in datasets]))
+    for title, file_name in RESULT_SHEETS.items():
+        sheets.append((title, pd.read_csv(path + file_name, delimiter=';')))
+    count_rows(rows_in=sum(fragment.rows for dataset in datasets for fragment in fragments[dataset]))
+    with step('write'):
+        write_workbook(path + 'data_extracted.xlsx', sheets, callback=lambda title: print(f'Create Sheet - {title}'), compresslevel=ASSEMBLY_LEVEL)
+    print('********End - Create File Final********', end='\n\n')
+
+def _generation_file_files(path=None):
+    # Folder, inputs, outputs and parameters of _generation_file (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    inputs = [handoff_file(path, file_name.replace('dataset_', '')) for file_name in DATASETS]
+    inputs += [path + file_name for file_name in RESULT_SHEETS.values()]
+    return path, inputs, [path + 'data_extracted.xlsx'], {}
+
+@instrumented('generation_file')
+@cached_stage('generation_file', _generation_file_files)
+def _generation_file(path=None):
+    """
+    This function generates the final file with the result of the extracted datasets in addition to consolidating these datasets.
+    Benchmark only, not a task of the DAG (that runs _generation_sheet and _assemble_file):
+    the previous single-pass writer, kept as the reference of bench_dag_fanout and bench_generation_file.
+    The sheets are streamed to disk, the consolidated sheet is written from both datasets without combining them in memory
+    and the results of _check_results are written in the same pass.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    
+    # Paths files
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    file_final = path + 'data_extracted.xlsx'
+    
+    # Arrow files of _clean_file, mapped in memory without parsing
+    with step('read') as measure:
+        df_deravative = read_handoff(path, 'derivative')
+        df_diesel = read_handoff(path, 'diesel')
+        measure.rows(rows_out=len(df_deravative) + len(df_diesel))
+    count_rows(rows_in=len(df_deravative) + len(df_diesel))
+    
+    print('********Start - Create File Final********')
+    sheets = [
+        (DATA_SHEETS['derivative'], df_deravative),
+        (DATA_SHEETS['diesel'], df_diesel),
+        (DATA_SHEET_FINAL, [df_deravative, df_diesel]),
+    ]
+    # Results of _check_results, written in the same pass
+    for title, file_name in RESULT_SHEETS.items():
+        if os.path.exists(path + file_name):
+            sheets.append((title, pd.read_csv(path + file_name, delimiter=';')))
+    # Save file final
+    with step('write'):
+        write_workbook(file_final, sheets, callback=lambda title: print(f'Create Sheet - {title}'))
+    print('********End - Create File Final********', end='\n\n')
+
+
+def check_dataset(path, dataset, tables):
+    """
+    Compare a cleaned dataset with its pivot table and pivot cache and store the result.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    tables : dict
+        Pivot tables of Plan1 (see locate_pivot_tables).
+
+    Returns
+    -------
+    df : ndarray
+        Result of the comparison.
+    """
+    # Extract dataset (only the columns compared)
+    with step(f'{dataset}.read') as measure:
+        df = read_handoff(path, dataset, ['year_month', 'uf', 'product', 'volume'])
+        measure.rows(rows_out=len(df))
+    count_rows(rows_in=len(df))
+
+    # Extract pivot of the dataset
+    df_pivot = find_table(tables, PIVOT_TABLES[dataset])
+
+    with step(f'{dataset}.reconcile', rows_in=len(df)) as measure:
+        df_result = reconcile_pivot(df, df_pivot, read_pivot_cache_csv(path, dataset))
+        measure.rows(rows_out=len(df_result))
+    with step(f'{dataset}.write', rows_in=len(df_result)):
+        df_result.to_csv(path + RESULT_SHEETS[RESULT_DATASETS[dataset]], sep = ';', index=False)
+    count_rows(rows_out=len(df_result))
+
+    print(f'Check Result - {RESULT_DATASETS[dataset]}')
+    return df_result
+
+def write_mismatches(path, results):
+    """
+    Store the cells that do not match, of all the datasets.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets.
+    results : dict
+        Result of the comparison of each dataset.
+    """
+    df_mismatches = pd.concat([mismatches(df_result).assign(dataset=dataset) for dataset, df_result in results.items()], ignore_index=True)
+    df_mismatches.to_csv(path + RESULT_SHEETS['RESULT_MISMATCHES'], sep = ';', index=False)
+    print(f'Check Result - RESULT_MISMATCHES - {len(df_mismatches)} cells')
+
+def _check_results_files(path=None):
+    # Folder, inputs, outputs and parameters of _check_results (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    inputs = [handoff_file(path, file_name.replace('dataset_', '')) for file_name in DATASETS]
+    inputs += [path + 'vendas-combustiveis-m3.xlsx'] + [path + f'pivot_{name}.csv' for name in PIVOT_CACHES]
+    return path, inputs, [path + file_name for file_name in RESULT_SHEETS.values()], {}
+
+@instrumented('check_results')
+@cached_stage('check_results', _check_results_files)
+def _check_results(path=None):
+    """
+    This function checks if the result extracted from the datasets match the data in the pivoted file.
+    Benchmark only, not a task of the DAG (that runs _check_dataset once per dataset):
+    both datasets in one call, kept as the reference of bench_dag_fanout.
+    The results are stored in small csv files that _generation_file writes as sheets of data_extracted.xlsx,
+    in the same pass as the data sheets.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    print('********Start - Check Result********')
+    # Paths files
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    file_pivot = path + 'vendas-combustiveis-m3.xlsx'
+    
+    # Pivot tables of Plan1, found in a single read of the sheet
+    with step('locate_pivot_tables'):
+        tables = locate_pivot_tables(file_pivot)
+    
+    # Compare Derivative x Pivot and Diesel x Pivot (table and cache)
+    results = {dataset: check_dataset(path, dataset, tables) for dataset in RESULT_DATASETS}
+    
+    # Cells that do not match, of both datasets
+    write_mismatches(path, results)
+    print('********End - Check Result********')
+
+def _check_dataset_files(dataset, path=None):
+    # Folder, inputs, outputs and parameters of _check_dataset (stage cache)
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    inputs = [handoff_file(path, dataset), path + 'vendas-combustiveis-m3.xlsx', path + f'pivot_{dataset}.csv']
+    return path, inputs, [path + RESULT_SHEETS[RESULT_DATASETS[dataset]]], {'dataset': dataset}
+
+@instrumented('check_dataset')
+@cached_stage('check_dataset', _check_dataset_files)
+def _check_dataset(dataset, path=None):
+    """
+    Compare one dataset with the pivoted file (mapped task of the DAG, one per dataset),
+    the cells that do not match are gathered by _assemble_file.
+
+    Parameters
+    ----------
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    annotate(dataset=dataset)
+    print(f'********Start - Check Result - {dataset.upper()}********')
+    # Pivot table of the dataset, Plan1 is read once by each task
+    with step('locate_pivot_tables'):
+        tables = locate_pivot_tables(path + 'vendas-combustiveis-m3.xlsx')
+    check_dataset(path, dataset, tables)
+    print(f'********End - Check Result - {dataset.upper()}********')
+
+@instrumented('load_dataset')
+def _load_dataset(dataset, path=None):
+    """
+    Load one cleaned dataset into the Postgres warehouse (mapped task of the DAG,
+    one per dataset), only the months revised since the last load are written.
+
+    Parameters
+    ----------
+    dataset : String
+        Name of the dataset (derivative or diesel).
+    path : String
+        Folder of the datasets, the dados folder by default.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+    annotate(dataset=dataset)
+    print(f'********Start - Load Warehouse - {dataset.upper()}********')
+    with step(f'{dataset}.read') as measure:
+        df = read_handoff(path, dataset)
+        measure.rows(rows_out=len(df))
+    with step(f'{dataset}.load', rows_in=len(df)) as measure:
+        loaded = load_dataset(dataset, df)
+        measure.rows(rows_out=loaded['rows_loaded'])
+    annotate(**loaded)
+    print(f'Rows loaded: {loaded["rows_loaded"]}, years swapped: {loaded["years_swapped"]}, months upserted: {loaded["months_upserted"]}')
+    print(f'********End - Load Warehouse - {dataset.upper()}********')
+
+'''
+Execution Sequence (raizen_test.py, the mapped tasks run once per dataset)
+_download_datasets()
+_download_data_pivot()
+_extract_pivot_cache()
+_clean_dataset(dataset)
+_check_dataset(dataset)
+_generation_sheet(dataset)
+_load_dataset(dataset)
+_assemble_file()
+'''
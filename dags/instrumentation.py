@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import resource
+import functools
+import tracemalloc
+from datetime import datetime
+
+# Stages profiled (cProfile and tracemalloc): comma separated names, all or 1 for every stage
+PROFILE = os.environ.get('RAIZEN_PROFILE', '')
+
+# Folder of the profiles, profiles in the dados folder by default
+PROFILE_FOLDER = os.environ.get('RAIZEN_PROFILE_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'profiles'))
+
+# File where the metrics of each stage are appended (json lines), disabled when empty
+METRICS_FILE = os.environ.get('RAIZEN_METRICS_FILE', '')
+
+# Frames kept by tracemalloc and lines of the reports
+TRACEMALLOC_FRAMES = 10
+REPORT_LINES = 40
+
+# Stages and steps in progress (the steps are nested in the last stage)
+_stack = []
+
+
+def _peak_rss():
+    # Peak RSS of the process in MB (VmHWM), ru_maxrss when /proc is not available
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss():
+    # Linux resets VmHWM to the current RSS, ignored elsewhere (the peak is then the peak of the process)
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except OSError:
+        pass
+
+
+def _io():
+    # Bytes read and written by the process (rchar, wchar), zeros when /proc is not available
+    counters = {}
+    try:
+        with open('/proc/self/io') as fp:
+            for line in fp:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except OSError:
+        pass
+    return counters.get('rchar', 0), counters.get('wchar', 0)
+
+
+def _cpu():
+    # CPU time of the process and of the finished child processes (process pools)
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class Measure:
+    """
+    Measures of a stage or step: wall time, CPU time, peak RSS, rows in/out
+    and bytes read/written.
+
+    Parameters
+    ----------
+    name : String
+        Name of the stage or step.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.steps = []
+        self.annotations = {}
+        self.peak = 0.0
+
+    def rows(self, rows_in=None, rows_out=None):
+        """
+        Count rows, added to the previous counts.
+
+        Parameters
+        ----------
+        rows_in : int
+            Rows received.
+        rows_out : int
+            Rows produced.
+        """
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + int(rows_in)
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + int(rows_out)
+
+    def __enter__(self):
+        # The peak of the enclosing measure is kept before the reset
+        for measure in _stack:
+            measure.peak = max(measure.peak, _peak_rss())
+        _reset_peak_rss()
+        _stack.append(self)
+        self.start = time.perf_counter()
+        self.cpu = _cpu()
+        self.read, self.written = _io()
+        return self
+
+    def __exit__(self, *exc):
+        read, written = _io()
+        self.metrics = {
+            'name': self.name,
+            'wall_s': round(time.perf_counter() - self.start, 4),
+            'cpu_s': round(_cpu() - self.cpu, 4),
+            'peak_rss_mb': round(max(self.peak, _peak_rss()), 1),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'bytes_read': read - self.read,
+            'bytes_written': written - self.written,
+        }
+        self.metrics.update(self.annotations)
+        if self.steps:
+            self.metrics['steps'] = self.steps
+        _stack.pop()
+        if _stack:
+            _stack[-1].peak = max(_stack[-1].peak, self.metrics['peak_rss_mb'])
+            _stack[-1].steps.append(self.metrics)
+        return False
+
+
+def step(name, rows_in=None):
+    """
+    Measure a step (read, transform, sort, write...) of the current stage.
+
+        with step('read') as measure:
+            df = read_dataset(path)
+            measure.rows(rows_out=len(df))
+
+    Parameters
+    ----------
+    name : String
+        Name of the step.
+    rows_in : int
+        Rows received.
+
+    Returns
+    -------
+    measure : Measure
+        Context manager, the metrics are added to the steps of the stage.
+    """
+    measure = Measure(name)
+    measure.rows(rows_in=rows_in)
+    return measure
+
+
+def count_rows(rows_in=None, rows_out=None):
+    """
+    Count rows in the innermost stage or step in progress, ignored outside
+    of an instrumented stage.
+
+    Parameters
+    ----------
+    rows_in : int
+        Rows received.
+    rows_out : int
+        Rows produced.
+    """
+    if _stack:
+        _stack[-1].rows(rows_in, rows_out)
+
+
+def annotate(**values):
+    """
+    Add values (e.g. the result of the stage cache) to the metrics of the
+    innermost stage or step in progress, ignored outside of an instrumented stage.
+    """
+    if _stack:
+        _stack[-1].annotations.update(values)
+
+
+def _context():
+    # Context of the Airflow task, None outside of a task
+    try:
+        from airflow.operators.python import get_current_context
+        return get_current_context()
+    except Exception:
+        return None
+
+
+def _profiled(name, context):
+    if PROFILE in ('1', 'all') or name in PROFILE.split(','):
+        return True
+    conf = getattr(context.get('dag_run'), 'conf', None) if context else None
+    return bool(conf and conf.get('profile'))
+
+
+def _write_profile(name, run_id, profiler, snapshot):
+    """
+    Write the cProfile stats (.prof, readable by pstats/snakeviz) and the
+    report of the cumulative times and of the allocations (tracemalloc).
+    """
+    os.makedirs(PROFILE_FOLDER, exist_ok=True)
+    prefix = os.path.join(PROFILE_FOLDER, f"{name}_{run_id.replace(':', '-').replace('/', '-')}")
+    profiler.dump_stats(prefix + '.prof')
+    snapshot.dump(prefix + '.tracemalloc')
+    with open(prefix + '.txt', 'w', encoding='utf-8') as fp:
+        pstats.Stats(profiler, stream=fp).sort_stats('cumulative').print_stats(REPORT_LINES)
+        fp.write('Allocations by line (tracemalloc)\n')
+        for stat in snapshot.statistics('lineno')[:REPORT_LINES]:
+            fp.write(f'{stat}\n')
+    return prefix
+
+
+def instrumented(name):
+    """
+    Instrument a stage of the DAG: the metrics of the stage and of its steps
+    are printed as a json line (prefix METRICS), appended to RAIZEN_METRICS_FILE
+    and pushed to the XCom metrics of the task.
+
+    The stage is profiled with cProfile and tracemalloc when it is listed in
+    RAIZEN_PROFILE or when the DAG run is triggered with the conf {"profile": true}.
+
+    Parameters
+    ----------
+    name : String
+        Name of the stage.
+
+    Returns
+    -------
+    decorator : function
+        Decorator of the stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            context = _context()
+            run_id = context['run_id'] if context else datetime.now().strftime('%Y%m%dT%H%M%S')
+            profiler = None
+            if _profiled(name, context):
+                profiler = cProfile.Profile()
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                profiler.enable()
+            try:
+                with Measure(name) as measure:
+                    result = function(*args, **kwargs)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    snapshot = tracemalloc.take_snapshot()
+                    tracemalloc.stop()
+                    print(f'Profile - {_write_profile(name, run_id, profiler, snapshot)}')
+            metrics = {'stage': measure.metrics.pop('name'), 'run_id': run_id, **measure.metrics}
+            line = json.dumps(metrics, default=str)
+            print(f'METRICS {line}')
+            if METRICS_FILE:
+                with open(METRICS_FILE, 'a', encoding='utf-8') as fp:
+                    fp.write(line + '\n')
+            if context:
+                context['ti'].xcom_push(key='metrics', value=metrics)
+            return result
+        return wrapper
+    return decorator
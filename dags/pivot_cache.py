@@ -0,0 +1,405 @@
+import re
+import zipfile
+import posixpath
+from array import array
+from datetime import datetime
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+import pandas as pd
+
+from schema import month_start, sort
+
+# XML namespaces used by the pivot cache parts
+NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Month fields of the ANP pivot caches (wide layout) and month names (long layout)
+MONTH_ABBREVIATIONS = ['JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN', 'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+MONTH_NAMES = ['JANEIRO', 'FEVEREIRO', 'MARÇO', 'ABRIL', 'MAIO', 'JUNHO', 'JULHO', 'AGOSTO', 'SETEMBRO', 'OUTUBRO', 'NOVEMBRO', 'DEZEMBRO']
+
+# Names used by ANP for each cache field
+FIELD_ALIASES = {
+    'product': ('COMBUSTÍVEL', 'COMBUSTIVEL', 'PRODUTO'),
+    'uf': ('ESTADO', 'UN. DA FEDERAÇÃO', 'UNIDADE DA FEDERAÇÃO', 'UF'),
+    'year': ('ANO',),
+    'month': ('MÊS', 'MES'),
+    'unit': ('UNIDADE',),
+    'volume': ('VENDAS', 'VOLUME'),
+}
+
+
+def month_number(name):
+    """
+    Convert a month name or abbreviation into the month number.
+
+    Parameters
+    ----------
+    name : String
+        Month name (Janeiro, JAN, Jan...).
+
+    Returns
+    -------
+    month : int
+        Month number (1-12) or None when the name is not a month.
+    """
+    name = str(name).strip().upper()
+    if name in MONTH_ABBREVIATIONS:
+        return MONTH_ABBREVIATIONS.index(name) + 1
+    if name in MONTH_NAMES:
+        return MONTH_NAMES.index(name) + 1
+    return None
+
+
+def clean_product_name(name):
+    """
+    Removes the unit (m3) from the product name.
+
+    Parameters
+    ----------
+    name : String
+        Product name.
+
+    Returns
+    -------
+    name : String
+        Returns the Product name.
+    """
+    name = re.sub(r'\(\w+\)\s*$', '', name)
+    name = re.sub(r'\(\s+', '(', name)
+    name = re.sub(r'\s+\)', ')', name)
+    return name.strip()
+
+
+def product_unit(name):
+    """
+    Extracts the unit from the product name, e.g. "GASOLINA C (m3)" -> "m3".
+
+    Parameters
+    ----------
+    name : String
+        Product name.
+
+    Returns
+    -------
+    unit : String
+        Returns the unit, "m3" when the product name does not carry it.
+    """
+    unit = re.search(r'\((\w+)\)\s*$', name)
+    return unit.group(1) if unit else 'm3'
+
+
+def _decode_item(elem):
+    """
+    Decode a shared item or inline value of the pivot cache.
+
+    Parameters
+    ----------
+    elem : Element
+        Xml element (s, n, d, b, e or m).
+
+    Returns
+    -------
+    value : object
+        Python value, None for missing and error items.
+    """
+    tag = elem.tag[len(NS_MAIN):]
+    value = elem.get('v')
+    if tag == 's':
+        return value
+    if tag == 'n':
+        return float(value)
+    if tag == 'd':
+        return datetime.fromisoformat(value)
+    if tag == 'b':
+        return value in ('1', 'true')
+    return None
+
+
+def list_pivot_caches(path):
+    """
+    List the pivot cache parts of a xlsx file.
+
+    Parameters
+    ----------
+    path : String
+        Path of the xlsx file.
+
+    Returns
+    -------
+    caches : list
+        Pairs (definition part, records part) ordered by the cache number.
+    """
+    caches = []
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        pattern = re.compile(r'^xl/pivotCache/pivotCacheDefinition(\d+)\.xml$')
+        definitions = sorted(
+            (int(match.group(1)), name)
+            for name in names
+            for match in [pattern.match(name)] if match
+        )
+        for number, definition in definitions:
+            records = f'xl/pivotCache/pivotCacheRecords{number}.xml'
+            rels = f'xl/pivotCache/_rels/pivotCacheDefinition{number}.xml.rels'
+            # The records part is linked through the relationship of the definition
+            if rels in names:
+                with zf.open(rels) as fp:
+                    for _, elem in iterparse(fp):
+                        if elem.tag == NS_PKG_REL + 'Relationship' and elem.get('Type', '').endswith('/pivotCacheRecords'):
+                            records = posixpath.normpath(posixpath.join('xl/pivotCache', elem.get('Target')))
+            caches.append((definition, records))
+    return caches
+
+
+def read_cache_definition(fp):
+    """
+    Read the cache fields and their shared items.
+
+    Parameters
+    ----------
+    fp : file
+        Stream of the pivotCacheDefinition part.
+
+    Returns
+    -------
+    names : list
+        Name of the cache fields.
+    items : list
+        Shared items of each field.
+    """
+    names = []
+    items = []
+    for _, elem in iterparse(fp):
+        if elem.tag == NS_MAIN + 'cacheField':
+            shared = elem.find(NS_MAIN + 'sharedItems')
+            names.append(elem.get('name'))
+            items.append([_decode_item(item) for item in shared] if shared is not None else [])
+            elem.clear()
+    return names, items
+
+
+def read_cache_records(fp, items):
+    """
+    Read the cache records in a single pass.
+
+    Every value is stored as an index into the items of its field, inline values
+    are appended to the items, so each field becomes a categorical column.
+
+    Parameters
+    ----------
+    fp : file
+        Stream of the pivotCacheRecords part.
+    items : list
+        Shared items of each field (updated with the inline values).
+
+    Returns
+    -------
+    codes : list
+        Array of item indexes of each field.
+    """
+    codes = [array('q') for _ in items]
+    inline = [{} for _ in items]
+    tag_index = NS_MAIN + 'x'
+    tag_record = NS_MAIN + 'r'
+    root = None
+    for event, elem in iterparse(fp, events=('start', 'end')):
+        if root is None:
+            root = elem
+            continue
+        if event != 'end' or elem.tag != tag_record:
+            continue
+        for field, value in enumerate(elem):
+            if value.tag == tag_index:
+                codes[field].append(int(value.get('v')))
+                continue
+            # Inline value, keep one item per distinct value
+            value = _decode_item(value)
+            code = inline[field].get(value)
+            if code is None:
+                code = inline[field][value] = len(items[field])
+                items[field].append(value)
+            codes[field].append(code)
+        root.clear()
+    return codes
+
+
+def _find_field(names, alias, aliases=None):
+    """
+    Find the position of a cache field by its aliases.
+
+    Parameters
+    ----------
+    names : list
+        Name of the cache fields.
+    alias : String
+        Key of FIELD_ALIASES.
+    aliases : dict
+        Names of each field, FIELD_ALIASES by default.
+
+    Returns
+    -------
+    position : int
+        Position of the field or None.
+    """
+    names = [str(name).strip().upper() for name in names]
+    for name in (aliases or FIELD_ALIASES)[alias]:
+        name = str(name).strip().upper()
+        if name in names:
+            return names.index(name)
+    return None
+
+
+def _categorical(items, codes, clean=None):
+    """
+    Build a categorical column from field items and item indexes.
+
+    Parameters
+    ----------
+    items : list
+        Items of the field.
+    codes : array
+        Item index of each record.
+    clean : function
+        Function applied to each item label.
+
+    Returns
+    -------
+    column : Categorical
+        Categorical column.
+    """
+    labels = [None if item is None else str(item).strip() for item in items]
+    if clean is not None:
+        labels = [None if label is None else clean(label) for label in labels]
+    categories = sorted({label for label in labels if label is not None})
+    position = {label: i for i, label in enumerate(categories)}
+    mapping = np.array([-1 if label is None else position[label] for label in labels] + [-1], dtype=np.int64)
+    return pd.Categorical.from_codes(mapping[codes], categories=categories)
+
+
+def _numbers(items, codes):
+    """
+    Build a float column from field items and item indexes.
+
+    Parameters
+    ----------
+    items : list
+        Items of the field.
+    codes : array
+        Item index of each record.
+
+    Returns
+    -------
+    column : ndarray
+        Float values, NaN for missing items.
+    """
+    values = []
+    for item in items:
+        try:
+            values.append(float(item))
+        except (TypeError, ValueError):
+            values.append(np.nan)
+    return np.array(values + [np.nan], dtype=np.float64)[codes]
+
+
+def build_pivot_frame(names, items, codes, aliases=None):
+    """
+    Build the year_month/uf/product/unit/volume dataframe from the cache columns.
+
+    The ANP caches store one column per month (wide layout), caches with a month
+    field and a volume field (long layout) are also supported.
+
+    Parameters
+    ----------
+    names : list
+        Name of the cache fields.
+    items : list
+        Items of each field.
+    codes : list
+        Item indexes of each field.
+    aliases : dict
+        Names of each field, FIELD_ALIASES by default.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe.
+    """
+    codes = [np.frombuffer(column, dtype=np.int64) if len(column) else np.zeros(0, dtype=np.int64) for column in codes]
+    field_uf = _find_field(names, 'uf', aliases)
+    field_product = _find_field(names, 'product', aliases)
+    field_year = _find_field(names, 'year', aliases)
+    field_unit = _find_field(names, 'unit', aliases)
+    if None in (field_uf, field_product, field_year):
+        raise ValueError(f'Pivot cache without UF/product/year fields: {names}')
+
+    # Columns by month: (month, volume codes)
+    field_month = _find_field(names, 'month', aliases)
+    if field_month is not None:
+        field_volume = _find_field(names, 'volume', aliases)
+        month_items = [month_number(item) if item is not None else None for item in items[field_month]]
+        month_map = np.array([m if m is not None else 0 for m in month_items] + [0], dtype=np.int64)
+        months = month_map[codes[field_month]]
+        volume = _numbers(items[field_volume], codes[field_volume])
+        repeat = 1
+    else:
+        month_fields = [(month_number(name), i) for i, name in enumerate(names) if month_number(name)]
+        if not month_fields:
+            raise ValueError(f'Pivot cache without month fields: {names}')
+        rows = len(codes[field_year])
+        months = np.repeat(np.array([m for m, _ in month_fields], dtype=np.int64), rows)
+        volume = np.concatenate([_numbers(items[i], codes[i]) for _, i in month_fields])
+        repeat = len(month_fields)
+
+    # Dimensions repeated for every month column
+    year = np.tile(_numbers(items[field_year], codes[field_year]), repeat)
+    uf = _categorical(items[field_uf], np.tile(codes[field_uf], repeat))
+    product = _categorical(items[field_product], np.tile(codes[field_product], repeat), clean_product_name)
+    if field_unit is not None:
+        unit = _categorical(items[field_unit], np.tile(codes[field_unit], repeat))
+    else:
+        unit = _categorical(items[field_product], np.tile(codes[field_product], repeat), product_unit)
+
+    # Keep only the periods with volume
+    keep = ~np.isnan(volume) & ~np.isnan(year) & (months > 0)
+    df = pd.DataFrame({
+        'year_month': month_start(year[keep], months[keep]),
+        'uf': uf[keep],
+        'product': product[keep],
+        'unit': unit[keep],
+        'volume': volume[keep],
+    })
+    df = sort(df).reset_index(drop=True)
+    return df
+
+
+def read_pivot_cache(path, cache_number=1, aliases=None):
+    """
+    Extract the records of a pivot cache from a xlsx file, without Excel.
+
+    Parameters
+    ----------
+    path : String
+        Path of the xlsx file.
+    cache_number : int
+        Position of the cache in the file (1 for the first cache).
+    aliases : dict
+        Names of each field, FIELD_ALIASES by default.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the columns year_month, uf, product, unit and volume.
+    """
+    caches = list_pivot_caches(path)
+    if not 1 <= cache_number <= len(caches):
+        raise ValueError(f'Pivot cache {cache_number} not found in {path}')
+    definition, records = caches[cache_number - 1]
+
+    with zipfile.ZipFile(path) as zf:
+        with zf.open(definition) as fp:
+            names, items = read_cache_definition(fp)
+        with zf.open(records) as fp:
+            codes = read_cache_records(fp, items)
+    return build_pivot_frame(names, items, codes, aliases)
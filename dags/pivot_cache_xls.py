@@ -0,0 +1,447 @@
+import struct
+from array import array
+from datetime import datetime
+
+from pivot_cache import build_pivot_frame
+
+# Compound file (OLE) constants
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+NO_STREAM = 0xFFFFFFFF
+
+# Storage of the pivot caches inside the xls file
+PIVOT_CACHE_STORAGE = '_SX_DB_CUR'
+
+# BIFF8 records of the pivot cache stream
+RECORD_EOF = 0x000A
+RECORD_CONTINUE = 0x003C
+RECORD_SXDB = 0x00C6
+RECORD_SXFDB = 0x00C7
+RECORD_SXDBB = 0x00C8
+RECORD_SXNUM = 0x00C9
+RECORD_SXBOOL = 0x00CA
+RECORD_SXERR = 0x00CB
+RECORD_SXINT = 0x00CC
+RECORD_SXSTRING = 0x00CD
+RECORD_SXDTR = 0x00CE
+RECORD_SXNIL = 0x00CF
+ITEM_RECORDS = (RECORD_SXNUM, RECORD_SXBOOL, RECORD_SXERR, RECORD_SXINT, RECORD_SXSTRING, RECORD_SXDTR, RECORD_SXNIL)
+
+
+class CompoundFile:
+    """
+    Minimal reader of OLE compound files, streams are read sector by sector.
+
+    Parameters
+    ----------
+    path : String
+        Path of the xls file.
+    """
+
+    def __init__(self, path):
+        self.fp = open(path, 'rb')
+        header = self.fp.read(512)
+        if header[:8] != OLE_SIGNATURE:
+            self.fp.close()
+            raise ValueError(f'{path} is not an OLE compound file')
+
+        self.sector_size = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from('<H', header, 0x20)[0]
+        fat_sectors, first_dir = struct.unpack_from('<II', header, 0x2C)
+        self.mini_cutoff, first_minifat, minifat_sectors, first_difat, difat_sectors = struct.unpack_from('<IIIII', header, 0x38)
+
+        # Sectors of the FAT (first 109 in the header, the others in the DIFAT chain)
+        difat = list(struct.unpack_from('<109I', header, 0x4C))
+        sector = first_difat
+        per_sector = self.sector_size // 4
+        for _ in range(difat_sectors):
+            entries = struct.unpack(f'<{per_sector}I', self._read_sector(sector))
+            difat.extend(entries[:-1])
+            sector = entries[-1]
+        self.fat = array('I')
+        for sector in difat[:fat_sectors]:
+            self.fat.frombytes(self._read_sector(sector))
+
+        self.minifat = array('I', b''.join(self._read_chain(first_minifat)))
+        self.entries = self._read_directory(first_dir)
+        root = self.entries[0]
+        self.mini_stream_start = root['start']
+        self._mini_stream = None
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_sector(self, sector):
+        self.fp.seek((sector + 1) * self.sector_size)
+        return self.fp.read(self.sector_size)
+
+    def _read_chain(self, sector):
+        # Follow the FAT chain yielding one sector at a time
+        while sector < len(self.fat):
+            yield self._read_sector(sector)
+            sector = self.fat[sector]
+
+    def _read_directory(self, sector):
+        entries = []
+        for data in self._read_chain(sector):
+            for offset in range(0, len(data), 128):
+                entry = data[offset:offset + 128]
+                name_size = struct.unpack_from('<H', entry, 64)[0]
+                entries.append({
+                    'name': entry[:max(name_size - 2, 0)].decode('utf-16-le'),
+                    'type': entry[66],
+                    'left': struct.unpack_from('<I', entry, 68)[0],
+                    'right': struct.unpack_from('<I', entry, 72)[0],
+                    'child': struct.unpack_from('<I', entry, 76)[0],
+                    'start': struct.unpack_from('<I', entry, 116)[0],
+                    'size': struct.unpack_from('<I', entry, 120)[0],
+                })
+        return entries
+
+    def children(self, index):
+        """
+        List the entries of a storage.
+
+        Parameters
+        ----------
+        index : int
+            Directory index of the storage.
+
+        Returns
+        -------
+        children : dict
+            Directory index of each entry by name.
+        """
+        children = {}
+        pending = [self.entries[index]['child']]
+        while pending:
+            node = pending.pop()
+            if node == NO_STREAM or node >= len(self.entries):
+                continue
+            entry = self.entries[node]
+            children[entry['name']] = node
+            pending.extend((entry['left'], entry['right']))
+        return children
+
+    def find(self, path):
+        """
+        Find the directory index of a stream or storage.
+
+        Parameters
+        ----------
+        path : String
+            Path separated by '/', e.g. _SX_DB_CUR/0001.
+
+        Returns
+        -------
+        index : int
+            Directory index or None.
+        """
+        index = 0
+        for name in path.split('/'):
+            index = self.children(index).get(name)
+            if index is None:
+                return None
+        return index
+
+    def iter_stream(self, index):
+        """
+        Read a stream in chunks.
+
+        Parameters
+        ----------
+        index : int
+            Directory index of the stream.
+
+        Returns
+        -------
+        chunks : generator
+            Bytes of the stream, one sector at a time.
+        """
+        entry = self.entries[index]
+        remaining = entry['size']
+        if remaining < self.mini_cutoff:
+            # Small streams live in the mini stream of the root entry
+            if self._mini_stream is None:
+                self._mini_stream = b''.join(self._read_chain(self.mini_stream_start))
+            sector = entry['start']
+            while remaining > 0 and sector not in (END_OF_CHAIN, FREE_SECTOR):
+                offset = sector * self.mini_sector_size
+                chunk = self._mini_stream[offset:offset + min(self.mini_sector_size, remaining)]
+                remaining -= len(chunk)
+                yield chunk
+                sector = self.minifat[sector]
+            return
+        for chunk in self._read_chain(entry['start']):
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+            if remaining <= 0:
+                break
+
+
+def iter_biff_records(chunks):
+    """
+    Split a BIFF8 stream in records, CONTINUE records are appended to the previous record.
+
+    Parameters
+    ----------
+    chunks : generator
+        Bytes of the stream.
+
+    Returns
+    -------
+    records : generator
+        Pairs (record type, data).
+    """
+    buffer = bytearray()
+    pending = None
+    for chunk in chunks:
+        buffer += chunk
+        offset = 0
+        while len(buffer) - offset >= 4:
+            rtype, size = struct.unpack_from('<HH', buffer, offset)
+            if len(buffer) - offset - 4 < size:
+                break
+            data = bytes(buffer[offset + 4:offset + 4 + size])
+            offset += 4 + size
+            if rtype == RECORD_CONTINUE and pending is not None:
+                pending = (pending[0], pending[1] + data)
+                continue
+            if pending is not None:
+                yield pending
+            pending = (rtype, data)
+        del buffer[:offset]
+    if pending is not None:
+        yield pending
+
+
+def _unicode_string(data, offset, size):
+    """
+    Decode a XLUnicodeStringNoCch.
+
+    Parameters
+    ----------
+    data : bytes
+        Record data.
+    offset : int
+        Position of the fHighByte flag.
+    size : int
+        Number of characters.
+
+    Returns
+    -------
+    value : String
+        Decoded string.
+    """
+    if size == 0xFFFF:
+        return None
+    if data[offset] & 0x01:
+        return data[offset + 1:offset + 1 + size * 2].decode('utf-16-le')
+    return data[offset + 1:offset + 1 + size].decode('latin-1')
+
+
+def _decode_item(rtype, data):
+    """
+    Decode a cache item record.
+
+    Parameters
+    ----------
+    rtype : int
+        Record type (SXNum, SXString...).
+    data : bytes
+        Record data.
+
+    Returns
+    -------
+    value : object
+        Python value, None for missing and error items.
+    """
+    if rtype == RECORD_SXNUM:
+        return struct.unpack_from('<d', data)[0]
+    if rtype == RECORD_SXSTRING:
+        return _unicode_string(data, 2, struct.unpack_from('<H', data)[0])
+    if rtype == RECORD_SXINT:
+        return float(struct.unpack_from('<h', data)[0])
+    if rtype == RECORD_SXBOOL:
+        return bool(struct.unpack_from('<H', data)[0])
+    if rtype == RECORD_SXDTR:
+        year, month, day, hour, minute, second = struct.unpack_from('<HHBBBB', data)
+        return datetime(year, month, day, hour, minute, second)
+    return None
+
+
+def read_cache_stream(chunks):
+    """
+    Read the fields of a pivot cache stream and return a generator of its records.
+
+    Parameters
+    ----------
+    chunks : generator
+        Bytes of the _SX_DB_CUR stream.
+
+    Returns
+    -------
+    names : list
+        Name of the cache fields.
+    items : list
+        Shared items of each field.
+    records : generator
+        One list per cache record, item indexes for the fields with shared items
+        (SXDBB) and values for the other fields.
+    """
+    records = iter_biff_records(chunks)
+    names = []
+    items = []
+    indexed = []
+    wide_index = []
+    pending_items = 0
+    first_record = None
+
+    # Header: SXDB followed by one SXFDB and its items per field
+    for rtype, data in records:
+        if rtype == RECORD_SXFDB:
+            flags = struct.unpack_from('<H', data)[0]
+            pending_items = struct.unpack_from('<H', data, 12)[0]
+            names.append(_unicode_string(data, 16, struct.unpack_from('<H', data, 14)[0]))
+            items.append([])
+            indexed.append(bool(flags & 0x0001))
+            # 16-bit item indexes in the SXDBB records (fields with more than 255 items)
+            wide_index.append(bool(flags & 0x0200))
+        elif rtype in ITEM_RECORDS and pending_items:
+            items[-1].append(_decode_item(rtype, data))
+            pending_items -= 1
+        elif rtype in ITEM_RECORDS or rtype in (RECORD_SXDBB, RECORD_EOF):
+            first_record = (rtype, data)
+            break
+
+    def iter_records():
+        # Format of the SXDBB blob: one index per indexed field
+        layout = '<' + ''.join('H' if wide else 'B' for wide, index in zip(wide_index, indexed) if index)
+        inline = [field for field, index in enumerate(indexed) if not index]
+        stream = records if first_record is None else _chain(first_record, records)
+        record = None
+        position = 0
+        for rtype, data in stream:
+            if rtype == RECORD_SXDBB:
+                record = [None] * len(names)
+                for field, code in zip([f for f, index in enumerate(indexed) if index], struct.unpack_from(layout, data)):
+                    record[field] = code
+                position = 0
+            elif rtype in ITEM_RECORDS:
+                if record is None:
+                    record = [None] * len(names)
+                    position = 0
+                record[inline[position]] = _decode_item(rtype, data)
+                position += 1
+            elif rtype == RECORD_EOF:
+                break
+            else:
+                continue
+            if position == len(inline):
+                yield record
+                record = None
+                position = 0
+
+    return names, items, iter_records()
+
+
+def _chain(first, records):
+    yield first
+    yield from records
+
+
+def list_pivot_cache_streams(path):
+    """
+    List the pivot cache streams of a xls file.
+
+    Parameters
+    ----------
+    path : String
+        Path of the xls file.
+
+    Returns
+    -------
+    streams : list
+        Stream paths (_SX_DB_CUR/0001...) ordered by the cache id.
+    """
+    with CompoundFile(path) as cf:
+        storage = cf.find(PIVOT_CACHE_STORAGE)
+        if storage is None:
+            return []
+        return [f'{PIVOT_CACHE_STORAGE}/{name}' for name in sorted(cf.children(storage))]
+
+
+def iter_pivot_cache_records(path, cache_number=1):
+    """
+    Stream the records of a pivot cache of a xls file, with the items decoded.
+
+    Parameters
+    ----------
+    path : String
+        Path of the xls file.
+    cache_number : int
+        Position of the cache in the file (1 for the first cache).
+
+    Returns
+    -------
+    records : generator
+        One dict (field name -> value) per cache record.
+    """
+    streams = list_pivot_cache_streams(path)
+    if not 1 <= cache_number <= len(streams):
+        raise ValueError(f'Pivot cache {cache_number} not found in {path}')
+    with CompoundFile(path) as cf:
+        names, items, records = read_cache_stream(cf.iter_stream(cf.find(streams[cache_number - 1])))
+        for record in records:
+            yield {
+                name: items[field][value] if items[field] and isinstance(value, int) else value
+                for field, (name, value) in enumerate(zip(names, record))
+            }
+
+
+def read_pivot_cache_xls(path, cache_number=1, aliases=None):
+    """
+    Extract the records of a pivot cache from a legacy xls (BIFF8) file, without Excel.
+
+    Parameters
+    ----------
+    path : String
+        Path of the xls file.
+    cache_number : int
+        Position of the cache in the file (1 for the first cache).
+    aliases : dict
+        Names of each field, FIELD_ALIASES of pivot_cache by default.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the columns year_month, uf, product, unit and volume.
+    """
+    streams = list_pivot_cache_streams(path)
+    if not 1 <= cache_number <= len(streams):
+        raise ValueError(f'Pivot cache {cache_number} not found in {path}')
+
+    with CompoundFile(path) as cf:
+        names, items, records = read_cache_stream(cf.iter_stream(cf.find(streams[cache_number - 1])))
+        codes = [array('q') for _ in names]
+        inline = [{} for _ in names]
+        for record in records:
+            for field, value in enumerate(record):
+                if isinstance(value, int) and not isinstance(value, bool) and field < len(items) and items[field]:
+                    codes[field].append(value)
+                    continue
+                # Inline value, keep one item per distinct value
+                code = inline[field].get(value)
+                if code is None:
+                    code = inline[field][value] = len(items[field])
+                    items[field].append(value)
+                codes[field].append(code)
+    return build_pivot_frame(names, items, codes, aliases)
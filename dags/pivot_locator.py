@@ -0,0 +1,256 @@
+import os
+import json
+import tempfile
+import unicodedata
+from collections import deque
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from downloader import file_sha256
+
+# Lock of the anchors file, only on posix (the tasks run in the Linux containers of docker-compose),
+# without it the file is still replaced atomically but concurrent updates may drop an anchor
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Anchors of the tables found in each pivot file, by checksum of the file
+ANCHORS_FILE = 'pivot_tables.json'
+
+# Number of files kept in the anchors file
+ANCHORS_KEPT = 8
+
+# Label of the first column of the header row of each table
+HEADER_LABELS = ('MÊS', 'MES')
+
+# Label of the last row of each table
+TOTAL_LABEL = 'TOTAL DO ANO'
+
+# Rows above the header row searched for the title of the table
+TITLE_LOOKBACK = 8
+
+
+def normalize(text):
+    """
+    Upper case text without accents, used to compare labels and titles.
+
+    Parameters
+    ----------
+    text : String
+        Text.
+
+    Returns
+    -------
+    text : String
+        Normalized text.
+    """
+    text = unicodedata.normalize('NFKD', str(text).strip().upper())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+HEADER_KEYS = {normalize(label) for label in HEADER_LABELS}
+
+
+def _year(value):
+    # Year of a header cell, None when the cell is not a year
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value.strip())
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value == int(value) and 1900 <= value <= 2100:
+        return int(value)
+    return None
+
+
+def _header(row):
+    # Columns (label, first year, last year) of a header row: the label Mês followed by years
+    for i, value in enumerate(row):
+        if isinstance(value, str) and normalize(value) in HEADER_KEYS:
+            last = i
+            while last + 1 < len(row) and _year(row[last + 1]) is not None:
+                last += 1
+            if last > i:
+                return i, last
+    return None
+
+
+def _title(rows):
+    # Longest text of the rows above the header, the titles are long sentences
+    texts = [value.strip() for row in rows for value in row if isinstance(value, str) and value.strip()]
+    return max(texts, key=len) if texts else None
+
+
+def _frame(header, rows, first, last):
+    columns = [header[first]] + [_year(value) for value in header[first + 1:last + 1]]
+    data = [list(row[first:last + 1]) + [None] * (last + 1 - len(row)) for row in rows]
+    df = pd.DataFrame(data, columns=columns)
+    df[columns[1:]] = df[columns[1:]].apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+def scan_pivot_tables(rows):
+    """
+    Find the pivot tables in the rows of a sheet in a single pass.
+
+    A table starts at a header row with the label Mês followed by year cells,
+    the title is searched in the rows above it and the table ends at the
+    Total do Ano row (or at the first row without label).
+
+    Parameters
+    ----------
+    rows : iterable
+        Values of each row of the sheet (first row is row 1).
+
+    Returns
+    -------
+    tables : list
+        Dict of each table: title, header_row, last_row, first_column and
+        last_column (1-based) and frame (dataframe like read_excel).
+    """
+    tables = []
+    recent = deque(maxlen=TITLE_LOOKBACK)
+    current = None
+    for number, row in enumerate(rows, 1):
+        row = tuple(row)
+        if current is not None:
+            first, last = current['columns']
+            label = row[first] if len(row) > first else None
+            if label is None or not str(label).strip():
+                current = _close(tables, current, number - 1)
+            else:
+                current['rows'].append(row)
+                if normalize(label) == TOTAL_LABEL:
+                    current = _close(tables, current, number)
+                recent.append(row)
+                continue
+        header = _header(row)
+        if header is not None:
+            current = {'title': _title(recent), 'header_row': number, 'header': row, 'columns': header, 'rows': []}
+        recent.append(row)
+    if current is not None:
+        _close(tables, current, number)
+    return tables
+
+
+def _close(tables, current, last_row):
+    first, last = current['columns']
+    tables.append({
+        'title': current['title'],
+        'header_row': current['header_row'],
+        'last_row': last_row,
+        'first_column': first + 1,
+        'last_column': last + 1,
+        'frame': _frame(current['header'], current['rows'], first, last),
+    })
+    return None
+
+
+def _load_anchors(cache_file):
+    try:
+        with open(cache_file, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_anchors(cache_file, checksum, sheet_name, tables):
+    with open(cache_file + '.lock', 'w') as lock_file:
+        # The mapped tasks (_check_dataset) update the anchors file at the same time
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        anchors = _load_anchors(cache_file)
+        anchors.pop(checksum, None)
+        anchors[checksum] = {
+            'sheet_name': sheet_name,
+            'tables': [{key: value for key, value in table.items() if key != 'frame'} for table in tables],
+        }
+        # Only the most recent files are kept (dicts keep the insertion order)
+        anchors = dict(list(anchors.items())[-ANCHORS_KEPT:])
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(cache_file) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(cache_file)))
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            json.dump(anchors, fp, indent=2, ensure_ascii=False)
+        os.replace(tmp, cache_file)
+
+
+def _read_anchored(worksheet, anchors):
+    # Tables at the anchored rows, None when the layout does not match. openpyxl still parses
+    # the sheet from the first row, the parsing only stops after the last row of the tables
+    first_row = min(table['header_row'] for table in anchors)
+    last_row = max(table['last_row'] for table in anchors)
+    rows = {number: tuple(row) for number, row in enumerate(
+        worksheet.iter_rows(min_row=first_row, max_row=last_row, values_only=True), first_row)}
+    tables = []
+    for anchor in anchors:
+        first, last = anchor['first_column'] - 1, anchor['last_column'] - 1
+        header = rows.get(anchor['header_row'], ())
+        if _header(header) != (first, last):
+            return None
+        body = [rows.get(number, ()) for number in range(anchor['header_row'] + 1, anchor['last_row'] + 1)]
+        tables.append(dict(anchor, frame=_frame(header, body, first, last)))
+    return tables
+
+
+def locate_pivot_tables(file_name, sheet_name='Plan1', cache_file=None):
+    """
+    Read all the pivot tables of a sheet of the pivot file.
+
+    The sheet is streamed once in read-only mode and the tables are found by
+    their title and header row (see scan_pivot_tables). The anchors found are
+    cached by checksum of the file, the next runs with the same file skip the
+    search of the titles and headers. They do not skip the parsing: openpyxl
+    parses the sheet XML from the first row even with min_row and only stops
+    after the last row of the tables, which in the ANP file is close to the end
+    of the sheet (about 10% faster than the search on the synthetic file).
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the xlsx file.
+    sheet_name : String
+        Sheet of the tables.
+    cache_file : String
+        Anchors file, pivot_tables.json in the folder of the file by default.
+
+    Returns
+    -------
+    tables : list
+        Dict of each table (see scan_pivot_tables), in the order of the sheet.
+    """
+    cache_file = cache_file or os.path.join(os.path.dirname(os.path.abspath(file_name)), ANCHORS_FILE)
+    checksum = file_sha256(file_name)
+    cached = _load_anchors(cache_file).get(checksum)
+
+    workbook = load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name]
+        tables = None
+        if cached and cached['sheet_name'] == sheet_name and cached['tables']:
+            tables = _read_anchored(worksheet, cached['tables'])
+        if tables is None:
+            tables = scan_pivot_tables(worksheet.iter_rows(values_only=True))
+            _save_anchors(cache_file, checksum, sheet_name, tables)
+    finally:
+        workbook.close()
+    return tables
+
+
+def find_table(tables, keyword):
+    """
+    Table whose title contains a keyword.
+
+    Parameters
+    ----------
+    tables : list
+        Tables found (see locate_pivot_tables).
+    keyword : String
+        Keyword of the title, compared without case and accents.
+
+    Returns
+    -------
+    frame : ndarray
+        Table, like read_excel (column Mês and one column per year).
+    """
+    for table in tables:
+        if table['title'] and normalize(keyword) in normalize(table['title']):
+            return table['frame']
+    raise KeyError(f'Pivot table not found: {keyword}')
@@ -0,0 +1,288 @@
+"""
+Local query service of the cleaned datasets: filtered aggregates by dataset,
+product, uf and range of months, read from the volume cubes of _clean_dataset
+(memory-mapped, loaded once and reloaded when the pipeline rebuilds them).
+
+HTTP (JSON):
+    python dags/query_service.py serve --port 8050
+    GET /query?dataset=diesel&uf=SÃO PAULO&product=ÓLEO DIESEL S-10&start=2015-03&end=2019-11&group_by=year
+    GET /metadata
+    GET /health
+
+CLI:
+    python dags/query_service.py query --dataset diesel --uf "SÃO PAULO" --start 2015-03 --end 2019-11 --group-by year
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from cube import load_cube, cube_files, GROUP_KEYS
+
+# Datasets of the service
+DATASETS = ['derivative', 'diesel']
+
+# Results kept by the LRU cache
+CACHE_SIZE = int(os.environ.get('RAIZEN_QUERY_CACHE', '1024'))
+
+# Address of the HTTP server
+HOST = os.environ.get('RAIZEN_QUERY_HOST', '127.0.0.1')
+PORT = int(os.environ.get('RAIZEN_QUERY_PORT', '8050'))
+
+
+def _labels(values):
+    # Filter of labels as a sorted tuple (hashable key of the cache), None for all
+    if values is None:
+        return None
+    values = [values] if isinstance(values, str) else list(values)
+    return tuple(sorted(set(values))) if values else None
+
+
+class StaleCube(Exception):
+    """
+    Cube reloaded after the key of a query was computed, its result would be
+    cached under the version of the previous cube.
+    """
+
+
+class QueryService:
+    """
+    Aggregates of the cleaned datasets read from their volume cubes.
+
+    The cubes are mapped in memory when first used and reloaded when their
+    metadata file changes, the results are kept in an LRU cache keyed by the
+    query and by the version of the cubes. The service is thread safe.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets, the dados folder by default.
+    cache_size : int
+        Results kept by the LRU cache.
+    """
+
+    def __init__(self, path=None, cache_size=CACHE_SIZE):
+        self.path = path or os.path.dirname(os.path.abspath(__file__)) + '/dados/'
+        self.cubes = {}
+        self.lock = threading.Lock()
+        self._cached = functools.lru_cache(maxsize=cache_size)(self._aggregate)
+
+    def cube(self, dataset):
+        """
+        Cube of a dataset, reloaded when the pipeline rebuilt it.
+
+        Returns
+        -------
+        version : int
+            Modification time of the metadata of the cube.
+        cube : VolumeCube
+            Cube.
+        """
+        if dataset not in DATASETS:
+            raise KeyError(f'Unknown dataset: {dataset}')
+        version = os.stat(cube_files(self.path, dataset)[1]).st_mtime_ns
+        loaded = self.cubes.get(dataset)
+        if loaded is None or loaded[0] != version:
+            with self.lock:
+                loaded = self.cubes.get(dataset)
+                if loaded is None or loaded[0] != version:
+                    loaded = (version, load_cube(self.path, dataset))
+                    self.cubes[dataset] = loaded
+        return loaded
+
+    def _aggregate(self, datasets, products, ufs, start, end, by, versions):
+        # Records of the datasets, each filtered by the labels it has, read from the cubes of the versions of the key
+        records = []
+        known = set()
+        for dataset, version in zip(datasets, versions):
+            loaded = self.cubes[dataset]
+            if loaded[0] != version:
+                raise StaleCube(dataset)
+            cube = loaded[1]
+            selected = []
+            for labels, positions in ((products, cube.positions_products), (ufs, cube.positions_ufs)):
+                if labels is None:
+                    selected.append(None)
+                    continue
+                labels = [label for label in labels if label in positions]
+                known.update(labels)
+                selected.append(labels)
+            if not all(selected[i] is None or selected[i] for i in range(2)):
+                continue
+            df = cube.aggregate(selected[0], selected[1], start, end, by)
+            df.insert(0, 'dataset', dataset)
+            records.extend(df.to_dict('records'))
+        missing = set(products or ()) | set(ufs or ())
+        if missing - known:
+            raise KeyError(f'Not in the datasets: {sorted(missing - known)}')
+        return tuple(records)
+
+    def query(self, dataset=None, product=None, uf=None, start=None, end=None, group_by=()):
+        """
+        Volume (m3) and rows of a range of months, by dataset and optionally
+        grouped by product, uf, year or month.
+
+        Parameters
+        ----------
+        dataset : String or list
+            Datasets (derivative, diesel), both by default.
+        product : String or list
+            Products, all by default.
+        uf : String or list
+            UFs, all by default.
+        start : String
+            First month (YYYY-MM), the first of the dataset by default.
+        end : String
+            Last month (YYYY-MM, included), the last of the dataset by default.
+        group_by : list
+            Keys of the groups (product, uf, year, month).
+
+        Returns
+        -------
+        records : tuple
+            Dicts with the dataset, the keys of the group, volume and rows.
+        """
+        datasets = _labels(dataset) or tuple(DATASETS)
+        by = [group_by] if isinstance(group_by, str) else list(group_by or ())
+        unknown = set(by) - set(GROUP_KEYS)
+        if unknown:
+            raise ValueError(f'Unknown group keys: {sorted(unknown)}')
+        while True:
+            versions = tuple(self.cube(name)[0] for name in datasets)
+            try:
+                return self._cached(datasets, _labels(product), _labels(uf), start or None, end or None,
+                                    tuple(key for key in GROUP_KEYS if key in by), versions)
+            except StaleCube:
+                # Rebuilt by the pipeline meanwhile (results raising are not cached), the versions are read again
+                continue
+
+    def metadata(self):
+        """
+        Products, ufs and months of each dataset.
+        """
+        result = {}
+        for dataset in DATASETS:
+            try:
+                cube = self.cube(dataset)[1]
+            except FileNotFoundError:
+                continue
+            result[dataset] = {key: cube.metadata[key] for key in ('products', 'ufs', 'first_month', 'months')}
+        return result
+
+    def cache_info(self):
+        info = self._cached.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Requests of the HTTP server (GET /query, /metadata, /health), answered in JSON.
+    """
+
+    # Persistent connections, the responses have Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written apart, without TCP_NODELAY each response waits for the delayed ACK (40ms)
+    disable_nagle_algorithm = True
+    service = None
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        try:
+            if url.path == '/query':
+                start = time.perf_counter()
+                records = self.service.query(
+                    dataset=params.get('dataset'),
+                    product=params.get('product'),
+                    uf=params.get('uf'),
+                    start=params.get('start', [None])[0],
+                    end=params.get('end', [None])[0],
+                    group_by=[key for value in params.get('group_by', []) for key in value.split(',') if key],
+                )
+                self._send(200, {'records': records, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)})
+            elif url.path == '/metadata':
+                self._send(200, self.service.metadata())
+            elif url.path == '/health':
+                self._send(200, {'status': 'ok', 'cache': self.service.cache_info()})
+            else:
+                self._send(404, {'error': f'Not found: {url.path}'})
+        except (KeyError, ValueError) as error:
+            self._send(400, {'error': str(error.args[0] if error.args else error)})
+        except FileNotFoundError as error:
+            self._send(503, {'error': f'Cube not built: {error.filename}'})
+
+    def log_message(self, format, *args):
+        # Requests are not logged, the load tests would be bound by the log
+        pass
+
+
+def serve(path=None, host=HOST, port=PORT, cache_size=CACHE_SIZE):
+    """
+    Start the HTTP server, a thread per request.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the datasets, the dados folder by default.
+    host : String
+        Address of the server.
+    port : int
+        Port of the server.
+    cache_size : int
+        Results kept by the LRU cache.
+    """
+    handler = type('Handler', (QueryHandler,), {'service': QueryService(path, cache_size)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f'Query service - http://{host}:{server.server_address[1]}/', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', help='folder of the datasets, the dados folder by default')
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('serve', help='start the HTTP server')
+    server.add_argument('--host', default=HOST)
+    server.add_argument('--port', type=int, default=PORT)
+    server.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    query = commands.add_parser('query', help='print the result of a query')
+    query.add_argument('--dataset', nargs='+', choices=DATASETS)
+    query.add_argument('--product', nargs='+')
+    query.add_argument('--uf', nargs='+')
+    query.add_argument('--start', help='first month (YYYY-MM)')
+    query.add_argument('--end', help='last month (YYYY-MM, included)')
+    query.add_argument('--group-by', nargs='+', choices=GROUP_KEYS, default=[])
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.path, args.host, args.port, args.cache_size)
+        return
+    try:
+        records = QueryService(args.path).query(args.dataset, args.product, args.uf, args.start, args.end, args.group_by)
+    except (KeyError, ValueError) as error:
+        parser.error(error.args[0] if error.args else str(error))
+    for record in records:
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,89 +1,119 @@
-from airflow import DAG
-from airflow.operators.dummy_operator import DummyOperator
-from airflow.operators.python import PythonOperator
-
-from datetime import datetime
-from functions import _download_datasets, _download_data_pivot, _clean_file, _generation_file, _check_results
-
-docs = """
-### Purpose
-  This test consists in developing an ETL pipeline to extract internal pivot caches from consolidated reports made available by Brazilian government's regulatory agency for oil/fuels, ANP (Agência Nacional do Petróleo, Gás Natural e Biocombustíveis).
-    
-#### Inputs
-    This DAG downloads 3 files:
-    -> Sales, by distributors, of petroleum fuel derivatives by UF and product.
-    -> Sales, by distributors, of diesel oil by type and state.
-    -> Pivot caches from consolidated reports made available by the Brazilian government's regulatory agency for oil/fuels
-
-  These files will be used for the Analysis. 
-    
-#### Outputs
-    This pipeline produces a file containing 5 sheets:
-    - dags/dados/data_extracted.xlsx
-        -> Sheet 01 - Derived Data.
-        -> Sheet 02 - Diesel Data
-        -> Sheet 03 - Data. Consolidated Derivatives and Diesel.
-        -> Sheet 04 - Checks if the pivot data Totals are equal with the data extracted from Derivatives.
-        -> Sheet 05 - Checks if the pivot data Totals are the same with the data extracted from Diesel.
-    
-#### Questions
-  For any questions, please contact 
-  [anders.des@gmail.com](mailto:anders.des@gmail.com).
-"""
-  
-# parametros
-default_args = {
-    'owner': 'raizen',
-    'start_date': datetime(2022, 7, 1),
-    'depends_on_past': False
-}
-
-with DAG(
-    'raizen_test',
-    schedule_interval=None, 
-    catchup=False,
-    tags=['test', 'etl'],
-    default_args=default_args,
-    doc_md=docs,
-) as dag:
-    
-    start = DummyOperator(
-        task_id="start"
-    ) 
-
-    extract_datasets = PythonOperator(
-        task_id="extract_datasets", 
-        dag=dag,
-        python_callable=_download_datasets
-    )
- 
-    extract_pivot = PythonOperator(
-        task_id="extract_pivot", 
-        dag=dag,
-        python_callable=_download_data_pivot
-    )
-     
-    clean_files = PythonOperator(
-        task_id="clean_files", 
-        dag=dag,
-        python_callable=_clean_file
-    )
-    
-    generation_file_final = PythonOperator(
-        task_id="generation_file_final", 
-        dag=dag,
-        python_callable=_generation_file
-    )
-
-    check_results = PythonOperator(
-        task_id="check_results", 
-        dag=dag,
-        python_callable=_check_results
-    )
-    
-    end = DummyOperator(
-        task_id="end"
-    ) 
-                
-    start >> [extract_datasets, extract_pivot] >> clean_files >> generation_file_final >> check_results >> end
+from airflow import DAG
+from airflow.operators.dummy_operator import DummyOperator
+from airflow.operators.python import PythonOperator
+
+from datetime import datetime
+# Callables without heavy imports (tasks.py), functions.py is imported only when a task runs
+from tasks import _download_datasets, _download_data_pivot, _extract_pivot_cache, _clean_dataset, _check_dataset, _generation_sheet, _assemble_file, _load_dataset
+
+docs = """
+### Purpose
+  This test consists in developing an ETL pipeline to extract internal pivot caches from consolidated reports made available by Brazilian government's regulatory agency for oil/fuels, ANP (Agência Nacional do Petróleo, Gás Natural e Biocombustíveis).
+    
+#### Inputs
+    This DAG downloads 3 files:
+    -> Sales, by distributors, of petroleum fuel derivatives by UF and product.
+    -> Sales, by distributors, of diesel oil by type and state.
+    -> Pivot caches from consolidated reports made available by the Brazilian government's regulatory agency for oil/fuels
+
+  These files will be used for the Analysis. 
+    
+#### Outputs
+    This pipeline produces a file containing 6 sheets:
+    - dags/dados/data_extracted.xlsx
+        -> Sheet 01 - Derived Data.
+        -> Sheet 02 - Diesel Data
+        -> Sheet 03 - Data. Consolidated Derivatives and Diesel.
+        -> Sheet 04 - Checks if the pivot data Totals are equal with the data extracted from Derivatives.
+        -> Sheet 05 - Checks if the pivot data Totals are the same with the data extracted from Diesel.
+        -> Sheet 06 - Cells (year, year x month, year x UF and year x UF x product) that differ between the datasets and the pivot data.
+    - raizen.fuel_sales, in the Postgres of docker-compose, partitioned by dataset and year.
+    
+#### Questions
+  For any questions, please contact 
+  [anders.des@gmail.com](mailto:anders.des@gmail.com).
+"""
+  
+# Mapped tasks (dynamic task mapping), one instance per dataset
+DATASETS = [{'dataset': 'derivative'}, {'dataset': 'diesel'}]
+
+# parametros
+default_args = {
+    'owner': 'raizen',
+    'start_date': datetime(2022, 7, 1),
+    'depends_on_past': False
+}
+
+with DAG(
+    'raizen_test',
+    schedule_interval=None, 
+    catchup=False,
+    tags=['test', 'etl'],
+    default_args=default_args,
+    doc_md=docs,
+) as dag:
+    
+    start = DummyOperator(
+        task_id="start"
+    ) 
+
+    extract_datasets = PythonOperator(
+        task_id="extract_datasets", 
+        dag=dag,
+        python_callable=_download_datasets
+    )
+ 
+    extract_pivot = PythonOperator(
+        task_id="extract_pivot", 
+        dag=dag,
+        python_callable=_download_data_pivot
+    )
+     
+    extract_pivot_cache = PythonOperator(
+        task_id="extract_pivot_cache", 
+        dag=dag,
+        python_callable=_extract_pivot_cache
+    )
+     
+    # Each dataset is cleaned, reconciled and serialized by its own instance, the instances run concurrently
+    clean_files = PythonOperator.partial(
+        task_id="clean_files", 
+        dag=dag,
+        python_callable=_clean_dataset
+    ).expand(op_kwargs=DATASETS)
+    
+    check_results = PythonOperator.partial(
+        task_id="check_results", 
+        dag=dag,
+        python_callable=_check_dataset
+    ).expand(op_kwargs=DATASETS)
+
+    generation_sheets = PythonOperator.partial(
+        task_id="generation_sheets", 
+        dag=dag,
+        python_callable=_generation_sheet
+    ).expand(op_kwargs=DATASETS)
+    
+    # Each cleaned dataset is loaded into the Postgres of docker-compose (warehouse.py)
+    load_warehouse = PythonOperator.partial(
+        task_id="load_warehouse", 
+        dag=dag,
+        python_callable=_load_dataset
+    ).expand(op_kwargs=DATASETS)
+    
+    # Only copies the serialized sheets and the results into data_extracted.xlsx
+    generation_file_final = PythonOperator(
+        task_id="generation_file_final", 
+        dag=dag,
+        python_callable=_assemble_file
+    )
+    
+    end = DummyOperator(
+        task_id="end"
+    ) 
+                
+    start >> [extract_datasets, extract_pivot]
+    extract_datasets >> clean_files >> [check_results, generation_sheets] >> generation_file_final >> end
+    extract_pivot >> extract_pivot_cache >> check_results
+    clean_files >> load_warehouse >> end
     
\ No newline at end of file
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+
+from pivot_cache import month_number
+
+# Granularity levels of the reconciliation and their key columns
+LEVELS = {
+    'year': ['year'],
+    'year_month': ['year', 'month'],
+    'year_uf': ['year', 'uf'],
+    'year_uf_product': ['year', 'uf', 'product'],
+}
+
+# Tolerance of the comparison, |dataset - pivot| <= ATOL + RTOL * |pivot|
+ATOL = 0.01
+RTOL = 1e-9
+
+# Columns of the report
+REPORT_COLUMNS = ['source', 'level', 'year', 'month', 'uf', 'product', 'volume_df', 'volume_pivot', 'difference', 'status', 'value_equal']
+
+
+def prepare(df):
+    """
+    Normalize one side of the reconciliation: integer year and month columns,
+    uf and product as strings and rows without volume dropped.
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe with year_month (or year and month) and volume, uf and product are optional.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe with the columns year, month, uf, product (when present) and volume.
+    """
+    if 'year' in df.columns and 'month' in df.columns and df['year'].dtype.kind == 'i' and df['month'].dtype.kind == 'i':
+        return df[df['volume'].notna()].reset_index(drop=True)
+    data = {}
+    if 'year_month' in df.columns:
+        year_month = df['year_month']
+        if year_month.dtype.kind != 'M':
+            # Dates as text, parsed once per distinct month
+            codes, uniques = pd.factorize(year_month)
+            year_month = pd.to_datetime(uniques).to_numpy().take(codes)
+        # Months since 1970 (datetime64[M]), without the datetime accessors
+        months = np.asarray(year_month, dtype='datetime64[M]').astype(np.int64)
+        data['year'] = months // 12 + 1970
+        data['month'] = months % 12 + 1
+    else:
+        data['year'] = df['year'].to_numpy(dtype=np.int64)
+        data['month'] = df['month'].to_numpy(dtype=np.int64) if 'month' in df.columns else np.zeros(len(df), dtype=np.int64)
+    for column in ['uf', 'product']:
+        if column in df.columns:
+            # Categoricals of the schema are kept, their codes are encoded by _encode
+            values = df[column]
+            data[column] = values.array if isinstance(values.dtype, pd.CategoricalDtype) else np.asarray(values, dtype=object)
+    data['volume'] = df['volume'].to_numpy(dtype=np.float64)
+    df = pd.DataFrame(data)
+    return df[~np.isnan(data['volume'])].reset_index(drop=True)
+
+
+def _encode(sides, columns):
+    # Mixed radix int64 key of the columns, with the codes shared by both sides
+    keys = [np.zeros(len(df), dtype=np.int64) for df in sides]
+    radices = []
+    for column in columns:
+        if all(df[column].dtype.kind in 'iu' for df in sides):
+            values = np.concatenate([df[column].to_numpy() for df in sides])
+            low = int(values.min()) if len(values) else 0
+            codes = values.astype(np.int64) - low
+            uniques = np.arange(low, low + (int(codes.max()) + 1 if len(codes) else 1))
+            codes = np.split(codes, [len(sides[0])])
+        else:
+            codes, uniques = _shared_codes([df[column] for df in sides])
+        keys = [key * len(uniques) + code for key, code in zip(keys, codes)]
+        radices.append((column, len(uniques), uniques))
+    return keys, radices
+
+
+def _shared_codes(columns):
+    # Codes of the labels of each side in the sorted union of their labels, the
+    # categoricals are recoded by category instead of by row
+    pairs = []
+    for values in columns:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            pairs.append((values.cat.codes.to_numpy(), np.asarray(values.cat.categories, dtype=object)))
+        else:
+            pairs.append(pd.factorize(values.to_numpy()))
+    _, uniques = pd.factorize(np.concatenate([labels for _, labels in pairs]), sort=True)
+    codes = []
+    for side_codes, labels in pairs:
+        positions = np.append(pd.Index(uniques).get_indexer(labels), -1)
+        codes.append(positions[side_codes].astype(np.int64))
+    return codes, uniques
+
+
+def _decode(keys, radices):
+    columns = {}
+    for column, radix, uniques in reversed(radices):
+        keys, codes = np.divmod(keys, radix)
+        columns[column] = np.asarray(uniques)[codes]
+    return {column: columns[column] for column, _, _ in radices}
+
+
+def reconcile(df_dataset, df_pivot, levels=None, atol=ATOL, rtol=RTOL, source='pivot'):
+    """
+    Compare the dataset with the pivot at several granularities.
+
+    Both sides are aggregated with a hash group by on an integer key (year,
+    month, uf and product codes shared by both sides), each cell is compared
+    with a numeric tolerance.
+
+    Parameters
+    ----------
+    df_dataset : ndarray
+        Dataset (see prepare).
+    df_pivot : ndarray
+        Pivot data (see prepare).
+    levels : list
+        Levels compared (keys of LEVELS), all by default.
+    atol : float
+        Absolute tolerance.
+    rtol : float
+        Relative tolerance.
+    source : String
+        Name of the pivot data in the report.
+
+    Returns
+    -------
+    df : ndarray
+        One row per cell of each level with the volume of both sides, the
+        difference, the status (equal, different, missing_dataset, missing_pivot)
+        and value_equal.
+    """
+    df_dataset, df_pivot = prepare(df_dataset), prepare(df_pivot)
+    reports = []
+    for level in levels or LEVELS:
+        columns = LEVELS[level]
+        keys, radices = _encode([df_dataset, df_pivot], columns)
+
+        # Hash group by of both sides at once
+        codes, groups = pd.factorize(np.concatenate(keys))
+        size = len(groups)
+        codes_dataset, codes_pivot = codes[:len(keys[0])], codes[len(keys[0]):]
+        volume_df = np.bincount(codes_dataset, weights=df_dataset['volume'].to_numpy(), minlength=size)
+        volume_pivot = np.bincount(codes_pivot, weights=df_pivot['volume'].to_numpy(), minlength=size)
+        in_dataset = np.bincount(codes_dataset, minlength=size) > 0
+        in_pivot = np.bincount(codes_pivot, minlength=size) > 0
+
+        # Compare the cells
+        close = np.isclose(volume_df, volume_pivot, rtol=rtol, atol=atol)
+        status = np.select(
+            [~in_dataset, ~in_pivot, close],
+            ['missing_dataset', 'missing_pivot', 'equal'],
+            'different',
+        )
+        order = np.argsort(groups, kind='stable')
+        report = pd.DataFrame(_decode(groups[order], radices))
+        report['volume_df'] = np.where(in_dataset, volume_df, np.nan)[order]
+        report['volume_pivot'] = np.where(in_pivot, volume_pivot, np.nan)[order]
+        report['difference'] = report['volume_df'] - report['volume_pivot']
+        report['status'] = status[order]
+        report['value_equal'] = report['status'] == 'equal'
+        report.insert(0, 'level', level)
+        report.insert(0, 'source', source)
+        reports.append(report)
+    return pd.concat(reports, ignore_index=True).reindex(columns=REPORT_COLUMNS)
+
+
+def table_frame(df_table):
+    """
+    Convert a pivot table of the sheet (column Mês with the months and the
+    Total do Ano row, one column per year) to the months and the year totals.
+
+    Parameters
+    ----------
+    df_table : ndarray
+        Pivot table.
+
+    Returns
+    -------
+    months : ndarray
+        Columns year, month and volume of each month.
+    totals : ndarray
+        Columns year and volume of each year.
+    """
+    df = df_table.set_index(df_table.columns[0])
+    df.columns = [int(float(column)) for column in df.columns]
+    long = df.stack().rename('volume').reset_index()
+    long.columns = ['label', 'year', 'volume']
+    long['month'] = [month_number(label) or 0 for label in long['label']]
+    long['year'] = long['year'].astype(np.int64)
+    long['volume'] = pd.to_numeric(long['volume'], errors='coerce')
+    is_total = long['label'].astype(str).str.strip().str.upper() == 'TOTAL DO ANO'
+    months = long.loc[long['month'] > 0, ['year', 'month', 'volume']].reset_index(drop=True)
+    totals = long.loc[is_total, ['year', 'volume']].reset_index(drop=True)
+    totals['month'] = 0
+    return months, totals
+
+
+def reconcile_pivot(df_dataset, df_table=None, df_cache=None, atol=ATOL, rtol=RTOL):
+    """
+    Reconcile a dataset with its pivot table (year and year_month levels) and
+    with the records of its pivot cache (all levels).
+
+    Parameters
+    ----------
+    df_dataset : ndarray
+        Dataset.
+    df_table : ndarray
+        Pivot table of the sheet (see table_frame).
+    df_cache : ndarray
+        Records of the pivot cache.
+    atol : float
+        Absolute tolerance.
+    rtol : float
+        Relative tolerance.
+
+    Returns
+    -------
+    df : ndarray
+        Report of all the cells (see reconcile).
+    """
+    df_dataset = prepare(df_dataset)
+    reports = []
+    if df_table is not None:
+        months, totals = table_frame(df_table)
+        reports.append(reconcile(df_dataset, totals, ['year'], atol, rtol, 'pivot_table'))
+        reports.append(reconcile(df_dataset, months, ['year_month'], atol, rtol, 'pivot_table'))
+    if df_cache is not None:
+        reports.append(reconcile(df_dataset, df_cache, None, atol, rtol, 'pivot_cache'))
+    return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=REPORT_COLUMNS)
+
+
+def mismatches(report):
+    """
+    Cells of the report that are not equal.
+
+    Parameters
+    ----------
+    report : ndarray
+        Report (see reconcile).
+
+    Returns
+    -------
+    df : ndarray
+        Cells different or missing on one side.
+    """
+    return report[~report['value_equal']].reset_index(drop=True)
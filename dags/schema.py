@@ -0,0 +1,239 @@
+# Schema of the cleaned datasets, pywin32/schema.py is a copy of dags/schema.py (the extraction runs apart from the DAG)
+import numpy as np
+import pandas as pd
+
+# Columns of the cleaned datasets
+COLUMNS = ['year_month', 'uf', 'product', 'unit', 'volume', 'created_at']
+
+# Labels of the cleaned datasets, categoricals with the categories in order (sorting by them sorts by the text)
+CATEGORIES = ['uf', 'product', 'unit']
+
+# Order of the rows of the cleaned datasets
+SORT_KEYS = ['year_month', 'uf', 'product']
+
+# Columns of the datasets downloaded from the federal government
+DATASET_COLUMNS = ['year', 'month', 'region', 'uf', 'product', 'volume']
+
+# Dtypes of the downloaded datasets, the labels are parsed straight into categoricals
+DATASET_DTYPES = {'month': 'category', 'region': 'category', 'uf': 'category', 'product': 'category'}
+
+# Dtypes of the cleaned datasets read from csv
+CLEAN_DTYPES = {'uf': 'category', 'product': 'category', 'unit': 'category', 'volume': 'float64'}
+
+# Dates of the cleaned datasets, parsed when read from csv
+DATE_COLUMNS = ['year_month', 'created_at']
+
+
+def processing_time():
+    """
+    Date of the processing, stored once per batch in created_at.
+
+    Returns
+    -------
+    created_at : Timestamp
+        Current time, to the second.
+    """
+    return pd.Timestamp.now().floor('s')
+
+
+def month_start(year, month):
+    """
+    First day of each month, computed on the month numbers (datetime64[M])
+    instead of parsing dates.
+
+    Parameters
+    ----------
+    year : ndarray
+        Years.
+    month : ndarray
+        Months (1 to 12).
+
+    Returns
+    -------
+    year_month : ndarray
+        Array datetime64[ns].
+    """
+    months = (np.asarray(year, dtype=np.int64) - 1970) * 12 + np.asarray(month, dtype=np.int64) - 1
+    return months.astype('datetime64[M]').astype('datetime64[ns]')
+
+
+def categorical(values):
+    """
+    Categorical column with the categories in order, the existing categoricals
+    keep their codes when the categories are already in order.
+
+    Parameters
+    ----------
+    values : Series
+        Column.
+
+    Returns
+    -------
+    values : Series
+        Categorical column, missing values have the code -1.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        if categories.is_monotonic_increasing:
+            return values
+        return values.cat.reorder_categories(categories.sort_values())
+    return pd.Series(pd.Categorical(values), index=values.index, name=values.name)
+
+
+def map_categories(values, function):
+    """
+    Apply a function to the labels of a categorical column, once per category,
+    the labels equal after the function share a category.
+
+    Parameters
+    ----------
+    values : Series
+        Categorical column.
+    function : function
+        Called with each label.
+
+    Returns
+    -------
+    values : Series
+        Categorical column, the categories in order.
+    """
+    labels = np.array([function(label) for label in values.cat.categories], dtype=object)
+    # Code of each old category in the new categories, the missing values (-1) take the last one
+    mapping, uniques = pd.factorize(labels, sort=True)
+    codes = np.append(mapping, -1).take(values.cat.codes.to_numpy())
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=values.index, name=values.name)
+
+
+def strip_categories(values):
+    """
+    Trim whitespace from the labels of a categorical column.
+
+    Parameters
+    ----------
+    values : Series
+        Categorical column.
+
+    Returns
+    -------
+    values : Series
+        Categorical column.
+    """
+    return map_categories(values, lambda label: label.strip() if isinstance(label, str) else label)
+
+
+def created_at_column(created_at, rows, index=None):
+    """
+    Column created_at of a batch: a categorical with the single date of the
+    batch, one byte per row.
+
+    Parameters
+    ----------
+    created_at : Timestamp
+        Date of the processing (String or Timestamp).
+    rows : int
+        Number of rows.
+    index : Index
+        Index of the dataframe.
+
+    Returns
+    -------
+    created_at : Series
+        Categorical column.
+    """
+    categories = pd.DatetimeIndex([pd.Timestamp(created_at)])
+    return pd.Series(pd.Categorical.from_codes(np.zeros(rows, dtype=np.int8), categories=categories), index=index, name='created_at')
+
+
+def conform(df, created_at=None):
+    """
+    Cast a cleaned dataset to the schema: year_month datetime64, uf, product
+    and unit categorical, volume float64 and created_at categorical (a category
+    per batch). The columns that are not in the schema are kept as they are
+    and the columns already cast are not copied (they are shared with df).
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe with columns of COLUMNS.
+    created_at : Timestamp
+        Date of the processing, replaces (or adds) the column created_at.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe.
+    """
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        if column == 'year_month':
+            data[column] = values if values.dtype.kind == 'M' else pd.to_datetime(values)
+        elif column == 'volume':
+            data[column] = values.astype(np.float64, copy=False)
+        elif column == 'created_at':
+            if not isinstance(values.dtype, pd.CategoricalDtype) and values.dtype.kind != 'M':
+                values = pd.to_datetime(values)
+            data[column] = categorical(values)
+        elif column in CATEGORIES:
+            data[column] = categorical(values)
+        else:
+            data[column] = values
+    if created_at is not None:
+        data['created_at'] = created_at_column(created_at, len(df), df.index)
+    # Without copy the columns are not consolidated in blocks
+    return pd.DataFrame(data, index=df.index, copy=False)
+
+
+def sort(df, keys=None):
+    """
+    Stable sort of a cleaned dataset, on the codes of the categoricals (their
+    categories are in order) instead of on the labels.
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe of the schema.
+    keys : list
+        Columns, SORT_KEYS by default.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe sorted, missing values last.
+    """
+    columns = []
+    for column in reversed(keys or SORT_KEYS):
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            columns.append(np.where(codes < 0, len(values.cat.categories), codes))
+        else:
+            values = values.to_numpy()
+            if values.dtype.kind == 'M':
+                # NaT is the smallest int64, it is moved after the dates
+                values = np.where(np.isnat(values), np.iinfo(np.int64).max, values.view(np.int64))
+            columns.append(values)
+    return df.take(np.lexsort(columns))
+
+
+def to_csv(df, path, **kwargs):
+    """
+    Write a dataframe of the schema to csv, the dates of the categoricals
+    (created_at) are formatted once per category instead of once per row.
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe.
+    path : String
+        Path (or file) of the csv.
+    kwargs : dict
+        Arguments of DataFrame.to_csv.
+    """
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.dtype.kind == 'M':
+            values = values.cat.rename_categories(values.cat.categories.strftime('%Y-%m-%d %H:%M:%S'))
+        data[column] = values
+    pd.DataFrame(data, index=df.index, copy=False).to_csv(path, **kwargs)
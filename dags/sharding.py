@@ -0,0 +1,90 @@
+import os
+import shutil
+
+
+def byte_ranges(path, parts, skip_header=True):
+    """
+    Split a text file in byte ranges of similar size.
+
+    The ranges are not aligned to the lines, read_byte_range assigns each line
+    to the range where it starts.
+
+    Parameters
+    ----------
+    path : String
+        Path of the file.
+    parts : int
+        Number of ranges.
+    skip_header : bool
+        The first line is not part of any range.
+
+    Returns
+    -------
+    ranges : list
+        Pairs (start, end) of byte offsets.
+    """
+    size = os.path.getsize(path)
+    start = 0
+    if skip_header:
+        with open(path, 'rb') as fp:
+            start = len(fp.readline())
+    parts = max(1, min(parts, size - start))
+    step = (size - start) / parts
+    bounds = [start + round(step * i) for i in range(parts)] + [size]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+def read_byte_range(path, start, end):
+    """
+    Read the lines that start inside a byte range.
+
+    Parameters
+    ----------
+    path : String
+        Path of the file.
+    start : int
+        First byte of the range.
+    end : int
+        Byte after the range.
+
+    Returns
+    -------
+    data : bytes
+        Complete lines.
+    """
+    with open(path, 'rb') as fp:
+        if start > 0:
+            # The line in progress at start belongs to the previous range
+            fp.seek(start - 1)
+            fp.readline()
+        position = fp.tell()
+        if position >= end:
+            return b''
+        data = fp.read(end - position)
+        # Complete the last line, it starts inside the range
+        if not data.endswith(b'\n'):
+            data += fp.readline()
+    return data
+
+
+def concatenate_files(files, output, header=None):
+    """
+    Concatenate files into a new file, replaced atomically.
+
+    Parameters
+    ----------
+    files : list
+        Paths of the files, in order.
+    output : String
+        Path of the file generated.
+    header : bytes
+        First line of the file.
+    """
+    tmp = output + '.tmp'
+    with open(tmp, 'wb') as fp:
+        if header:
+            fp.write(header)
+        for file_name in files:
+            with open(file_name, 'rb') as part:
+                shutil.copyfileobj(part, fp)
+    os.replace(tmp, output)
@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import functools
+
+from instrumentation import annotate
+
+# Cache of the outputs of the stages, disabled with RAIZEN_STAGE_CACHE=0
+CACHE_ENABLED = os.environ.get('RAIZEN_STAGE_CACHE', '1') == '1'
+
+# Folder of the cache, the stage_cache folder of the outputs of each stage by default
+CACHE_FOLDER = os.environ.get('RAIZEN_STAGE_CACHE_FOLDER')
+
+# Name of the folder of the cache in the folder of the outputs
+CACHE_NAME = 'stage_cache'
+
+# Size of the cache (MB), the least recently used entries are evicted above it
+CACHE_MAX_MB = int(os.environ.get('RAIZEN_STAGE_CACHE_MB', '2048'))
+
+# Digests of the files already hashed, by path, size and modification time
+DIGESTS_FILE = 'digests.json'
+
+# Manifest of each entry
+MANIFEST = 'manifest.json'
+
+# Libraries that change the outputs of the stages
+LIBRARIES = ['numpy', 'pandas', 'pyarrow', 'openpyxl']
+
+# Size of the blocks hashed
+BLOCK_SIZE = 1024 * 1024
+
+
+def _load_json(file_name, default):
+    try:
+        with open(file_name, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def _save_json(file_name, data):
+    tmp = f'{file_name}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+    os.replace(tmp, file_name)
+
+
+def _hash_file(file_name):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as fp:
+        for block in iter(lambda: fp.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _digest(file_name, digests):
+    # Digest of a file or folder, the digests of the files are memoized in digests
+    if os.path.isdir(file_name):
+        digest = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(file_name):
+            dirs.sort()
+            for name in sorted(files):
+                member = os.path.join(root, name)
+                digest.update(f'{os.path.relpath(member, file_name)}:{_digest(member, digests)};'.encode('utf-8'))
+        return digest.hexdigest()
+    stat = os.stat(file_name)
+    key = os.path.abspath(file_name)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if digests.get(key, [])[:2] != signature:
+        digests[key] = signature + [_hash_file(file_name)]
+    return digests[key][2]
+
+
+def cache_folder(path):
+    """
+    Folder of the cache of the stages that write to path.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the outputs of the stages.
+
+    Returns
+    -------
+    folder : String
+        CACHE_FOLDER when RAIZEN_STAGE_CACHE_FOLDER is set, else the stage_cache folder of path.
+    """
+    return CACHE_FOLDER or os.path.join(path, CACHE_NAME)
+
+
+def file_digest(file_names, folder):
+    """
+    Content digests of files or folders (files in name order), memoized by
+    path, size and modification time.
+
+    Parameters
+    ----------
+    file_names : list
+        Paths of the files or folders.
+    folder : String
+        Folder of the cache (cache_folder).
+
+    Returns
+    -------
+    digests : list
+        Blake2b hex digest of each file, None when the file does not exist.
+    """
+    digests_file = os.path.join(folder, DIGESTS_FILE)
+    digests = _load_json(digests_file, {})
+    previous = dict(digests)
+    result = [_digest(file_name, digests) if os.path.exists(file_name) else None for file_name in file_names]
+    if digests != previous:
+        # Files removed since they were hashed are forgotten
+        digests = {key: value for key, value in digests.items() if os.path.exists(key)}
+        os.makedirs(os.path.dirname(digests_file), exist_ok=True)
+        _save_json(digests_file, digests)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """
+    Version of the code of the stages: digest of the modules of the dags folder
+    and of the versions of python and of the libraries.
+
+    Returns
+    -------
+    version : String
+        Blake2b hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(folder)):
+        if name.endswith('.py'):
+            digest.update(name.encode('utf-8'))
+            digest.update(_hash_file(os.path.join(folder, name)).encode('utf-8'))
+    versions = [sys.version]
+    for library in LIBRARIES:
+        try:
+            versions.append(f'{library}={__import__(library).__version__}')
+        except ImportError:
+            versions.append(f'{library}=None')
+    digest.update(';'.join(versions).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_key(stage, inputs, folder, params=None):
+    """
+    Key of a run of a stage.
+
+    Parameters
+    ----------
+    stage : String
+        Name of the stage.
+    inputs : list
+        Files and folders read by the stage.
+    folder : String
+        Folder of the cache (cache_folder), where the digests of the inputs are memoized.
+    params : dict
+        Parameters of the stage (json serializable).
+
+    Returns
+    -------
+    key : String
+        Digest of the stage, of the contents of the inputs, of the parameters and of the code.
+    """
+    description = {
+        'stage': stage,
+        'inputs': dict(zip([os.path.basename(os.path.normpath(name)) for name in inputs], file_digest(inputs, folder))),
+        'params': params or {},
+        'code': code_version(),
+    }
+    return hashlib.blake2b(json.dumps(description, sort_keys=True, default=str).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _entry(stage, key, folder):
+    return os.path.join(folder, stage, key)
+
+
+def _copy(source, destination):
+    # Copy of a file or folder, the destination is replaced once the copy is complete
+    tmp = f'{destination.rstrip(os.sep)}.{os.getpid()}.restore'
+    if os.path.isdir(source):
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(source, tmp)
+        if os.path.isdir(destination):
+            shutil.rmtree(destination)
+        elif os.path.exists(destination):
+            os.remove(destination)
+    else:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, destination)
+
+
+def restore(stage, key, path, folder=None):
+    """
+    Restore the outputs of a cached run of a stage.
+
+    Parameters
+    ----------
+    stage : String
+        Name of the stage.
+    key : String
+        Key of the run (stage_key).
+    path : String
+        Folder of the outputs.
+    folder : String
+        Folder of the cache, cache_folder(path) by default.
+
+    Returns
+    -------
+    restored : bool
+        False when the run is not cached.
+    """
+    entry = _entry(stage, key, folder or cache_folder(path))
+    manifest = _load_json(os.path.join(entry, MANIFEST), None)
+    if manifest is None:
+        return False
+    for name in manifest['outputs']:
+        parent = os.path.dirname(os.path.join(path, name))
+        os.makedirs(parent, exist_ok=True)
+        _copy(os.path.join(entry, 'outputs', name), os.path.join(path, name))
+    # Last use of the entry, read by the eviction
+    os.utime(os.path.join(entry, MANIFEST))
+    return True
+
+
+def _size(name):
+    if not os.path.isdir(name):
+        return os.path.getsize(name)
+    return sum(os.path.getsize(os.path.join(root, file_name)) for root, _, files in os.walk(name) for file_name in files)
+
+
+def store(stage, key, path, outputs, folder=None):
+    """
+    Store the outputs of a run of a stage and evict the least recently used
+    entries above CACHE_MAX_MB.
+
+    Parameters
+    ----------
+    stage : String
+        Name of the stage.
+    key : String
+        Key of the run (stage_key).
+    path : String
+        Folder of the outputs.
+    outputs : list
+        Files and folders written by the stage (the missing ones are not stored).
+    folder : String
+        Folder of the cache, cache_folder(path) by default.
+    """
+    folder = folder or cache_folder(path)
+    entry = _entry(stage, key, folder)
+    tmp = f'{entry}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    names = []
+    for output in outputs:
+        if not os.path.exists(output):
+            continue
+        name = os.path.relpath(output, path)
+        destination = os.path.join(tmp, 'outputs', name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.isdir(output):
+            shutil.copytree(output, destination)
+        else:
+            shutil.copyfile(output, destination)
+        names.append(name)
+    _save_json(os.path.join(tmp, MANIFEST), {
+        'stage': stage,
+        'outputs': names,
+        'bytes': _size(tmp),
+        'created_at': time.strftime('%Y-%m-%d %X'),
+    })
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+    evict(CACHE_MAX_MB * 2 ** 20, folder, keep=entry)
+
+
+def evict(max_bytes, folder, keep=None):
+    """
+    Remove the least recently used entries until the cache fits in max_bytes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Size of the cache.
+    folder : String
+        Folder of the cache (cache_folder).
+    keep : String
+        Entry never removed (the one just stored).
+
+    Returns
+    -------
+    removed : list
+        Entries removed.
+    """
+    entries = []
+    for stage in os.listdir(folder) if os.path.isdir(folder) else []:
+        if not os.path.isdir(os.path.join(folder, stage)):
+            continue
+        for key in os.listdir(os.path.join(folder, stage)):
+            manifest_file = os.path.join(folder, stage, key, MANIFEST)
+            if os.path.exists(manifest_file):
+                entries.append((os.path.getmtime(manifest_file), os.path.join(folder, stage, key), _load_json(manifest_file, {}).get('bytes', 0)))
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, entry, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed.append(entry)
+    return removed
+
+
+def cached_stage(name, files):
+    """
+    Cache the outputs of a stage by the contents of its inputs, its parameters
+    and the code version: a run with the same key restores the outputs instead
+    of running the stage. The result (hit, miss or off) is added to the metrics
+    of the stage (XCom metrics) and printed in the log of the task.
+
+    Parameters
+    ----------
+    name : String
+        Name of the stage.
+    files : function
+        Called with the arguments of the stage, returns the folder of the outputs,
+        the inputs, the outputs and the parameters of the stage.
+
+    Returns
+    -------
+    decorator : function
+        Decorator of the stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                annotate(cache='off')
+                return function(*args, **kwargs)
+            path, inputs, outputs, params = files(*args, **kwargs)
+            folder = cache_folder(path)
+            key = stage_key(name, inputs, folder, params)
+            if restore(name, key, path, folder):
+                print(f'Stage cache hit - {name} {key}')
+                annotate(cache='hit', cache_key=key)
+                return None
+            result = function(*args, **kwargs)
+            store(name, key, path, outputs, folder)
+            print(f'Stage cache miss - {name} {key}')
+            annotate(cache='miss', cache_key=key)
+            return result
+        return wrapper
+    return decorator
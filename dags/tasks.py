@@ -0,0 +1,46 @@
+"""
+Callables of the tasks of the DAG (raizen_test.py). The scheduler parses the
+DAG file again and again, so this module imports nothing: functions.py and its
+dependencies (pandas, numpy, openpyxl, pyarrow, psycopg2...) are imported by
+each callable, only when the task runs.
+"""
+
+
+def _download_datasets():
+    from functions import _download_datasets
+    return _download_datasets()
+
+
+def _download_data_pivot():
+    from functions import _download_data_pivot
+    return _download_data_pivot()
+
+
+def _extract_pivot_cache(file_name='vendas-combustiveis-m3.xlsx', path=None):
+    from functions import _extract_pivot_cache
+    return _extract_pivot_cache(file_name, path)
+
+
+def _clean_dataset(dataset, path=None):
+    from functions import _clean_dataset
+    return _clean_dataset(dataset, path)
+
+
+def _check_dataset(dataset, path=None):
+    from functions import _check_dataset
+    return _check_dataset(dataset, path)
+
+
+def _generation_sheet(dataset, path=None):
+    from functions import _generation_sheet
+    return _generation_sheet(dataset, path)
+
+
+def _load_dataset(dataset, path=None):
+    from functions import _load_dataset
+    return _load_dataset(dataset, path)
+
+
+def _assemble_file(path=None):
+    from functions import _assemble_file
+    return _assemble_file(path)
@@ -0,0 +1,176 @@
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from schema import to_csv
+
+# Folder of the cleaned partitions (one csv per year_month) of each dataset
+PARTITIONS_FOLDER = 'partitions'
+
+
+def watermark_file(path, file_name):
+    return os.path.join(path, f'watermark_{file_name}.json')
+
+
+def load_watermark(path, file_name):
+    """
+    Load the watermark of a dataset.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the dataset.
+    file_name : String
+        Name of the dataset.
+
+    Returns
+    -------
+    watermark : dict
+        last_year_month processed, hash of each partition, start_period, version and
+        source_sha256 (checksum of the download cleaned).
+    """
+    try:
+        with open(watermark_file(path, file_name), encoding='utf-8') as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {'last_year_month': None, 'partitions': {}, 'start_period': None, 'version': 0}
+
+
+def _save_json(file_name, data):
+    tmp = file_name + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+    os.replace(tmp, file_name)
+
+
+def save_watermark(path, file_name, watermark):
+    """
+    Save the watermark of a dataset atomically.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the dataset.
+    file_name : String
+        Name of the dataset.
+    watermark : dict
+        Watermark.
+    """
+    _save_json(watermark_file(path, file_name), watermark)
+
+
+def partition_hashes(df, keys):
+    """
+    Content hash of each partition, independent of the order of the rows.
+
+    Parameters
+    ----------
+    df : ndarray
+        Rows of the dataset.
+    keys : ndarray
+        Partition (year_month as 'YYYY-MM') of each row.
+
+    Returns
+    -------
+    hashes : dict
+        Hash of each partition.
+    """
+    if not len(df):
+        return {}
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    codes, uniques = pd.factorize(keys, sort=True)
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(uniques)))
+    # Sum (mod 2**64) and count of the row hashes of each partition
+    sums = np.add.reduceat(rows[order], starts)
+    counts = np.diff(np.append(starts, len(codes)))
+    return {key: f'{int(total):016x}-{int(count)}' for key, total, count in zip(uniques, sums, counts)}
+
+
+def plan_partitions(watermark, hashes, start_period):
+    """
+    Partitions that must be (re)processed and partitions that no longer exist.
+
+    Parameters
+    ----------
+    watermark : dict
+        Watermark of the previous run.
+    hashes : dict
+        Hash of each partition of the current dataset.
+    start_period : int
+        Period of the dataset, a different period processes everything again.
+
+    Returns
+    -------
+    changed : list
+        Partitions new or revised.
+    removed : list
+        Partitions to be deleted.
+    """
+    previous = watermark['partitions'] if watermark.get('start_period') == int(start_period) else {}
+    changed = sorted(key for key, value in hashes.items() if previous.get(key) != value)
+    removed = sorted(set(watermark['partitions']) - set(hashes))
+    return changed, removed
+
+
+def partition_folder(path, file_name):
+    folder = os.path.join(path, PARTITIONS_FOLDER, file_name)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def write_partitions(path, file_name, df, removed=()):
+    """
+    Replace the partitions of the cleaned rows and delete the removed partitions.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the dataset.
+    file_name : String
+        Name of the dataset.
+    df : ndarray
+        Cleaned and sorted rows of the changed partitions.
+    removed : list
+        Partitions to be deleted.
+    """
+    folder = partition_folder(path, file_name)
+    for key, partition in df.groupby(df['year_month'].dt.strftime('%Y-%m'), sort=False):
+        tmp = os.path.join(folder, key + '.csv.tmp')
+        to_csv(partition, tmp, sep=';', index=False, header=False)
+        os.replace(tmp, os.path.join(folder, key + '.csv'))
+    for key in removed:
+        partition = os.path.join(folder, key + '.csv')
+        if os.path.exists(partition):
+            os.remove(partition)
+
+
+def assemble_partitions(path, file_name, output, header):
+    """
+    Build the dataset csv concatenating the partitions in year_month order.
+
+    Parameters
+    ----------
+    path : String
+        Folder of the dataset.
+    file_name : String
+        Name of the dataset.
+    output : String
+        Path of the csv generated.
+    header : list
+        Column names.
+    """
+    folder = partition_folder(path, file_name)
+    fd, tmp = tempfile.mkstemp(prefix='assemble_', suffix='.csv', dir=os.path.dirname(os.path.abspath(output)))
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write((';'.join(header) + os.linesep).encode('utf-8'))
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.csv'):
+                with open(os.path.join(folder, name), 'rb') as partition:
+                    shutil.copyfileobj(partition, fp)
+    os.replace(tmp, output)
+
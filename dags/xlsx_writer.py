@@ -0,0 +1,376 @@
+import os
+import gzip
+import json
+import shutil
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+# Rows serialized at a time
+CHUNK_ROWS = 50000
+
+# Compression level of the fragments, read back once by write_workbook
+FRAGMENT_LEVEL = 1
+
+# Size of the blocks copied from the fragments
+BLOCK_SIZE = 1024 * 1024
+
+# Origin of the Excel date serial numbers
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+# Style index (cellXfs) of the native cells
+STYLE_DATE = 1
+STYLE_DATETIME = 2
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+{sheets}
+</Types>'''
+
+CONTENT_TYPE_SHEET = '<Override PartName="/xl/worksheets/sheet{index}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets>{sheets}</sheets>
+</workbook>'''
+
+WORKBOOK_SHEET = '<sheet name="{title}" sheetId="{index}" r:id="rId{index}"/>'
+
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+{sheets}
+<Relationship Id="rId{styles}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+<Relationship Id="rId{strings}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+</Relationships>'''
+
+WORKBOOK_RELS_SHEET = '<Relationship Id="rId{index}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet{index}.xml"/>'
+
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/><numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/><xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+SHEET_START = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'''
+
+SHEET_END = '</sheetData></worksheet>'
+
+
+def column_letter(index):
+    """
+    Excel column letter of a column index (0 -> A).
+
+    Parameters
+    ----------
+    index : int
+        Column index.
+
+    Returns
+    -------
+    letter : String
+        Column letter.
+    """
+    letter = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letter = chr(65 + remainder) + letter
+    return letter
+
+
+class SharedStrings:
+    """
+    Shared strings table of the workbook, each distinct string is stored once.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.count = 0
+
+    def add(self, value):
+        """
+        Index of a string in the table.
+
+        Parameters
+        ----------
+        value : String
+            Cell value.
+
+        Returns
+        -------
+        index : int
+            Position of the string in the table.
+        """
+        self.count += 1
+        index = self.index.get(value)
+        if index is None:
+            index = self.index[value] = len(self.index)
+        return index
+
+    def xml(self):
+        items = ''.join(
+            f'<si><t xml:space="preserve">{escape(value)}</t></si>' if value != value.strip() else f'<si><t>{escape(value)}</t></si>'
+            for value in self.index
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{self.count}" uniqueCount="{len(self.index)}">{items}</sst>'
+        )
+
+
+def _cells_from_uniques(codes, cells):
+    # Cell of each row from the cell of each distinct value (code -1 is an empty cell)
+    return np.array(cells + [None], dtype=object).take(codes)
+
+
+def _inline_string(value):
+    text = escape(value)
+    return f' t="inlineStr"><is><t xml:space="preserve">{text}</t></is>' if value != value.strip() else f' t="inlineStr"><is><t>{text}</t></is>'
+
+
+def column_cells(series, strings):
+    """
+    Serialize a column: the value part of each cell ("attributes><v>value</v>").
+
+    Strings are stored in the shared strings table (inline without a table),
+    numbers and dates are native cells. Dates and strings are serialized once
+    per distinct value (once per category for the categoricals).
+
+    Parameters
+    ----------
+    series : Series
+        Column of the dataframe.
+    strings : SharedStrings
+        Shared strings table, None for inline strings.
+
+    Returns
+    -------
+    cells : ndarray
+        Object array, None for missing values.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Distinct values from the codes, serialized with the type of the categories
+        codes, uniques = pd.factorize(series)
+        values = pd.Series(uniques.categories.take(uniques.codes))
+        cells = column_cells(values, strings)
+        if strings is not None and values.dtype == object:
+            strings.count += int((codes >= 0).sum()) - len(values)
+        return _cells_from_uniques(codes, list(cells))
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        codes, uniques = pd.factorize(series)
+        cells = []
+        for ts in uniques:
+            serial = (ts - EXCEL_EPOCH) / pd.Timedelta(days=1)
+            style = STYLE_DATE if ts == ts.normalize() else STYLE_DATETIME
+            cells.append(f' s="{style}"><v>{serial!r}</v>')
+        return _cells_from_uniques(codes, cells)
+    if dtype.kind in 'fiu':
+        values = series.to_numpy()
+        cells = np.array([f'><v>{value!r}</v>' for value in values.tolist()], dtype=object)
+        if dtype.kind == 'f':
+            cells[np.isnan(values)] = None
+        return cells
+    if dtype.kind == 'b':
+        return np.array([f' t="b"><v>{int(value)}</v>' for value in series.tolist()], dtype=object)
+    codes, uniques = pd.factorize(series)
+    if strings is None:
+        return _cells_from_uniques(codes, [_inline_string(str(value)) for value in uniques])
+    cells = [f' t="s"><v>{strings.add(str(value))}</v>' for value in uniques]
+    # Each row references the table, the count includes the repeated values
+    strings.count += int((codes >= 0).sum()) - len(uniques)
+    return _cells_from_uniques(codes, cells)
+
+
+def write_rows(fp, df, strings, first_row):
+    """
+    Stream the rows of a dataframe to the sheet xml.
+
+    Parameters
+    ----------
+    fp : file
+        Sheet xml opened for writing.
+    df : ndarray
+        Dataframe.
+    strings : SharedStrings
+        Shared strings table, None for inline strings.
+    first_row : int
+        Row number of the first row.
+
+    Returns
+    -------
+    next_row : int
+        Row number after the last row written.
+    """
+    letters = [column_letter(i) for i in range(len(df.columns))]
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        columns = [column_cells(chunk[column], strings) for column in chunk.columns]
+        rows = []
+        for row, cells in enumerate(zip(*columns), first_row + start):
+            rows.append(f'<row r="{row}">')
+            rows.extend(f'<c r="{letter}{row}"{cell}</c>' for letter, cell in zip(letters, cells) if cell is not None)
+            rows.append('</row>')
+        fp.write(''.join(rows).encode('utf-8'))
+    return first_row + len(df)
+
+
+class Fragment:
+    """
+    Rows of a sheet serialized ahead of write_workbook (see write_fragment).
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the fragment (gzip xml).
+    columns : list
+        Column names.
+    first_row : int
+        Row number of the first row.
+    rows : int
+        Number of rows.
+    """
+
+    def __init__(self, file_name, columns, first_row, rows):
+        self.file_name = file_name
+        self.columns = list(columns)
+        self.first_row = first_row
+        self.rows = rows
+
+
+def write_fragment(file_name, frames, first_row=2):
+    """
+    Serialize rows of a sheet to a file, so the sheets of a workbook can be
+    serialized by separate tasks and only copied by write_workbook.
+
+    The rows are numbered from first_row and the strings are inline (the
+    shared strings table belongs to the workbook), the fragment is written
+    with its columns and numbering (<file_name>.json).
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the fragment (gzip xml).
+    frames : list
+        Dataframe or list of dataframes with the same columns.
+    first_row : int
+        Row number of the first row.
+
+    Returns
+    -------
+    fragment : Fragment
+        Fragment written.
+    """
+    frames = [frames] if isinstance(frames, pd.DataFrame) else list(frames)
+    row = first_row
+    with gzip.open(file_name + '.tmp', 'wb', compresslevel=FRAGMENT_LEVEL) as fp:
+        for df in frames:
+            row = write_rows(fp, df, None, row)
+    os.replace(file_name + '.tmp', file_name)
+    fragment = Fragment(file_name, frames[0].columns, first_row, row - first_row)
+    with open(file_name + '.json', 'w', encoding='utf-8') as fp:
+        json.dump({'columns': [str(column) for column in fragment.columns], 'first_row': first_row, 'rows': fragment.rows}, fp)
+    return fragment
+
+
+def read_fragment(file_name):
+    """
+    Fragment written by write_fragment.
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the fragment (gzip xml).
+
+    Returns
+    -------
+    fragment : Fragment
+        Fragment.
+    """
+    with open(file_name + '.json', encoding='utf-8') as fp:
+        info = json.load(fp)
+    return Fragment(file_name, info['columns'], info['first_row'], info['rows'])
+
+
+def write_workbook(file_name, sheets, callback=None, compresslevel=None):
+    """
+    Write a workbook streaming the sheet xml to disk.
+
+    Each sheet is written straight into the xlsx (zip) file, the rows are never
+    held as cell objects: strings go to a shared strings table and numbers and
+    dates are native cells. A sheet may be made of several dataframes with the
+    same columns, written one after another under a single header, so combined
+    sheets never need a concatenated dataframe. Rows serialized ahead by
+    write_fragment are copied as they are.
+
+    Parameters
+    ----------
+    file_name : String
+        Path of the xlsx file.
+    sheets : list
+        Pairs (sheet title, dataframe or list of dataframes and fragments).
+    callback : function
+        Called with the sheet title after each sheet is written.
+    compresslevel : int
+        Deflate level (1 fastest to 9 smallest), the zlib default by default.
+    """
+    strings = SharedStrings()
+    titles = []
+    with zipfile.ZipFile(file_name, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=compresslevel) as zf:
+        for index, (title, frames) in enumerate(sheets, 1):
+            frames = [frames] if isinstance(frames, pd.DataFrame) else list(frames)
+            with zf.open(f'xl/worksheets/sheet{index}.xml', 'w', force_zip64=True) as fp:
+                fp.write(SHEET_START.encode('utf-8'))
+                # Header
+                header = ''.join(
+                    f'<c r="{column_letter(i)}1" t="s"><v>{strings.add(str(column))}</v></c>'
+                    for i, column in enumerate(frames[0].columns)
+                )
+                fp.write(f'<row r="1">{header}</row>'.encode('utf-8'))
+                row = 2
+                for df in frames:
+                    if isinstance(df, Fragment):
+                        # Rows already serialized, numbered for this position of the sheet
+                        if df.first_row != row:
+                            raise ValueError(f'Fragment {df.file_name} starts at row {df.first_row}, expected {row}')
+                        with gzip.open(df.file_name, 'rb') as fragment:
+                            shutil.copyfileobj(fragment, fp, BLOCK_SIZE)
+                        row += df.rows
+                    else:
+                        row = write_rows(fp, df, strings, row)
+                fp.write(SHEET_END.encode('utf-8'))
+            titles.append(title)
+            if callback is not None:
+                callback(title)
+
+        # Workbook parts
+        count = len(titles)
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES.format(
+            sheets=''.join(CONTENT_TYPE_SHEET.format(index=i) for i in range(1, count + 1))))
+        zf.writestr('_rels/.rels', ROOT_RELS)
+        zf.writestr('xl/workbook.xml', WORKBOOK.format(
+            sheets=''.join(WORKBOOK_SHEET.format(title=escape(title, {'"': '&quot;'}), index=i) for i, title in enumerate(titles, 1))))
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS.format(
+            sheets=''.join(WORKBOOK_RELS_SHEET.format(index=i) for i in range(1, count + 1)),
+            styles=count + 1, strings=count + 2))
+        zf.writestr('xl/styles.xml', STYLES)
+        zf.writestr('xl/sharedStrings.xml', strings.xml())
@@ -0,0 +1,2 @@
+-- Warehouse of the cleaned datasets (dags/warehouse.py), apart from the metadata database of Airflow
+CREATE DATABASE raizen;
@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+# Description of the traversal of a pivot table (filters, columns and UFs)
+MANIFEST = 'manifest.json'
+
+
+class CheckpointStore:
+    """
+    Slices (pivot, UF) already traversed by generator_dataframe, one npz file
+    per UF in folder/name. A new run with the same pivot table reads the slices
+    stored instead of traversing them again, so a failure (e.g. of Excel)
+    costs only the UF in progress.
+
+    Parameters
+    ----------
+    folder : String
+        Folder of the checkpoints.
+    name : String
+        Name of the pivot table (pvt1, pvt2).
+    """
+
+    def __init__(self, folder, name):
+        self.folder = os.path.join(folder, name)
+        self.ufs = []
+
+    def start(self, signature, ufs):
+        """
+        Start (or resume) a traversal, the slices of another traversal (other
+        filters, columns or UFs) are removed.
+
+        Parameters
+        ----------
+        signature : list
+            Filters and columns of the traversal (json serializable).
+        ufs : list
+            Items of the UF filter, in the order of the traversal.
+
+        Returns
+        -------
+        done : int
+            Number of slices already stored.
+        """
+        self.ufs = list(ufs)
+        manifest = {'signature': signature, 'ufs': self.ufs}
+        try:
+            with open(os.path.join(self.folder, MANIFEST), encoding='utf-8') as fp:
+                current = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            current = None
+        if current != manifest:
+            self.clear()
+            os.makedirs(self.folder)
+            self._replace(MANIFEST, lambda fp: fp.write(json.dumps(manifest, ensure_ascii=False).encode('utf-8')))
+        return sum(os.path.exists(self._file(uf)) for uf in self.ufs)
+
+    def _file(self, uf):
+        # The file is named by the position of the UF, the captions have accents and spaces
+        return os.path.join(self.folder, f'{self.ufs.index(uf):03d}.npz')
+
+    def _replace(self, name, write):
+        # A slice is complete or absent, never partially written
+        tmp = os.path.join(self.folder, f'{name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as fp:
+            write(fp)
+        os.replace(tmp, os.path.join(self.folder, name))
+
+    def load(self, uf):
+        """
+        Blocks of a slice.
+
+        Parameters
+        ----------
+        uf : String
+            Item of the UF filter.
+
+        Returns
+        -------
+        blocks : list
+            Tuples (uf, product, months, values) of each product, None when the slice is not stored.
+        """
+        try:
+            with np.load(self._file(uf)) as data:
+                products, sizes, months, values = data['products'], data['sizes'], data['months'], data['values']
+        except FileNotFoundError:
+            return None
+        bounds = np.cumsum(sizes)[:-1]
+        return [
+            (uf, str(product), [str(month) for month in slice_months], slice_values)
+            for product, slice_months, slice_values in zip(products, np.split(months, bounds), np.split(values, bounds))
+        ]
+
+    def save(self, uf, blocks):
+        """
+        Store a slice.
+
+        Parameters
+        ----------
+        uf : String
+            Item of the UF filter.
+        blocks : list
+            Tuples (uf, product, months, values) of each product of the UF.
+        """
+        width = blocks[0][3].shape[1] if blocks else 0
+        self._replace(os.path.basename(self._file(uf)), lambda fp: np.savez(
+            fp,
+            products=np.array([product for _, product, _, _ in blocks], dtype=str),
+            sizes=np.array([len(months) for _, _, months, _ in blocks], dtype=np.int64),
+            months=np.array([month for _, _, months, _ in blocks for month in months], dtype=str),
+            values=np.vstack([values for _, _, _, values in blocks]) if blocks else np.empty((0, width)),
+        ))
+
+    def clear(self):
+        """
+        Remove the slices, once the datasets are written.
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
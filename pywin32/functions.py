@@ -1,315 +1,313 @@
-from ast import If
-import win32com.client as win32
-import pandas as pd
-import numpy as np
-import os, re
-from datetime import datetime 
-win32c = win32.constants
-
-def load_workbook():
-    """
-    Load the specified excel file for the start of the test.
-        
-    Returns
-    -------
-    Workbook : object
-        Returns a Workbooks collection representing all open work tabs.
-    """
-    file = 'https://github.com/raizen-analytics/data-engineering-test/raw/master/assets/vendas-combustiveis-m3.xls'
-    #file = os.path.dirname(os.path.abspath(__file__)) + '/vendas-combustiveis-m3.xls'
-    
-    # create excel object
-    excel = win32.gencache.EnsureDispatch('Excel.Application')
-    # excel can be visible or not
-    excel.Visible =  False
-    # load workbook
-    wb = excel.Workbooks.Open(file)  
-    
-    return wb
-
-def load_pivot_table(workbook, range_1, range_2):
-    """
-    Load from the specified range in which pivot table it will work.
-
-    Parameters
-    ----------
-    workbook : object
-        Workbooks collection representing all open work tabs.
-    range_1 : string
-        Represents the beginning of the range that will work.
-    range_2 : string
-        Represents the end of the range that will work.
-                
-    Returns
-    -------
-    pvtTable : object
-        Returns the pivot table to be worked on.
-    """    
-    ws = workbook.Worksheets(1)
-    pvtTable = ws.Range(range_1, range_2).PivotTable
-    return pvtTable
-
-def clean_filter(pvtTable, filter):
-    """
-    Clear the pivot table filter
-
-    Parameters
-    ----------
-    pvtTable : object
-        Pivot table 
-    filter : string
-        Filter name to be reset.
-    """
-    pvtTable.PivotFields(filter).ClearAllFilters()
-    
-def close_workbook(workbook):  
-    """
-    Close the object.
-
-    Parameters
-    ----------
-    workbook : object
-        Workbooks collection representing all open work tabs.           
-    """
-    workbook.Close(True)
-
-def convert_list_to_df(table_data, item_columns):
-    """
-    Convert pivot table list to dataframe
-
-    Parameters
-    ----------
-    table_data : array
-        Pivot table.
-    item_columns : array
-        Number of columns that should be applied to the reshape.
-
-    Returns
-    -------
-    df : ndarray
-        Returns the dataframe.
-
-    """
-    # Check list size
-    list_length = len(table_data)
-    
-    # Adjust the number of columns to reshape
-    column_df = len(item_columns) - 1
-    # Check the number of rows based on the size of the list and columns
-    row_df = int(list_length/column_df)   
-   
-    # reshape list into array
-    arr2D = np.reshape(table_data, (row_df, column_df))
-    # convert list in dataframe
-    df = pd.DataFrame(arr2D)
-    return df
-
-def generator_dataframe(pvtTable, columns_df, column_pivot, filter_1, filter_2):
-    """
-    Generates the dataframe traversing the entire pivot table, applying the uf and product filters.
-
-    Parameters
-    ----------
-    pvtTable : object
-        Pivot table.
-    columns_df : array
-        List of columns applied to the dataframe.
-    column_pivot : object
-       List of columns applied to the table pivot.
-    filter_1 : string
-        Filter corresponding to the first of the pivot table.
-    filter_2 : string
-        Filter corresponding to the second of the pivot table.
-
-    Returns
-    -------
-    df_merged : ndarray
-        Returns the dataframe containing the result extracted from the pivot table.
-
-    """
-    # Contains all columns that must be extracted to the dataframe
-    #item_columns = column_pivot + ['None']
-    item_columns = column_pivot
-    # Dataframe that will store the result.
-    df_merged = pd.DataFrame()
-    # Performs the first search by Federative Unit
-    for item in range(1,pvtTable.PivotFields(filter_1).PivotItems().Count+1): 
-        # Get result filter 1
-        uf = pvtTable.PivotFields(filter_1).PivotItems(item)
-        # Apply filter 1 to the pivot table
-        pvtTable.PivotFields(filter_1).CurrentPage = uf.Caption
-        # Performs the second search by Product
-        for item2 in range(1,pvtTable.PivotFields(filter_2).PivotItems().Count+1): 
-            table_data = ['UF', 'PRODUTO']
-            # Get result filter 2
-            prod = pvtTable.PivotFields(filter_2).PivotItems(item2)
-            # Apply filter 2 to the pivot table
-            pvtTable.PivotFields(filter_2).CurrentPage = prod.Caption
-            # Cycles through the entire pivot table adding extra columns
-            for i in pvtTable.TableRange1:
-                if str(i) != 'None' and int(i.Column)==2 :
-                    table_data.append(uf.Caption)
-                    table_data.append(prod.Caption)
-                table_data.append(str(i))
-            
-            # Convert a list in dataframe
-            df = convert_list_to_df(table_data, item_columns)  
-            df.columns = columns_df
-            df = df.drop(index = 0)
-            df = df.drop(index = 1)
-            df = df.drop(index = 14)
-            df_merged = pd.concat([df, df_merged], ignore_index=True, sort=False)
-            #break
-        #break
-    return df_merged    
-
-def clean_space_parentheses(str):
-    """
-    Checks the product name and removes the unit (m3) from the name.
-
-    Parameters
-    ----------
-    str : String
-        Product name.
-
-    Returns
-    -------
-    str : String
-        Returns the Product name.
-    """  
-      
-    str = re.sub(r'\(\w+\)$',"",str)
-    str = re.sub(r"\(\s+","(", str)
-    str = re.sub(r"\s+\)",")", str)
-    return str
-
-def formated_year_month(year, month):
-    """
-    Format field year_month	date
-
-    Parameters
-    ----------
-    year : String
-        Year extraction from pivot table.
-    month : String
-        Month extraction from pivot table.
-        
-    Returns
-    -------
-    date : date
-        Returns returns the date according to the past period.
-    """  
-    month_name = {
-        'Janeiro': 1 ,
-        'Fevereiro':2,
-        'Março': 3,
-        'Abril': 4,
-        'Maio': 5,
-        'Junho': 6,
-        'Julho': 7,
-        'Agosto': 8,
-        'Setembro': 9,
-        'Outubro': 10,
-        'Novembro': 11,
-        'Dezembro': 12        
-    }
-    date = datetime(int(year), month_name[month], 1)
-    #return f'{str(year)}_{str(month_name[month])}'
-    return date
-
-def clean_dataframe(df):
-    """
-    Clean up the dataframe and name the columns.
-
-    Parameters
-    ----------
-    df : ndarray
-        Dataframe.
-
-    Returns
-    -------
-    df : ndarray
-        Dataframe.
-    """  
-    df = df.replace(['None'], 0.0)
-    df['unit'] = df['produto'].apply(lambda x: x[len(x)-3:-1])
-    df['volume'] = df['volume'].astype(float)
-    df['product'] = df['produto'].apply(lambda x: clean_space_parentheses(x))
-    df['year_month'] = df.apply(lambda x: formated_year_month(x['ano'], x['mes']), axis=1)
-    df['created_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %X')
-    
-    df = df[['year_month', 'uf', 'product', 'unit', 'volume', 'created_at']]
-    return df
-
-
-def get_total_dataframe(df):
-    """
-    Performs the calculation of the total according to the past dataframe.
-
-    Parameters
-    ----------
-    df : ndarray
-        Data Frame.
-
-    Returns
-    -------
-    df : ndarray
-        Returns a dataframe with the consolidated total by year.
-    """      
-    df = df.replace(['None'], 0.0)
-    df['year'] = df['ano'].apply(lambda x: x)
-    df['volume'] = df['volume'].astype(float)
-    df = df.query("mes == 'Total do Ano'")   
-
-    # Using reset_index()
-    df = df.groupby(['year'])['volume'].sum().reset_index()
-    return df
-
-
-def load_vars(name_pivot):
-    # Filters Pivot table
-    filters = ["UN. DA FEDERAÇÃO", "PRODUTO"]
-    
-    # Columns Pivot Table
-    column_pivot = ['UF', 'PRODUTO','ANO', 'Dados', '2000', '2001', '2002', '2003', '2004', '2005', '2006', '2007', 
-                '2008', '2009', '2010', '2011', '2012', '2013', '2014', '2015', '2016',
-                '2017', '2018', '2019', '2020']
-    # Columns Dataframe
-    columns_df = ['uf', 'produto', 'mes', '2000', '2001', '2002', '2003', '2004', '2005', '2006', '2007', 
-                '2008', '2009', '2010', '2011', '2012', '2013', '2014', '2015', '2016',
-                '2017', '2018', '2019', '2020']
-    
-    # Define Variables
-    vars = []
-    ranges_pvt = []
-    column_pvt = []
-    column_df = []
-    if name_pivot == 'pvt1':
-        ranges_pvt = ["B49", "B65"]
-        column_pvt = column_pivot
-        column_df = columns_df
-    else:
-        ranges_pvt = ["B129", "B145"]
-        column_pvt = column_pivot[0:4] + column_pivot[17:]
-        column_df = columns_df[0:3] + columns_df[16:]
-        
-    # Add variables in vars        
-    vars.append(filters)
-    vars.append(ranges_pvt)
-    vars.append(column_pvt)
-    vars.append(column_df)
-    
-    return vars
-
-
-    
-    
-    
-
-
-    
-    
-    
-
-    
-    
+from ast import If
+import pandas as pd
+import numpy as np
+import os, re
+from datetime import datetime 
+from pivot_source import ComPivotSource
+from schema import processing_time, month_start, categorical, map_categories, conform
+
+# Excel automation is only available on Windows, without it the extraction runs with a FakePivotSource
+try:
+    import win32com.client as win32
+    win32c = win32.constants
+except ImportError:
+    win32 = None
+
+# Months of the pivot tables, in order
+MONTH_NAME = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+
+def load_workbook():
+    """
+    Load the specified excel file for the start of the test.
+        
+    Returns
+    -------
+    Workbook : object
+        Returns a Workbooks collection representing all open work tabs.
+    """
+    file = 'https://github.com/raizen-analytics/data-engineering-test/raw/master/assets/vendas-combustiveis-m3.xls'
+    #file = os.path.dirname(os.path.abspath(__file__)) + '/vendas-combustiveis-m3.xls'
+    
+    if win32 is None:
+        raise RuntimeError('pywin32 (win32com) and Excel are required to load the workbook')
+    # create excel object
+    excel = win32.gencache.EnsureDispatch('Excel.Application')
+    # excel can be visible or not
+    excel.Visible =  False
+    # load workbook
+    wb = excel.Workbooks.Open(file)  
+    
+    return wb
+
+def load_pivot_table(workbook, index):
+    """
+    Load the pivot table by its position in the sheet.
+    The pivot tables are found in the PivotTables collection of the sheet,
+    so changes of the layout of the file do not require new ranges.
+
+    Parameters
+    ----------
+    workbook : object
+        Workbooks collection representing all open work tabs.
+    index : int
+        Position of the pivot table in the sheet (0 is the first from the top).
+                
+    Returns
+    -------
+    pvtTable : PivotSource
+        Returns the pivot table to be worked on.
+    """    
+    ws = workbook.Worksheets(1)
+    pvtTables = [ws.PivotTables(i) for i in range(1, ws.PivotTables().Count + 1)]
+    # Order of the tables in the sheet
+    pvtTables.sort(key=lambda pvtTable: pvtTable.TableRange1.Row)
+    return ComPivotSource(pvtTables[index])
+
+def clean_filter(pvtTable, filter):
+    """
+    Clear the pivot table filter
+
+    Parameters
+    ----------
+    pvtTable : PivotSource
+        Pivot table 
+    filter : string
+        Filter name to be reset.
+    """
+    pvtTable.clear(filter)
+    
+def close_workbook(workbook):  
+    """
+    Close the object.
+
+    Parameters
+    ----------
+    workbook : object
+        Workbooks collection representing all open work tabs.           
+    """
+    workbook.Close(True)
+
+def generator_dataframe(pvtTable, columns_df, filter_1, filter_2, checkpoint=None):
+    """
+    Generates the dataframe traversing the entire pivot table, applying the uf and product filters.
+    The values of each uf x product table are collected as a typed block and
+    the dataframe is built once, after the traversal. With a checkpoint, the
+    blocks of each uf are stored once the uf is traversed and the ufs already
+    stored by a previous run (that failed) are read instead of traversed.
+
+    Parameters
+    ----------
+    pvtTable : PivotSource
+        Pivot table.
+    columns_df : array
+        List of columns applied to the dataframe.
+    filter_1 : string
+        Filter corresponding to the first of the pivot table.
+    filter_2 : string
+        Filter corresponding to the second of the pivot table.
+    checkpoint : CheckpointStore
+        Store of the ufs traversed, the traversal is not resumable by default.
+
+    Returns
+    -------
+    df_merged : ndarray
+        Returns the dataframe containing the result extracted from the pivot table.
+
+    """
+    # Number of year columns
+    width = len(columns_df) - 3
+    blocks = []
+    ufs = pvtTable.items(filter_1)
+    if checkpoint is not None:
+        done = checkpoint.start([list(columns_df), filter_1, filter_2], ufs)
+        if done:
+            print(f'Resuming - {done} of {len(ufs)} {filter_1} already extracted')
+    # Performs the first search by Federative Unit
+    for uf in ufs:
+        stored = checkpoint.load(uf) if checkpoint is not None else None
+        if stored is not None:
+            blocks.extend(stored)
+            continue
+        uf_blocks = []
+        # Apply filter 1 to the pivot table
+        pvtTable.set_page(filter_1, uf)
+        # Performs the second search by Product
+        for prod in pvtTable.items(filter_2):
+            # Apply filter 2 to the pivot table
+            pvtTable.set_page(filter_2, prod)
+            # Rows of the months, between the header row and the Total do Ano row
+            rows = pvtTable.table()[2:-1]
+            months = [row[0] for row in rows]
+            values = np.array([row[1:width + 1] for row in rows], dtype=float)
+            uf_blocks.append((uf, prod, months, values))
+        if checkpoint is not None:
+            checkpoint.save(uf, uf_blocks)
+        blocks.extend(uf_blocks)
+
+    if not blocks:
+        return pd.DataFrame(columns=columns_df)
+    # Same order as the previous implementation, that added each block at the top
+    blocks.reverse()
+    sizes = [len(months) for _, _, months, _ in blocks]
+    df_merged = pd.DataFrame(np.vstack([values for _, _, _, values in blocks]), columns=columns_df[3:])
+    df_merged.insert(0, columns_df[2], np.concatenate([months for _, _, months, _ in blocks]))
+    df_merged.insert(0, columns_df[1], np.repeat([prod for _, prod, _, _ in blocks], sizes))
+    df_merged.insert(0, columns_df[0], np.repeat([uf for uf, _, _, _ in blocks], sizes))
+    return df_merged    
+
+def clean_space_parentheses(str):
+    """
+    Checks the product name and removes the unit (m3) from the name.
+
+    Parameters
+    ----------
+    str : String
+        Product name.
+
+    Returns
+    -------
+    str : String
+        Returns the Product name.
+    """  
+      
+    str = re.sub(r'\(\w+\)$',"",str)
+    str = re.sub(r"\(\s+","(", str)
+    str = re.sub(r"\s+\)",")", str)
+    return str
+
+def formated_year_month(year, month):
+    """
+    Format field year_month	date
+
+    Parameters
+    ----------
+    year : String
+        Year extraction from pivot table.
+    month : String
+        Month extraction from pivot table.
+        
+    Returns
+    -------
+    date : date
+        Returns returns the date according to the past period.
+    """  
+    month_name = {
+        'Janeiro': 1 ,
+        'Fevereiro':2,
+        'Março': 3,
+        'Abril': 4,
+        'Maio': 5,
+        'Junho': 6,
+        'Julho': 7,
+        'Agosto': 8,
+        'Setembro': 9,
+        'Outubro': 10,
+        'Novembro': 11,
+        'Dezembro': 12        
+    }
+    date = datetime(int(year), month_name[month], 1)
+    #return f'{str(year)}_{str(month_name[month])}'
+    return date
+
+def clean_dataframe(df):
+    """
+    Clean up the dataframe and name the columns.
+    The product names, units and months are computed once per distinct value
+    and the columns have the dtypes of the schema (schema.py).
+
+    Parameters
+    ----------
+    df : ndarray
+        Dataframe.
+
+    Returns
+    -------
+    df : ndarray
+        Dataframe.
+    """  
+    produto = categorical(df['produto'])
+    month = pd.Categorical(df['mes'], categories=MONTH_NAME).codes + 1
+    if (month == 0).any():
+        raise KeyError(f"Invalid month: {sorted(set(df['mes'][month == 0].astype(str)))}")
+    
+    df = pd.DataFrame({
+        'year_month': month_start(df['ano'].astype(int).to_numpy(), month),
+        'uf': df['uf'],
+        'product': map_categories(produto, clean_space_parentheses),
+        'unit': map_categories(produto, lambda x: x[len(x)-3:-1]),
+        'volume': df['volume'].replace(['None'], 0.0).fillna(0.0).astype(float),
+    }, index=df.index)
+    return conform(df, processing_time())
+
+
+def get_total_dataframe(df):
+    """
+    Performs the calculation of the total according to the past dataframe.
+
+    Parameters
+    ----------
+    df : ndarray
+        Data Frame.
+
+    Returns
+    -------
+    df : ndarray
+        Returns a dataframe with the consolidated total by year.
+    """      
+    df = df.replace(['None'], 0.0)
+    df['year'] = df['ano'].astype(int)
+    df['volume'] = df['volume'].astype(float)
+    df = df.query("mes == 'Total do Ano'")   
+
+    # Using reset_index()
+    df = df.groupby(['year'])['volume'].sum().reset_index()
+    return df
+
+
+def load_vars(name_pivot):
+    # Filters Pivot table
+    filters = ["UN. DA FEDERAÇÃO", "PRODUTO"]
+    
+    # Columns Pivot Table
+    column_pivot = ['UF', 'PRODUTO','ANO', 'Dados', '2000', '2001', '2002', '2003', '2004', '2005', '2006', '2007', 
+                '2008', '2009', '2010', '2011', '2012', '2013', '2014', '2015', '2016',
+                '2017', '2018', '2019', '2020']
+    # Columns Dataframe
+    columns_df = ['uf', 'produto', 'mes', '2000', '2001', '2002', '2003', '2004', '2005', '2006', '2007', 
+                '2008', '2009', '2010', '2011', '2012', '2013', '2014', '2015', '2016',
+                '2017', '2018', '2019', '2020']
+    
+    # Define Variables
+    vars = []
+    index_pvt = 0
+    column_pvt = []
+    column_df = []
+    if name_pivot == 'pvt1':
+        index_pvt = 0
+        column_pvt = column_pivot
+        column_df = columns_df
+    else:
+        index_pvt = 1
+        column_pvt = column_pivot[0:4] + column_pivot[17:]
+        column_df = columns_df[0:3] + columns_df[16:]
+        
+    # Add variables in vars        
+    vars.append(filters)
+    vars.append(index_pvt)
+    vars.append(column_pvt)
+    vars.append(column_df)
+    
+    return vars
+
+
+    
+    
+    
+
+
+    
+    
+    
+
+    
+    
@@ -0,0 +1,172 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+# Month names of the rows of the pivot tables
+MONTH_NAMES = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+
+
+class PivotSource(ABC):
+    """
+    Pivot table traversed by generator_dataframe.
+
+    The table (TableRange1) has a caption row, a header row (Mês and the years),
+    one row per month and the Total do Ano row.
+    """
+
+    @abstractmethod
+    def items(self, field):
+        """
+        Captions of the items of a page field.
+
+        Parameters
+        ----------
+        field : String
+            Page field (UN. DA FEDERAÇÃO, PRODUTO).
+
+        Returns
+        -------
+        items : list
+            Captions.
+        """
+
+    @abstractmethod
+    def clear(self, field):
+        """
+        Clear the filter of a page field.
+
+        Parameters
+        ----------
+        field : String
+            Page field.
+        """
+
+    @abstractmethod
+    def set_page(self, field, caption):
+        """
+        Filter a page field.
+
+        Parameters
+        ----------
+        field : String
+            Page field.
+        caption : String
+            Item selected.
+        """
+
+    @abstractmethod
+    def table(self):
+        """
+        Values of the table for the current filters.
+
+        Returns
+        -------
+        table : tuple
+            Rows of the table, tuples of values (None for empty cells).
+        """
+
+
+class ComPivotSource(PivotSource):
+    """
+    Pivot table of Excel (win32com).
+
+    Parameters
+    ----------
+    pvtTable : object
+        Pivot table.
+    """
+
+    def __init__(self, pvtTable):
+        self.pvtTable = pvtTable
+
+    def items(self, field):
+        items = self.pvtTable.PivotFields(field).PivotItems()
+        return [items(i).Caption for i in range(1, items.Count + 1)]
+
+    def clear(self, field):
+        self.pvtTable.PivotFields(field).ClearAllFilters()
+
+    def set_page(self, field, caption):
+        self.pvtTable.PivotFields(field).CurrentPage = caption
+
+    def table(self):
+        # A single call returns the values of the whole range
+        return self.pvtTable.TableRange1.Value
+
+
+class FakePivotSource(PivotSource):
+    """
+    Pivot table in memory, with the layout of the ANP tables, used to run and
+    benchmark the extraction without Excel.
+
+    Parameters
+    ----------
+    df : ndarray
+        Records with the columns year_month, uf, product, unit and volume.
+    years : list
+        Years (columns) of the table, the years of the records by default.
+    fields : list
+        Names of the page fields of uf and product.
+    """
+
+    def __init__(self, df, years=None, fields=('UN. DA FEDERAÇÃO', 'PRODUTO')):
+        year_month = pd.to_datetime(df['year_month'])
+        self.years = list(years or sorted(year_month.dt.year.unique()))
+        self.fields = list(fields)
+        products = df['product'].astype(str) + ' (' + df['unit'].astype(str) + ')'
+        self.captions = {
+            self.fields[0]: sorted(df['uf'].astype(str).unique()),
+            self.fields[1]: sorted(products.unique()),
+        }
+        self.pages = {field: None for field in self.fields}
+        # Volume of each (uf, product) by month x year
+        year_index = {year: i for i, year in enumerate(self.years)}
+        keep = year_month.dt.year.isin(year_index).to_numpy()
+        self.cubes = {}
+        for (uf, product), group in pd.DataFrame({
+            'uf': df['uf'].astype(str).to_numpy()[keep],
+            'product': products.to_numpy()[keep],
+            'month': year_month.dt.month.to_numpy()[keep] - 1,
+            'year': year_month.dt.year.map(year_index).to_numpy()[keep].astype(int),
+            'volume': df['volume'].to_numpy(dtype=float)[keep],
+        }).groupby(['uf', 'product']):
+            cells = (group['month'].to_numpy(), group['year'].to_numpy())
+            cube = np.zeros((12, len(self.years)))
+            filled = np.zeros((12, len(self.years)), dtype=bool)
+            np.add.at(cube, cells, group['volume'].to_numpy())
+            filled[cells] = True
+            # Empty cells of the table
+            cube[~filled] = np.nan
+            self.cubes[(uf, product)] = cube
+        self.calls = 0
+
+    def items(self, field):
+        return list(self.captions[field])
+
+    def clear(self, field):
+        self.pages[field] = None
+
+    def set_page(self, field, caption):
+        if caption not in self.captions[field]:
+            raise KeyError(f'{field}: {caption}')
+        self.pages[field] = caption
+
+    def table(self):
+        self.calls += 1
+        uf, product = (self.pages[field] for field in self.fields)
+        if uf is not None and product is not None:
+            cubes = [self.cubes[(uf, product)]] if (uf, product) in self.cubes else []
+        else:
+            cubes = [cube for (cube_uf, cube_product), cube in self.cubes.items()
+                     if uf in (None, cube_uf) and product in (None, cube_product)]
+        values = np.full((12, len(self.years)), np.nan)
+        if cubes:
+            stacked = np.stack(cubes)
+            values = np.where(np.isnan(stacked).all(axis=0), np.nan, np.nansum(stacked, axis=0))
+        rows = [(None, 'ANO') + (None,) * (len(self.years) - 1), ('Mês',) + tuple(float(year) for year in self.years)]
+        for month, row in zip(MONTH_NAMES, values):
+            rows.append((month,) + tuple(None if np.isnan(value) else float(value) for value in row))
+        totals = np.where(np.isnan(values).all(axis=0), np.nan, np.nansum(values, axis=0))
+        rows.append(('Total do Ano',) + tuple(None if np.isnan(value) else float(value) for value in totals))
+        return tuple(rows)
@@ -0,0 +1,35 @@
+import pandas as pd
+import pyarrow as pa
+
+from columnar import write_columnar, write_handoff, read_handoff, handoff_file
+from schema import COLUMNS, conform, processing_time, sort
+
+
+def frame(year, ufs, products):
+    # Rows of one year, the labels (and so the dictionaries) of each year differ
+    rows = [(f'{year}-{month:02d}-01', uf, product) for month in (1, 2) for uf in ufs for product in products]
+    df = pd.DataFrame(rows, columns=['year_month', 'uf', 'product'])
+    df['year_month'] = pd.to_datetime(df['year_month'])
+    df['unit'] = 'm3'
+    df['volume'] = range(len(df))
+    return sort(conform(df, processing_time()))
+
+
+def test_handoff_written_by_batch(tmp_path):
+    path = str(tmp_path) + '/'
+    frames = [frame(2020, ['SP', 'RJ'], ['ÓLEO DIESEL']), frame(2021, ['BA', 'SP'], ['GASOLINA C', 'ÓLEO DIESEL'])]
+    write_columnar(path, 'diesel', iter(frames))
+    assert write_handoff(path, 'diesel') == sum(len(df) for df in frames)
+
+    # One batch per partition, all with the same dictionaries
+    with pa.memory_map(handoff_file(path, 'diesel')) as source:
+        reader = pa.ipc.open_file(source)
+        batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+    assert len(batches) == 2
+    assert batches[0].column('uf').dictionary.equals(batches[1].column('uf').dictionary)
+    assert batches[0].column('uf').dictionary.to_pylist() == ['BA', 'RJ', 'SP']
+
+    expected = pd.concat(frames, ignore_index=True)[COLUMNS]
+    df = read_handoff(path, 'diesel')
+    for column in ['year_month', 'uf', 'product', 'unit', 'volume']:
+        assert df[column].astype(str).tolist() == expected[column].astype(str).tolist()
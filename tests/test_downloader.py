@@ -0,0 +1,245 @@
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from downloader import download_files, fetch_with_retry, file_sha256, MANIFEST
+
+# Content of the files served, each version has its own ETag
+CONTENT = {'dataset.csv': bytes(range(256)) * 4096}
+LAST_MODIFIED = 'Mon, 01 Aug 2022 00:00:00 GMT'
+
+
+class Server(ThreadingHTTPServer):
+    """
+    Local stand-in of gov.br: ETag/Last-Modified, 304 to the conditional
+    requests, Range/If-Range (206 and 416), downloads cut after half of the
+    file (truncate), redirects and keep-alive connections closed by the
+    server after the response (drop).
+    """
+
+    def __init__(self, handler=None):
+        super().__init__(('127.0.0.1', 0), handler or Handler)
+        self.content = dict(CONTENT)
+        self.version = 1
+        self.truncate = set()
+        self.drop = set()
+        self.redirects = {}
+        self.requests = []
+        self.clients = []
+
+    @property
+    def etag(self):
+        return f'"v{self.version}"'
+
+    def url(self, name):
+        return f'http://127.0.0.1:{self.server_address[1]}/{name}'
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.lstrip('/')
+        server.requests.append((name, dict(self.headers)))
+        server.clients.append(self.client_address)
+        if name in server.redirects:
+            self.send_response(302)
+            self.send_header('Location', '/' + server.redirects[name])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = server.content.get(name)
+        if data is None:
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+        start = 0
+        ranged = self.headers.get('Range') and self.headers.get('If-Range') in (server.etag, LAST_MODIFIED)
+        if ranged:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        self.send_response(206 if ranged else 200)
+        if ranged:
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        self.send_header('Content-Length', str(len(data) - start))
+        self.send_header('ETag', server.etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.end_headers()
+        body = data[start:]
+        if name in server.truncate:
+            # Connection lost in the middle of the download
+            server.truncate.discard(name)
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+        if name in server.drop:
+            # Idle connection closed by the server, without Connection: close
+            server.drop.discard(name)
+            self.close_connection = True
+
+
+class KeepAliveHandler(Handler):
+    protocol_version = 'HTTP/1.1'
+
+
+def serve(handler=None):
+    server = Server(handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def server():
+    server = serve()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def keep_alive():
+    server = serve(KeepAliveHandler)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_then_not_modified(server, tmp_path):
+    sources = {'dataset.csv': server.url('dataset.csv')}
+    first = download_files(sources, str(tmp_path))
+    assert first['dataset.csv']['status'] == 'downloaded'
+    assert (tmp_path / 'dataset.csv').read_bytes() == CONTENT['dataset.csv']
+    assert (tmp_path / MANIFEST).exists()
+
+    # The cleaned dataset is written elsewhere (raw folder), every later run is conditional
+    for _ in range(2):
+        entry = download_files(sources, str(tmp_path))['dataset.csv']
+        assert entry['status'] == 'not_modified'
+        assert server.requests[-1][1]['If-None-Match'] == server.etag
+        assert server.requests[-1][1]['If-Modified-Since'] == LAST_MODIFIED
+
+
+def test_new_version_downloaded(server, tmp_path):
+    sources = {'dataset.csv': server.url('dataset.csv')}
+    download_files(sources, str(tmp_path))
+    server.content['dataset.csv'] = b'revised'
+    server.version = 2
+    entry = download_files(sources, str(tmp_path))['dataset.csv']
+    assert entry['status'] == 'downloaded'
+    assert entry['etag'] == '"v2"'
+    assert (tmp_path / 'dataset.csv').read_bytes() == b'revised'
+
+
+def test_local_file_changed_is_not_conditional(server, tmp_path):
+    sources = {'dataset.csv': server.url('dataset.csv')}
+    download_files(sources, str(tmp_path))
+    (tmp_path / 'dataset.csv').write_bytes(b'overwritten')
+    entry = download_files(sources, str(tmp_path))['dataset.csv']
+    assert entry['status'] == 'downloaded'
+    assert 'If-None-Match' not in server.requests[-1][1]
+    assert file_sha256(str(tmp_path / 'dataset.csv')) == entry['sha256']
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    server.truncate.add('dataset.csv')
+    destination = str(tmp_path / 'dataset.csv')
+    entry = fetch_with_retry(server.url('dataset.csv'), destination, backoff=0)
+    assert entry['status'] == 'resumed'
+    assert (tmp_path / 'dataset.csv').read_bytes() == CONTENT['dataset.csv']
+    # The second request asked only for the bytes missing
+    offset = len(CONTENT['dataset.csv']) // 2
+    assert server.requests[-1][1]['Range'] == f'bytes={offset}-'
+    assert server.requests[-1][1]['If-Range'] == server.etag
+    assert not os.path.exists(destination + '.part')
+    assert not os.path.exists(destination + '.part.json')
+
+
+def test_range_not_satisfiable_restarts(server, tmp_path):
+    # Partial file longer than the file served: 416, the partial file is discarded and downloaded again
+    destination = str(tmp_path / 'dataset.csv')
+    with open(destination + '.part', 'wb') as fp:
+        fp.write(b'x' * (len(CONTENT['dataset.csv']) + 10))
+    with open(destination + '.part.json', 'w') as fp:
+        json.dump({'etag': server.etag, 'last_modified': None}, fp)
+    entry = fetch_with_retry(server.url('dataset.csv'), destination, backoff=0)
+    assert entry['status'] == 'downloaded'
+    assert (tmp_path / 'dataset.csv').read_bytes() == CONTENT['dataset.csv']
+    assert [headers.get('Range') is not None for _, headers in server.requests] == [True, False]
+
+
+def test_connections_are_reused(keep_alive, tmp_path):
+    # The sources of the same host share one connection, redirects included
+    for name in ('derivative.csv', 'diesel.csv'):
+        keep_alive.content[name] = CONTENT['dataset.csv'][:1000]
+    keep_alive.redirects['pivot.xls'] = 'dataset.csv'
+    sources = {name: keep_alive.url(name) for name in ('derivative.csv', 'diesel.csv', 'pivot.xls')}
+    results = download_files(sources, str(tmp_path), workers=1)
+    assert [entry['status'] for entry in results.values()] == ['downloaded'] * 3
+    assert (tmp_path / 'pivot.xls').read_bytes() == CONTENT['dataset.csv']
+    assert len(keep_alive.requests) == 4 and len(set(keep_alive.clients)) == 1
+
+    # A download cut in the middle is resumed on a new connection
+    keep_alive.truncate.add('dataset.csv')
+    destination = str(tmp_path / 'dataset.csv')
+    assert fetch_with_retry(keep_alive.url('dataset.csv'), destination, backoff=0)['status'] == 'resumed'
+    assert (tmp_path / 'dataset.csv').read_bytes() == CONTENT['dataset.csv']
+
+
+def test_closed_connection_is_opened_again(keep_alive, tmp_path):
+    # The server closes the connection after the first file, the next request is sent again on a new connection
+    keep_alive.content['diesel.csv'] = b'diesel'
+    keep_alive.drop.add('dataset.csv')
+    sources = {name: keep_alive.url(name) for name in ('dataset.csv', 'diesel.csv')}
+    results = download_files(sources, str(tmp_path), workers=1, retries=1)
+    assert [entry['status'] for entry in results.values()] == ['downloaded'] * 2
+    assert (tmp_path / 'diesel.csv').read_bytes() == b'diesel'
+    assert len(set(keep_alive.clients)) == 2
+
+
+def test_cleaning_keeps_the_download(server, tmp_path):
+    # The cleaning stage writes the cleaned dataset next to the raw folder, the raw file still matches the manifest
+    from functions import RAW_FOLDER, clean_dataset
+    from synthetic import generate_datasets
+
+    generate_datasets(str(tmp_path / 'source'))
+    server.content['dataset_diesel.csv'] = (tmp_path / 'source' / RAW_FOLDER / 'dataset_diesel.csv').read_bytes()
+    sources = {'dataset_diesel.csv': server.url('dataset_diesel.csv')}
+    path = str(tmp_path / 'dados') + '/'
+    download_files(sources, path + RAW_FOLDER)
+    clean_dataset('dataset_diesel', path)
+    assert os.path.exists(path + 'dataset_diesel.csv')
+    assert download_files(sources, path + RAW_FOLDER)['dataset_diesel.csv']['status'] == 'not_modified'
+
+
+def test_unchanged_download_is_not_cleaned_again(tmp_path, capsys):
+    # Same raw file as the last run: the incremental cleaning skips it, a revised file is cleaned again
+    from functions import RAW_FOLDER, clean_dataset
+    from synthetic import generate_datasets
+
+    generate_datasets(str(tmp_path))
+    path = str(tmp_path) + '/'
+    clean_dataset('dataset_diesel', path)
+    clean_dataset('dataset_diesel', path)
+    assert 'No new data - DATASET_DIESEL' in capsys.readouterr().out
+    raw = tmp_path / RAW_FOLDER / 'dataset_diesel.csv'
+    lines = raw.read_text(encoding='utf-8').splitlines(keepends=True)
+    raw.write_text(''.join(lines[:-1]), encoding='utf-8')
+    clean_dataset('dataset_diesel', path)
+    assert 'No new data' not in capsys.readouterr().out
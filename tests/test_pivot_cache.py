@@ -0,0 +1,126 @@
+import zipfile
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pivot_cache import read_pivot_cache, NS_MAIN, NS_REL, NS_PKG_REL
+
+# Wide layout (ANP): dimensions as shared items, one field per month, a record with a missing UF and a month without volume
+WIDE_FIELDS = [
+    ('COMBUSTÍVEL', ['GASOLINA C (m3)', 'ÓLEO DIESEL (m3)']),
+    ('ANO', [2021.0, 2022.0]),
+    ('ESTADO', ['SÃO PAULO', None, 'BAHIA']),
+    ('JAN', None),
+    ('FEV', None),
+    ('TOTAL', None),
+]
+WIDE_RECORDS = [
+    [('x', 0), ('x', 0), ('x', 0), ('n', 10.5), ('n', 11.0), ('n', 21.5)],
+    [('x', 1), ('x', 1), ('x', 2), ('m', None), ('n', 7.25), ('n', 7.25)],
+    [('x', 0), ('x', 1), ('x', 1), ('n', 3.0), ('n', 4.0), ('n', 7.0)],
+]
+
+# Long layout: month and volume fields, inline values and a unit field
+LONG_FIELDS = [
+    ('ANO', [2020.0]),
+    ('MÊS', ['Janeiro', 'Dezembro']),
+    ('UN. DA FEDERAÇÃO', None),
+    ('PRODUTO', ['ÓLEO DIESEL S-10']),
+    ('UNIDADE', ['m3']),
+    ('VENDAS', None),
+]
+LONG_RECORDS = [
+    [('x', 0), ('x', 1), ('s', 'RIO DE JANEIRO'), ('x', 0), ('x', 0), ('n', 5.5)],
+    [('x', 0), ('x', 0), ('s', 'ACRE'), ('x', 0), ('x', 0), ('n', 1.0)],
+    [('x', 0), ('x', 0), ('s', 'RIO DE JANEIRO'), ('x', 0), ('x', 0), ('m', None)],
+    [('x', 0), ('x', 1), ('s', 'ACRE'), ('x', 0), ('x', 0), ('n', 2.0)],
+]
+
+
+def _item(value):
+    if value is None:
+        return '<m/>'
+    if isinstance(value, float):
+        return f'<n v="{value!r}"/>'
+    return f'<s v={quoteattr(value)}/>'
+
+
+def _value(tag, value):
+    return f'<{tag}/>' if value is None else f'<{tag} v={quoteattr(str(value))}/>'
+
+
+def write_cache(zf, number, fields, records, records_part):
+    # Definition, relationship and records parts of a pivot cache, the records part is found through the relationship
+    cache_fields = ''.join(
+        f'<cacheField name={quoteattr(name)}><sharedItems>{"".join(_item(item) for item in items)}</sharedItems></cacheField>'
+        if items is not None else f'<cacheField name={quoteattr(name)}><sharedItems/></cacheField>'
+        for name, items in fields
+    )
+    zf.writestr(
+        f'xl/pivotCache/pivotCacheDefinition{number}.xml',
+        f'<pivotCacheDefinition xmlns="{NS_MAIN[1:-1]}" xmlns:r="{NS_REL[1:-1]}" r:id="rId1">'
+        f'<cacheFields count="{len(fields)}">{cache_fields}</cacheFields></pivotCacheDefinition>',
+    )
+    zf.writestr(
+        f'xl/pivotCache/_rels/pivotCacheDefinition{number}.xml.rels',
+        f'<Relationships xmlns="{NS_PKG_REL[1:-1]}">'
+        f'<Relationship Id="rId1" Type="{NS_REL[1:-1]}/pivotCacheRecords" Target="{records_part}"/></Relationships>',
+    )
+    rows = ''.join('<r>' + ''.join(_value(tag, value) for tag, value in record) + '</r>' for record in records)
+    zf.writestr(f'xl/pivotCache/{records_part}', f'<pivotCacheRecords xmlns="{NS_MAIN[1:-1]}" count="{len(records)}">{rows}</pivotCacheRecords>')
+
+
+@pytest.fixture
+def pivot_file(tmp_path):
+    file_name = str(tmp_path / 'pivot.xlsx')
+    with zipfile.ZipFile(file_name, 'w') as zf:
+        write_cache(zf, 1, WIDE_FIELDS, WIDE_RECORDS, 'pivotCacheRecords1.xml')
+        write_cache(zf, 2, LONG_FIELDS, LONG_RECORDS, 'records_long.xml')
+    return file_name
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['year_month', 'uf', 'product', 'unit', 'volume'])
+
+
+def assert_records(df, expected):
+    assert list(df.columns) == ['year_month', 'uf', 'product', 'unit', 'volume']
+    assert all(isinstance(df[column].dtype, pd.CategoricalDtype) for column in ['uf', 'product', 'unit'])
+    actual = df.astype({'uf': object, 'product': object, 'unit': object})
+    actual['uf'] = actual['uf'].where(actual['uf'].notna(), None)
+    expected = expected.assign(year_month=pd.to_datetime(expected['year_month']))
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_wide_layout(pivot_file):
+    # One row per month field with volume, the unit comes from the product name and the missing UF is kept last
+    assert_records(read_pivot_cache(pivot_file), frame([
+        ('2021-01-01', 'SÃO PAULO', 'GASOLINA C', 'm3', 10.5),
+        ('2021-02-01', 'SÃO PAULO', 'GASOLINA C', 'm3', 11.0),
+        ('2022-01-01', None, 'GASOLINA C', 'm3', 3.0),
+        ('2022-02-01', 'BAHIA', 'ÓLEO DIESEL', 'm3', 7.25),
+        ('2022-02-01', None, 'GASOLINA C', 'm3', 4.0),
+    ]))
+
+
+def test_long_layout(pivot_file):
+    # Month names and inline UFs, the record without volume is dropped
+    assert_records(read_pivot_cache(pivot_file, cache_number=2), frame([
+        ('2020-01-01', 'ACRE', 'ÓLEO DIESEL S-10', 'm3', 1.0),
+        ('2020-12-01', 'ACRE', 'ÓLEO DIESEL S-10', 'm3', 2.0),
+        ('2020-12-01', 'RIO DE JANEIRO', 'ÓLEO DIESEL S-10', 'm3', 5.5),
+    ]))
+
+
+def test_missing_cache(pivot_file):
+    with pytest.raises(ValueError):
+        read_pivot_cache(pivot_file, cache_number=3)
+
+
+def test_inline_values_share_one_item(pivot_file):
+    # The repeated inline UFs are coded once
+    df = read_pivot_cache(pivot_file, cache_number=2)
+    assert list(df['uf'].cat.categories) == ['ACRE', 'RIO DE JANEIRO']
+    assert np.array_equal(df['uf'].cat.codes.to_numpy(), [0, 0, 1])
@@ -0,0 +1,97 @@
+import struct
+
+import pytest
+
+from pivot_cache_xls import (
+    read_pivot_cache_xls, iter_pivot_cache_records, list_pivot_cache_streams, OLE_SIGNATURE, END_OF_CHAIN,
+    FREE_SECTOR, NO_STREAM, RECORD_EOF, RECORD_SXDB, RECORD_SXFDB, RECORD_SXDBB, RECORD_SXNUM, RECORD_SXSTRING,
+)
+
+# Fields of the cache: items shared by the records (None for the inline fields)
+UFS = [f'UF {number:03d}' for number in range(300)]
+FIELDS = [
+    ('ANO', [2021.0, 2022.0]),
+    ('MÊS', ['JAN', 'FEV', 'MAR']),
+    ('UN. DA FEDERAÇÃO', UFS),
+    ('PRODUTO', ['ÓLEO DIESEL', 'GASOLINA C']),
+    ('UNIDADE', ['m3']),
+    ('VOLUME', None),
+]
+
+
+def _record(rtype, data):
+    return struct.pack('<HH', rtype, len(data)) + data
+
+
+def _string(value):
+    return struct.pack('<HB', len(value), 1) + value.encode('utf-16-le')
+
+
+def _item(value):
+    if isinstance(value, float):
+        return _record(RECORD_SXNUM, struct.pack('<d', value))
+    return _record(RECORD_SXSTRING, _string(value))
+
+
+def cache_stream(records):
+    # BIFF8 pivot cache stream: SXDB, one SXFDB and its items per field, one SXDBB and the inline items per record
+    stream = _record(RECORD_SXDB, bytes(20))
+    for name, items in FIELDS:
+        # Indexed fields (0x0001), 16-bit indexes when the field has more than 255 items (0x0200)
+        flags = (0x0001 | (0x0200 if len(items) > 255 else 0)) if items else 0
+        stream += _record(RECORD_SXFDB, struct.pack('<H10xHH', flags, len(items or ()), len(name)) + b'\x01' + name.encode('utf-16-le'))
+        stream += b''.join(_item(item) for item in items or ())
+    for record in records:
+        indexes = [(items.index(value), 'H' if len(items) > 255 else 'B') for (_, items), value in zip(FIELDS, record) if items]
+        stream += _record(RECORD_SXDBB, struct.pack('<' + ''.join(size for _, size in indexes), *[index for index, _ in indexes]))
+        stream += b''.join(_item(value) for (_, items), value in zip(FIELDS, record) if not items)
+    stream += _record(RECORD_EOF, b'')
+    # Above the mini stream cutoff, the stream is stored in regular sectors
+    return stream.ljust(4096, b'\x00')
+
+
+def _entry(name, kind, child=NO_STREAM, start=END_OF_CHAIN, size=0):
+    encoded = (name + '\x00').encode('utf-16-le')
+    return (encoded.ljust(64, b'\x00') + struct.pack('<HBB', len(encoded), kind, 1)
+            + struct.pack('<III', NO_STREAM, NO_STREAM, child) + bytes(36) + struct.pack('<III', start, size, 0))
+
+
+def write_xls(path, stream):
+    # Compound file with the storage _SX_DB_CUR and the stream 0001: stream sectors, directory, FAT
+    sectors = -(-len(stream) // 512)
+    fat = list(range(1, sectors)) + [END_OF_CHAIN, END_OF_CHAIN, 0xFFFFFFFD]
+    fat += [FREE_SECTOR] * (128 - len(fat))
+    header = OLE_SIGNATURE + bytes(16) + struct.pack('<HHHHH10xII4xII', 0x3E, 3, 0xFFFE, 9, 6, 1, sectors, 4096, END_OF_CHAIN)
+    header += struct.pack('<III', 0, END_OF_CHAIN, 0) + struct.pack('<109I', sectors + 1, *[FREE_SECTOR] * 108)
+    directory = _entry('Root Entry', 5, child=1) + _entry('_SX_DB_CUR', 1, child=2) + _entry('0001', 2, start=0, size=len(stream))
+    with open(path, 'wb') as fp:
+        fp.write(header)
+        fp.write(stream.ljust(sectors * 512, b'\x00'))
+        fp.write(directory.ljust(512, b'\x00'))
+        fp.write(struct.pack('<128I', *fat))
+
+
+@pytest.fixture
+def records():
+    # The UF indexes go past 255, only 16-bit indexes can store them
+    return [
+        (2021.0 + index % 2, ['JAN', 'FEV', 'MAR'][index % 3], UFS[index * 7 % 300], ['ÓLEO DIESEL', 'GASOLINA C'][index % 2], 'm3', float(index))
+        for index in range(120)
+    ]
+
+
+def test_records_round_trip(tmp_path, records):
+    path = str(tmp_path / 'pivot.xls')
+    write_xls(path, cache_stream(records))
+    assert list_pivot_cache_streams(path) == ['_SX_DB_CUR/0001']
+    names = [name for name, _ in FIELDS]
+    assert list(iter_pivot_cache_records(path)) == [dict(zip(names, record)) for record in records]
+
+
+def test_pivot_frame(tmp_path, records):
+    path = str(tmp_path / 'pivot.xls')
+    write_xls(path, cache_stream(records))
+    df = read_pivot_cache_xls(path)
+    assert len(df) == len(records)
+    assert df['volume'].sum() == sum(record[5] for record in records)
+    assert set(df['uf']) == {record[2] for record in records}
@@ -0,0 +1,109 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modules of pywin32 imported by name by pywin32/functions.py, some share names with the ones of dags
+MODULES = ['functions', 'schema', 'pivot_source', 'checkpoint']
+
+FILTERS = ['UN. DA FEDERAÇÃO', 'PRODUTO']
+
+COLUMNS_DF = ['uf', 'produto', 'mes', '2019', '2020']
+
+
+@pytest.fixture(scope='module')
+def pywin32():
+    saved = {name: sys.modules.pop(name) for name in MODULES if name in sys.modules}
+    sys.path.insert(0, os.path.join(ROOT, 'pywin32'))
+    try:
+        import functions
+        import pivot_source
+        import checkpoint
+        yield functions, pivot_source, checkpoint
+    finally:
+        sys.path.pop(0)
+        for name in MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+
+def records():
+    rows = []
+    for uf_number, uf in enumerate(['BAHIA', 'MINAS GERAIS', 'SÃO PAULO']):
+        for product_number, product in enumerate(['GASOLINA C', 'ÓLEO DIESEL']):
+            for year_month in pd.date_range('2019-01-01', '2020-12-01', freq='MS'):
+                if uf == 'BAHIA' and year_month.month == 3:
+                    # Empty cells of the table
+                    continue
+                volume = 1000 * uf_number + 100 * product_number + year_month.month + year_month.year / 10000
+                rows.append((year_month, uf, product, 'm3', volume))
+    return pd.DataFrame(rows, columns=['year_month', 'uf', 'product', 'unit', 'volume'])
+
+
+def flaky_source(pivot_source, df, fail_after=None):
+    class FlakyPivotSource(pivot_source.FakePivotSource):
+        # Records the UFs traversed and fails once after a number of tables, like Excel
+        def __init__(self):
+            super().__init__(df, years=[int(year) for year in COLUMNS_DF[3:]], fields=FILTERS)
+            self.fail_after = fail_after
+            self.traversed = []
+
+        def set_page(self, field, caption):
+            if field == FILTERS[0]:
+                self.traversed.append(caption)
+            super().set_page(field, caption)
+
+        def table(self):
+            if self.fail_after is not None and self.calls >= self.fail_after:
+                self.fail_after = None
+                raise OSError('The remote procedure call failed')
+            return super().table()
+
+    return FlakyPivotSource()
+
+
+def test_resumed_traversal_equals_an_uninterrupted_one(pywin32, tmp_path):
+    functions, pivot_source, checkpoint = pywin32
+    df = records()
+    expected = functions.generator_dataframe(flaky_source(pivot_source, df), COLUMNS_DF, *FILTERS)
+
+    # Fails in the second product of the second UF, the first UF is stored
+    source = flaky_source(pivot_source, df, fail_after=3)
+    with pytest.raises(OSError):
+        functions.generator_dataframe(source, COLUMNS_DF, *FILTERS, checkpoint.CheckpointStore(str(tmp_path), 'pvt1'))
+    assert source.traversed == ['BAHIA', 'MINAS GERAIS']
+
+    store = checkpoint.CheckpointStore(str(tmp_path), 'pvt1')
+    source.traversed = []
+    result = functions.generator_dataframe(source, COLUMNS_DF, *FILTERS, store)
+    # The UF already stored is read from the checkpoint, not from the pivot table
+    assert source.traversed == ['MINAS GERAIS', 'SÃO PAULO']
+    pd.testing.assert_frame_equal(result, expected)
+
+    # A run after the complete traversal reads only the checkpoints
+    source.traversed = []
+    pd.testing.assert_frame_equal(functions.generator_dataframe(source, COLUMNS_DF, *FILTERS, store), expected)
+    assert source.traversed == []
+
+
+def test_other_traversal_clears_the_store(pywin32, tmp_path):
+    functions, pivot_source, checkpoint = pywin32
+    source = flaky_source(pivot_source, records())
+    store = checkpoint.CheckpointStore(str(tmp_path), 'pvt1')
+    functions.generator_dataframe(source, COLUMNS_DF, *FILTERS, store)
+    ufs = source.items(FILTERS[0])
+    signature = [COLUMNS_DF, *FILTERS]
+    assert store.start(signature, ufs) == 3
+
+    # Other columns (signature)
+    assert store.start([COLUMNS_DF[:-1], *FILTERS], ufs) == 0
+    assert store.load('BAHIA') is None
+
+    functions.generator_dataframe(source, COLUMNS_DF, *FILTERS, store)
+    assert store.start(signature, ufs) == 3
+    # Other UFs, a UF added to the filter
+    assert store.start(signature, ufs + ['TOCANTINS']) == 0
+    assert [name for name in os.listdir(tmp_path / 'pvt1') if name.endswith('.npz')] == []
@@ -0,0 +1,26 @@
+import os
+import multiprocessing
+
+from pivot_locator import _save_anchors, _load_anchors, ANCHORS_FILE, ANCHORS_KEPT
+
+TABLES = [{'title': 'derivados', 'header_row': 2, 'last_row': 14, 'first_column': 1, 'last_column': 14, 'frame': None}]
+
+
+def _save_many(cache_file, worker):
+    for number in range(20):
+        _save_anchors(cache_file, f'{worker}-{number}', 'Plan1', TABLES)
+
+
+def test_concurrent_saves_keep_the_anchors_file(tmp_path):
+    # Mapped tasks save the anchors at the same time, no update is lost or half written
+    cache_file = str(tmp_path / ANCHORS_FILE)
+    processes = [multiprocessing.Process(target=_save_many, args=(cache_file, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    anchors = _load_anchors(cache_file)
+    assert len(anchors) == ANCHORS_KEPT
+    assert all(anchor['tables'][0]['title'] == 'derivados' and 'frame' not in anchor['tables'][0] for anchor in anchors.values())
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
@@ -0,0 +1,35 @@
+import os
+import importlib.util
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def load_pywin32(name):
+    # The modules of pywin32 share names with the ones of dags (functions, schema)
+    spec = importlib.util.spec_from_file_location(f'pywin32_{name}', os.path.join(ROOT, 'pywin32', f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_pivot_source_is_abstract():
+    pivot_source = load_pywin32('pivot_source')
+    with pytest.raises(TypeError):
+        pivot_source.PivotSource()
+
+    class Partial(pivot_source.PivotSource):
+        def items(self, field):
+            return []
+
+    # A source without clear, set_page and table fails when created, not in the middle of the traversal
+    with pytest.raises(TypeError):
+        Partial()
+
+    df = pd.DataFrame({
+        'year_month': ['2021-01-01'], 'uf': ['SP'], 'product': ['ÓLEO DIESEL'], 'unit': ['m3'], 'volume': [1.0],
+    })
+    source = pivot_source.FakePivotSource(df)
+    assert source.items('UN. DA FEDERAÇÃO') == ['SP']
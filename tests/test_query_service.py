@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from columnar import write_columnar, write_handoff
+from cube import write_cube, cube_files
+from query_service import QueryService, StaleCube
+from test_columnar import frame
+
+
+def build(path, volume):
+    # Arrow file and cube of the diesel dataset, every volume times a factor
+    df = frame(2021, ['RJ', 'SP'], ['ÓLEO DIESEL'])
+    df['volume'] = volume
+    write_columnar(path, 'diesel', df)
+    write_handoff(path, 'diesel')
+    write_cube(path, 'diesel')
+
+
+def test_results_follow_the_cube_version(tmp_path):
+    path = str(tmp_path) + '/'
+    build(path, 1.0)
+    service = QueryService(path)
+    assert service.query('diesel')[0]['volume'] == 4.0
+    versions = (service.cube('diesel')[0],)
+
+    # The pipeline rebuilds the cube, the next query reads it
+    build(path, 2.0)
+    metadata = cube_files(path, 'diesel')[1]
+    os.utime(metadata, ns=(versions[0] + 1, versions[0] + 1))
+    assert service.query('diesel')[0]['volume'] == 8.0
+
+    # A new query keyed by the previous version is never answered (nor cached) with the new cube
+    size = service.cache_info()['size']
+    with pytest.raises(StaleCube):
+        service._cached(('diesel',), None, ('SP',), None, None, (), versions)
+    assert service.cache_info()['size'] == size
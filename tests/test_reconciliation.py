@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from reconciliation import reconcile, prepare
+
+
+def frames():
+    # Dataset typed by the schema, pivot cache as read from csv (text dates)
+    dataset = pd.DataFrame({
+        'year_month': pd.to_datetime(['2021-01-01', '2021-01-01', '2021-02-01', '2022-03-01']),
+        'uf': pd.Categorical(['SP', 'RJ', 'SP', 'MG']),
+        'product': pd.Categorical(['ÓLEO DIESEL', 'ÓLEO DIESEL', 'GASOLINA C', 'GASOLINA C']),
+        'volume': [10.0, 20.0, 30.0, 40.0],
+    })
+    pivot = pd.DataFrame({
+        'year_month': ['2021-01-01', '2021-01-01', '2021-02-01', '2022-04-01'],
+        'uf': pd.Categorical(['RJ', 'SP', 'SP', 'BA']),
+        'product': pd.Categorical(['ÓLEO DIESEL', 'ÓLEO DIESEL', 'GASOLINA C', 'GASOLINA C']),
+        'volume': [20.0, 10.0, 31.0, np.nan],
+    })
+    return dataset, pivot
+
+
+def test_prepare_splits_the_dates():
+    dataset, pivot = frames()
+    for df in (dataset, pivot):
+        prepared = prepare(df)
+        assert prepared['year'].dtype == np.int64 and prepared['month'].dtype == np.int64
+    assert prepare(dataset)[['year', 'month']].values.tolist() == [[2021, 1], [2021, 1], [2021, 2], [2022, 3]]
+    # Rows without volume are dropped
+    assert len(prepare(pivot)) == 3
+
+
+def test_categoricals_match_the_labels():
+    # The categories of each side differ, the report is the one of the labels as strings
+    dataset, pivot = frames()
+    typed = reconcile(dataset, pivot)
+    labels = reconcile(*[df.astype({'uf': object, 'product': object}) for df in (dataset, pivot)])
+    pd.testing.assert_frame_equal(typed, labels)
+    cells = typed[typed['level'] == 'year_uf_product'].set_index(['year', 'uf', 'product'])['status']
+    assert cells[(2021, 'SP', 'GASOLINA C')] == 'different'
+    assert cells[(2021, 'RJ', 'ÓLEO DIESEL')] == 'equal'
+    assert cells[(2022, 'MG', 'GASOLINA C')] == 'missing_pivot'
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import sort, conform
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def test_pywin32_schema_is_a_copy():
+    # The extraction of pywin32 runs apart from the DAG with its own copy of the schema
+    with open(os.path.join(ROOT, 'dags', 'schema.py'), 'rb') as fp:
+        dags = fp.read()
+    with open(os.path.join(ROOT, 'pywin32', 'schema.py'), 'rb') as fp:
+        pywin32 = fp.read()
+    assert pywin32 == dags, 'pywin32/schema.py differs from dags/schema.py, copy it again'
+
+
+def test_sort_missing_values_last():
+    df = conform(pd.DataFrame({
+        'year_month': pd.to_datetime(['2021-02-01', None, '2021-01-01', '2021-01-01']),
+        'uf': ['SP', 'SP', None, 'RJ'],
+        'product': ['GASOLINA C'] * 4,
+        'unit': ['m3'] * 4,
+        'volume': [1.0, 2.0, 3.0, 4.0],
+    }))
+    assert sort(df)['volume'].tolist() == [4.0, 3.0, 1.0, 2.0]
+    # Stable, as sort_values(kind='mergesort')
+    assert sort(df, ['product'])['volume'].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert np.isnat(sort(df)['year_month'].to_numpy()[-1])
@@ -0,0 +1,85 @@
+import os
+
+import stage_cache
+from stage_cache import cached_stage, stage_key, restore, store, evict, MANIFEST
+
+
+def _stage(tmp_path, calls):
+    # Stage that writes the input doubled, cached by the content of the input
+    path = str(tmp_path) + '/'
+
+    def files(scale):
+        return path, [path + 'input.txt'], [path + 'output.txt'], {'scale': scale}
+
+    @cached_stage('double', files)
+    def double(scale):
+        calls.append(scale)
+        with open(path + 'input.txt') as fp:
+            value = int(fp.read())
+        with open(path + 'output.txt', 'w') as fp:
+            fp.write(str(value * 2 * scale))
+
+    return double
+
+
+def _output(tmp_path):
+    with open(tmp_path / 'output.txt') as fp:
+        return fp.read()
+
+
+def test_cache_is_kept_in_the_folder_of_the_stage(tmp_path, monkeypatch):
+    monkeypatch.setattr(stage_cache, 'CACHE_ENABLED', True)
+    monkeypatch.setattr(stage_cache, 'CACHE_FOLDER', None)
+    calls = []
+    double = _stage(tmp_path, calls)
+    (tmp_path / 'input.txt').write_text('21')
+    double(1)
+    assert calls == [1] and _output(tmp_path) == '42'
+    assert sorted(os.listdir(tmp_path / 'stage_cache')) == ['digests.json', 'double']
+
+    # Same input: the output is restored, the stage does not run
+    os.remove(tmp_path / 'output.txt')
+    double(1)
+    assert calls == [1] and _output(tmp_path) == '42'
+
+    # A new content of the input or a new parameter is a new key
+    (tmp_path / 'input.txt').write_text('5')
+    double(1)
+    double(3)
+    assert calls == [1, 1, 3] and _output(tmp_path) == '30'
+
+    # The previous content is still cached
+    (tmp_path / 'input.txt').write_text('21')
+    double(1)
+    assert calls == [1, 1, 3] and _output(tmp_path) == '42'
+
+
+def test_key_changes_with_the_inputs(tmp_path):
+    folder = str(tmp_path / 'cache')
+    input_file = tmp_path / 'input.txt'
+    input_file.write_text('a')
+    key = stage_key('stage', [str(input_file)], folder, {'start_period': 2000})
+    assert stage_key('stage', [str(input_file)], folder, {'start_period': 2000}) == key
+    assert stage_key('stage', [str(input_file)], folder, {'start_period': 2013}) != key
+    assert stage_key('other', [str(input_file)], folder, {'start_period': 2000}) != key
+    input_file.write_text('b')
+    assert stage_key('stage', [str(input_file)], folder, {'start_period': 2000}) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    path = str(tmp_path) + '/'
+    folder = path + 'cache'
+    with open(path + 'output.bin', 'wb') as fp:
+        fp.write(b'0' * 1000)
+    for number, key in enumerate(['a', 'b', 'c']):
+        store('stage', key, path, [path + 'output.bin'], folder)
+        os.utime(os.path.join(folder, 'stage', key, MANIFEST), (number, number))
+    # The oldest entry is used again, the next one is the least recently used
+    assert restore('stage', 'a', path, folder)
+    removed = evict(2500, folder)
+    assert removed == [os.path.join(folder, 'stage', 'b')]
+    assert not restore('stage', 'b', path, folder)
+    assert restore('stage', 'a', path, folder) and restore('stage', 'c', path, folder)
+    # The entry just stored is kept even above the size
+    assert evict(0, folder, keep=os.path.join(folder, 'stage', 'c')) == [os.path.join(folder, 'stage', 'a')]
+    assert sorted(os.listdir(os.path.join(folder, 'stage'))) == ['c']
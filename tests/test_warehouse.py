@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('psycopg2')
+pgserver = pytest.importorskip('pgserver')
+
+from schema import conform, processing_time, sort
+from warehouse import load_dataset, connection_pool, transaction, WAREHOUSE_SCHEMA, TABLE
+
+
+@pytest.fixture(scope='module')
+def dsn(tmp_path_factory):
+    # Embedded Postgres, deleted at the end of the module
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='delete')
+    yield server.get_uri()
+
+
+def dataset(years):
+    # Two UFs and two products in every month of the years
+    months = pd.date_range(f'{years[0]}-01-01', f'{years[-1]}-12-01', freq='MS')
+    index = pd.MultiIndex.from_product([months, ['RJ', 'SP'], ['GASOLINA C', 'ÓLEO DIESEL']], names=['year_month', 'uf', 'product'])
+    df = index.to_frame(index=False)
+    df['unit'] = 'm3'
+    df['volume'] = np.arange(len(df), dtype=np.float64) * 1.5
+    return sort(conform(df, processing_time()))
+
+
+def table(dsn, name):
+    with transaction(connection_pool(dsn)) as cursor:
+        cursor.execute(
+            f'SELECT year_month, uf, product, unit, volume FROM {WAREHOUSE_SCHEMA}.{TABLE} WHERE dataset = %s '
+            'ORDER BY year_month, uf, product', [name],
+        )
+        rows = cursor.fetchall()
+    return [(pd.Timestamp(year_month), uf, product, unit, volume) for year_month, uf, product, unit, volume in rows]
+
+
+def rows(df):
+    df = df.sort_values(['year_month', 'uf', 'product'])
+    return list(zip(df['year_month'], df['uf'].astype(str), df['product'].astype(str), df['unit'].astype(str), df['volume']))
+
+
+def test_table_follows_the_dataset(dsn):
+    df = dataset([2020, 2021])
+    loaded = load_dataset('diesel', df, dsn, 2)
+    assert loaded['years_swapped'] == [2020, 2021]
+    assert table(dsn, 'diesel') == rows(df)
+
+    # Most months of 2021 revised: the partition is swapped
+    df.loc[df['year_month'] >= '2021-03-01', 'volume'] += 1
+    loaded = load_dataset('diesel', df, dsn, 2)
+    assert (loaded['years_swapped'], loaded['months_upserted']) == ([2021], [])
+    assert table(dsn, 'diesel') == rows(df)
+
+    # A single month revised: the month is upserted
+    df.loc[df['year_month'] == '2020-05-01', 'volume'] *= 2
+    loaded = load_dataset('diesel', df, dsn, 2)
+    assert (loaded['years_swapped'], loaded['months_upserted']) == ([], ['2020-05'])
+    assert table(dsn, 'diesel') == rows(df)
+
+    # A row that no longer exists is deleted by the upsert
+    df = df[~((df['year_month'] == '2020-07-01') & (df['uf'] == 'SP') & (df['product'] == 'GASOLINA C'))]
+    loaded = load_dataset('diesel', df, dsn, 2)
+    assert loaded['months_upserted'] == ['2020-07']
+    assert table(dsn, 'diesel') == rows(df)
+
+    # A year that no longer exists is dropped
+    df = df[df['year_month'] < '2021-01-01']
+    loaded = load_dataset('diesel', df, dsn, 2)
+    assert (loaded['years_swapped'], loaded['months_upserted'], loaded['years_dropped']) == ([], [], [2021])
+    assert table(dsn, 'diesel') == rows(df)
+
+    # Nothing revised, nothing written
+    assert load_dataset('diesel', df, dsn, 2)['rows_loaded'] == 0
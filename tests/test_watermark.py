@@ -0,0 +1,91 @@
+import os
+import re
+import random
+import shutil
+
+import pandas as pd
+import pytest
+
+from functions import clean_dataframe, clean_dataframe_incremental, raw_file, MONTH_NAME
+from watermark import load_watermark, partition_folder, partition_hashes, plan_partitions
+from synthetic import generate_dataset, PRODUCTS_DIESEL, HEADER
+
+FILE_NAME = 'dataset_diesel'
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'dados') + '/'
+    generate_dataset(raw_file(path, FILE_NAME), PRODUCTS_DIESEL[:2], 2019, 2021)
+    return path
+
+
+def edit_raw(path, edit):
+    # Rewrite the rows of the download (without the header)
+    with open(raw_file(path, FILE_NAME), encoding='utf-8') as fp:
+        rows = fp.readlines()[1:]
+    with open(raw_file(path, FILE_NAME), 'w', encoding='utf-8') as fp:
+        fp.write(HEADER)
+        fp.writelines(edit(rows))
+
+
+def run(path, start_period, capsys):
+    # Incremental clean, returns the numbers of partitions changed and removed
+    capsys.readouterr()
+    clean_dataframe_incremental(FILE_NAME, start_period, path)
+    counts = re.search(r'(\d+) partitions changed, (\d+) removed', capsys.readouterr().out)
+    return (int(counts.group(1)), int(counts.group(2))) if counts else None
+
+
+def assert_full_clean(path, start_period, tmp_path):
+    # The csv assembled from the partitions equals the one of a clean of the whole dataset
+    full = str(tmp_path / f'full_{start_period}') + '/'
+    os.makedirs(os.path.dirname(raw_file(full, FILE_NAME)), exist_ok=True)
+    shutil.copyfile(raw_file(path, FILE_NAME), raw_file(full, FILE_NAME))
+    clean_dataframe(FILE_NAME, start_period, full)
+    incremental = pd.read_csv(path + FILE_NAME + '.csv', delimiter=';').drop(columns=['created_at'])
+    expected = pd.read_csv(full + FILE_NAME + '.csv', delimiter=';').drop(columns=['created_at'])
+    pd.testing.assert_frame_equal(incremental, expected)
+
+
+def test_incremental_clean(path, tmp_path, capsys):
+    assert run(path, 2013, capsys) == (36, 0)
+    assert_full_clean(path, 2013, tmp_path)
+
+    # Same download: skipped before reading it
+    assert run(path, 2013, capsys) is None
+
+    # Same rows in another order: a new download with the same partitions
+    edit_raw(path, lambda rows: random.Random(1).sample(rows, len(rows)))
+    assert run(path, 2013, capsys) == (0, 0)
+
+    # A revised month
+    revised = f'2020;{MONTH_NAME[2]};'
+    edit_raw(path, lambda rows: [row[:row.rindex(';')] + ';1,5\n' if row.startswith(revised) else row for row in rows])
+    assert run(path, 2013, capsys) == (1, 0)
+    assert_full_clean(path, 2013, tmp_path)
+
+    # A month removed from the source
+    removed = f'2021;{MONTH_NAME[5]};'
+    edit_raw(path, lambda rows: [row for row in rows if not row.startswith(removed)])
+    assert run(path, 2013, capsys) == (0, 1)
+    assert '2021-06.csv' not in os.listdir(partition_folder(path, FILE_NAME))
+    assert_full_clean(path, 2013, tmp_path)
+
+    # Another start_period: every partition is processed again and the previous years are removed
+    assert run(path, 2020, capsys) == (23, 12)
+    assert load_watermark(path, FILE_NAME)['start_period'] == 2020
+    assert_full_clean(path, 2020, tmp_path)
+
+
+def test_plan_partitions():
+    df = pd.DataFrame({'uf': ['SP', 'RJ', 'SP'], 'volume': [1.0, 2.0, 3.0]})
+    hashes = partition_hashes(df, ['2020-01', '2020-01', '2020-02'])
+    # The hash does not depend on the order of the rows
+    assert partition_hashes(df.iloc[::-1], ['2020-02', '2020-01', '2020-01']) == hashes
+    watermark = {'partitions': hashes, 'start_period': 2013}
+    assert plan_partitions(watermark, hashes, 2013) == ([], [])
+    revised = partition_hashes(df.assign(volume=[1.0, 2.5, 3.0]), ['2020-01', '2020-01', '2020-02'])
+    assert plan_partitions(watermark, revised, 2013) == (['2020-01'], [])
+    assert plan_partitions(watermark, {'2020-01': hashes['2020-01']}, 2013) == ([], ['2020-02'])
+    assert plan_partitions(watermark, hashes, 2020) == (['2020-01', '2020-02'], [])